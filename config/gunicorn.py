@@ -1,7 +1,15 @@
 import multiprocessing
+import os
 
 workers = min(
     int(multiprocessing.cpu_count() * 1.2), 20
 )  # k8s request should expect ~110mb per process
 timeout = 180
 graceful_timeout = 500
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
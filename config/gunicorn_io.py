@@ -0,0 +1,20 @@
+"""
+Gunicorn settings for the pods serving the I/O-bound profile endpoints (derive,
+enrich and expand), which spend nearly all of a request waiting on upstream
+services. Each gevent worker serves up to `worker_connections` of them at once,
+where a sync worker serves one.
+"""
+import multiprocessing
+import os
+
+from config.gunicorn import child_exit, graceful_timeout, timeout  # noqa F401
+
+worker_class = "gevent"
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 100))
+
+
+def post_fork(server, worker):
+    from whoweb.core.green import make_psycopg_green
+
+    make_psycopg_green()
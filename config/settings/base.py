@@ -51,6 +51,13 @@ DATABASES["default"]["OPTIONS"] = {"connect_timeout": 3}
 # https://docs.djangoproject.com/en/dev/ref/settings/#disable-server-side-cursors
 DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = True  # using pgbouncer
 
+# Share a bounded pool of connections between the threads (or greenlets) of a
+# process, keeping each process at most DATABASE_POOL_SIZE connections to pgbouncer.
+if env.bool("DATABASE_POOL", default=False):
+    DATABASES["default"]["ENGINE"] = "whoweb.contrib.postgres.pooled"
+    DATABASES["default"]["POOL_SIZE"] = env.int("DATABASE_POOL_SIZE", default=10)
+    DATABASES["default"]["POOL_TIMEOUT"] = env.int("DATABASE_POOL_TIMEOUT", default=30)
+
 
 # URLS
 # ------------------------------------------------------------------------------
@@ -313,6 +320,20 @@ CELERY_TASK_TIME_LIMIT = 60 * 60
 CELERY_TASK_SOFT_TIME_LIMIT = None
 # http://docs.celeryproject.org/en/latest/userguide/configuration.html#beat-scheduler
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
+CELERY_BEAT_SCHEDULE = {
+    "sweep-stale-export-pages": {
+        "task": "whoweb.search.tasks.sweep_stale_pages",
+        "schedule": timedelta(minutes=15),
+    },
+    "archive-finished-export-pages": {
+        "task": "whoweb.search.tasks.archive_finished_exports",
+        "schedule": timedelta(hours=6),
+    },
+    "manage-event-partitions": {
+        "task": "whoweb.core.tasks.manage_event_partitions",
+        "schedule": timedelta(days=1),
+    },
+}
 # https://docs.celeryproject.org/en/latest/userguide/routing.html#changing-the-name-of-the-default-queue
 CELERY_TASK_DEFAULT_QUEUE = "whoweb"
 # https://docs.celeryproject.org/en/latest/userguide/configuration.html#std:setting-task_routes
@@ -320,6 +341,11 @@ CELERY_TASK_ROUTES = {
     "whoweb.search.tasks.fetch_mx_domains": {"queue": "whoweb_low"},
     "whoweb.search.tasks.process_derivation_slow": {"queue": "whoweb_low"},
     "whoweb.search.tasks.process_derivation_fast": {"queue": "whoweb_low"},
+    "whoweb.search.tasks.derive_batch_chunk": {"queue": "whoweb_low"},
+    "whoweb.search.tasks.enrich_batch": {"queue": "whoweb_low"},
+    "whoweb.search.tasks.deliver_export_webhook": {"queue": "whoweb_low"},
+    "whoweb.search.tasks.release_scheduled_pages": {"queue": "whoweb_low"},
+    "whoweb.search.tasks.archive_export_pages": {"queue": "whoweb_low"},
 }
 # http://docs.celeryproject.org/en/latest/userguide/routing.html#routing-options-rabbitmq-priorities
 CELERY_TASK_QUEUE_MAX_PRIORITY = 4  # starts at 0
@@ -440,3 +466,101 @@ PUBLIC_ORIGIN = env("PUBLIC_ORIGIN", default="https://whoknows.com")
 DERIVE_SERVICE = env("DERIVE_URI", default=f"http://{namespace_prefix}derive")
 ANALYTICS_SERVICE = env("XPERDATA_URI", default=f"http://{namespace_prefix}xperdata:80")
 XPERWEB_URI = env("XPERWEB_URI", default=f"http://{namespace_prefix}xperweb")
+DATAVALIDATION_URL = env(
+    "DATAVALIDATION_URI", default="https://dv3.datavalidation.com/api/v2/user/me"
+)
+
+# Export webhooks
+WEBHOOK_BATCH_SIZE = env.int("WEBHOOK_BATCH_SIZE", default=100)
+WEBHOOK_MAX_CONCURRENCY_PER_ENDPOINT = env.int(
+    "WEBHOOK_MAX_CONCURRENCY_PER_ENDPOINT", default=4
+)
+WEBHOOK_MAX_ATTEMPTS = env.int("WEBHOOK_MAX_ATTEMPTS", default=8)
+WEBHOOK_TIMEOUT = 30
+WEBHOOK_RETRY_BACKOFF = 30
+WEBHOOK_RETRY_BACKOFF_MAX = 60 * 60
+
+# Derive service guard: concurrency across all processes adapts between LIMIT_MIN
+# and LIMIT_MAX, growing while calls answer within LATENCY_TARGET seconds and cut
+# by LIMIT_BACKOFF when they don't. The breaker opens for BREAKER_COOLDOWN seconds
+# once BREAKER_FAILURE_RATIO of at least BREAKER_MIN_CALLS calls in a
+# BREAKER_WINDOW failed.
+DERIVE_LIMIT_INITIAL = env.int("DERIVE_LIMIT_INITIAL", default=20)
+DERIVE_LIMIT_MIN = env.int("DERIVE_LIMIT_MIN", default=2)
+DERIVE_LIMIT_MAX = env.int("DERIVE_LIMIT_MAX", default=100)
+DERIVE_LIMIT_BACKOFF = 0.75
+DERIVE_LATENCY_TARGET = env.int("DERIVE_LATENCY_TARGET", default=20)
+DERIVE_SLOT_TIMEOUT = 150
+DERIVE_BREAKER_FAILURE_RATIO = 0.5
+DERIVE_BREAKER_MIN_CALLS = env.int("DERIVE_BREAKER_MIN_CALLS", default=20)
+DERIVE_BREAKER_WINDOW = 60
+DERIVE_BREAKER_COOLDOWN = env.int("DERIVE_BREAKER_COOLDOWN", default=30)
+
+# Request hedging: the idempotent routes listed in HEDGE_ROUTES (unified_search,
+# profile_lookup) send a duplicate request once a call has been out longer than
+# their HEDGE_PERCENTILE latency, for at most HEDGE_BUDGET of their calls.
+HEDGE_ROUTES = env.list("HEDGE_ROUTES", default=[])
+HEDGE_PERCENTILE = env.int("HEDGE_PERCENTILE", default=95)
+HEDGE_BUDGET = env.float("HEDGE_BUDGET", default=0.1)
+HEDGE_MIN_DELAY = 0.05
+HEDGE_INITIAL_DELAY = 5
+HEDGE_MAX_WORKERS = env.int("HEDGE_MAX_WORKERS", default=32)
+
+# Request coalescing: identical search requests in flight at once share one
+# upstream call, within a process and, where the call site asks for it, across
+# processes through the cache, which then keeps the result for
+# SINGLEFLIGHT_RESULT_TTL seconds.
+SINGLEFLIGHT_SHARED = env.bool("SINGLEFLIGHT_SHARED", default=True)
+SINGLEFLIGHT_RESULT_TTL = 5
+
+# Batch profile actions: entities accepted per request, entities (distinct people,
+# for enrichment) per chunk task, and the derive service timeout for each of them.
+BATCH_MAX_SIZE = env.int("BATCH_MAX_SIZE", default=1000)
+BATCH_CHUNK_SIZE = env.int("BATCH_CHUNK_SIZE", default=10)
+BATCH_DERIVE_TIMEOUT = 120
+
+# Batch enrichment: lookups in flight at once per batch, and seconds an
+# enrichment is served from the cache to batches not asking for a fresh one.
+BATCH_ENRICH_CONCURRENCY = env.int("BATCH_ENRICH_CONCURRENCY", default=16)
+ENRICHMENT_CACHE_TTL = env.int("ENRICHMENT_CACHE_TTL", default=60 * 60)
+
+# Export page scheduling
+EXPORT_FAIR_SHARE_SCHEDULING = env.bool("EXPORT_FAIR_SHARE_SCHEDULING", default=True)
+EXPORT_SCHEDULER_MAX_PAGES_IN_FLIGHT = env.int(
+    "EXPORT_SCHEDULER_MAX_PAGES_IN_FLIGHT", default=40
+)
+EXPORT_SCHEDULER_TICK = 15
+# Released pages stop counting against the in-flight limit after this long, so
+# pages lost by workers don't hold their slots until the stale page sweep.
+EXPORT_SCHEDULER_PAGE_TIMEOUT = env.int(
+    "EXPORT_SCHEDULER_PAGE_TIMEOUT", default=30 * 60
+)
+# Working pages whose derivation counter hasn't moved in this long get finalized.
+EXPORT_STALE_PAGE_TIMEOUT = env.int("EXPORT_STALE_PAGE_TIMEOUT", default=6 * 60 * 60)
+# Completed exports move their page rows to object storage after this long.
+EXPORT_PAGE_ARCHIVE_AFTER = env.int(
+    "EXPORT_PAGE_ARCHIVE_AFTER", default=14 * 24 * 60 * 60
+)
+# Seconds between refreshes of an export's page stats as its derivations count down.
+EXPORT_PAGE_STATS_INTERVAL = env.int("EXPORT_PAGE_STATS_INTERVAL", default=10)
+# Seconds between checks for the csv and json parts of an export being written.
+EXPORT_UPLOAD_PARTS_TICK = 5
+
+# Model event log
+EVENT_BUFFERING = env.bool("EVENT_BUFFERING", default=True)
+EVENT_BUFFER_SIZE = env.int("EVENT_BUFFER_SIZE", default=100)
+EVENT_BUFFER_MAX_AGE = 5
+EVENT_DATA_MAX_LENGTH = env.int("EVENT_DATA_MAX_LENGTH", default=4096)
+EVENT_LARGE_DATA_SAMPLE_RATE = 0.01
+EVENT_RETENTION_DAYS = env.int("EVENT_RETENTION_DAYS", default=180)
+EVENT_RETENTION_ARCHIVE = env.bool("EVENT_RETENTION_ARCHIVE", default=True)
+
+# Tracing: where finished spans go (empty disables tracing), and the fraction of
+# traces recorded. whoweb.core.tracing.ModelEventSink feeds the admin waterfall but
+# writes an event per task and router call, so enable it per environment.
+TRACING_SINK = env("TRACING_SINK", default="whoweb.core.tracing.LoggingSink")
+TRACING_SAMPLE_RATE = env.float("TRACING_SAMPLE_RATE", default=0.01)
+
+# Metrics: serve /metrics from the web app, and from celery workers on this port.
+METRICS_ENABLED = env.bool("METRICS_ENABLED", default=True)
+METRICS_WORKER_PORT = env.int("METRICS_WORKER_PORT", default=None)
@@ -95,6 +95,8 @@ GRAPHENE["MIDDLEWARE"] = [
 
 # Your stuff...
 # ------------------------------------------------------------------------------
+TRACING_SINK = env("TRACING_SINK", default="whoweb.core.tracing.ModelEventSink")
+TRACING_SAMPLE_RATE = env.float("TRACING_SAMPLE_RATE", default=1.0)
 
 DATAVALIDATION_KEY = env("DATAVALIDATION_KEY")
 COLD_EMAIL_KEY = env("COLD_EMAIL_KEY")
@@ -34,6 +34,10 @@ CELERY_BROKER_URL = env("CELERY_BROKER_URL", default="")
 CELERY_RESULT_BACKEND = env("CELERY_RESULT_BACKEND", default=CELERY_BROKER_URL)
 CELERY_REDIS_SOCKET_CONNECT_TIMEOUT = 1.0
 CELERY_REDIS_SOCKET_TIMEOUT = 3.0
+# Pages go straight to the broker unless a test opts in to the scheduler.
+EXPORT_FAIR_SHARE_SCHEDULING = False
+# Write model events as they are logged so they stay inside each test's transaction.
+EVENT_BUFFERING = False
 
 # PASSWORDS
 # ------------------------------------------------------------------------------
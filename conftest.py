@@ -10,6 +10,7 @@ pytest_plugins = [
     "whoweb.users.tests.fixtures",
     "whoweb.search.tests.fixtures",
     "whoweb.coldemail.tests.fixtures",
+    "whoweb.contrib.postgres.tests.fixtures",
 ]
 
 
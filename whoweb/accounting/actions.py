@@ -1,3 +1,4 @@
+from collections import defaultdict
 from dataclasses import dataclass
 from datetime import datetime
 
@@ -6,7 +7,6 @@ from django.db.models import F
 from django.db.transaction import atomic
 from django.utils.timezone import now
 
-from .models import Ledger
 from .models import LedgerBalance
 from .models import LedgerEntry
 from .models import Transaction
@@ -28,6 +28,51 @@ class Credit:
     amount: int
 
 
+def post_ledger_balances(evidence, amounts):
+    """
+    Add `amounts`, a dict from ledger id to amount, to the LedgerBalance of each
+    evidence model in those ledgers, creating the balances it doesn't have yet.
+
+    Each balance is changed in place by a single statement, so only transactions
+    sharing evidence wait on each other; balances are changed in a fixed order
+    so that those don't deadlock.
+    """
+    keys = sorted(
+        {
+            (
+                ledger_id,
+                ContentType.objects.get_for_model(related_object).pk,
+                related_object.pk,
+            )
+            for related_object in evidence
+            for ledger_id in amounts
+        }
+    )
+    for ledger_id, content_type_id, related_object_id in keys:
+        balance = LedgerBalance.objects.filter(
+            ledger_id=ledger_id,
+            related_object_content_type_id=content_type_id,
+            related_object_id=related_object_id,
+        )
+        if balance.update(balance=F("balance") + amounts[ledger_id]):
+            continue
+        # The first use of this evidence model in the ledger. A concurrent
+        # transaction may be creating the balance too, in which case this waits
+        # for it and adds to its row.
+        LedgerBalance.objects.bulk_create(
+            [
+                LedgerBalance(
+                    ledger_id=ledger_id,
+                    related_object_content_type_id=content_type_id,
+                    related_object_id=related_object_id,
+                    balance=0,
+                )
+            ],
+            ignore_conflicts=True,
+        )
+        balance.update(balance=F("balance") + amounts[ledger_id])
+
+
 @atomic
 def create_transaction(
     user, evidence=(), ledger_entries=(), notes="", kind=None, posted_timestamp=None
@@ -36,17 +81,9 @@ def create_transaction(
     Create a Transaction with LedgerEntries and TransactionRelatedObjects.
 
     This function is atomic and validates its input before writing to the DB.
+    It doesn't lock the ledgers it posts to: a ledger's balance is the sum of
+    its entries, and the balances of the evidence models are updated in place.
     """
-    # Lock the ledgers to which we are posting to serialize the update
-    # of LedgerBalances.
-    list(
-        Ledger.objects.filter(
-            id__in=(ledger_entry.ledger.pk for ledger_entry in ledger_entries)
-        )
-        .order_by("id")  # Avoid deadlocks.
-        .select_for_update()
-    )
-
     if not posted_timestamp:
         posted_timestamp = now()
 
@@ -59,25 +96,12 @@ def create_transaction(
         kind=kind or get_or_create_manual_transaction_kind(),
     )
 
+    amounts = defaultdict(int)
     for ledger_entry in ledger_entries:
         ledger_entry.transaction = transaction
         ledger_entry.amount = ledger_entry.amount.amount
-        for related_object in evidence:
-            content_type = ContentType.objects.get_for_model(related_object)
-            num_updated = LedgerBalance.objects.filter(
-                ledger=ledger_entry.ledger,
-                related_object_content_type=content_type,
-                related_object_id=related_object.pk,
-            ).update(balance=F("balance") + ledger_entry.amount)
-            assert num_updated <= 1
-            if num_updated == 0:
-                # The first use of this evidence model in a ledger transaction.
-                LedgerBalance.objects.create(
-                    ledger=ledger_entry.ledger,
-                    related_object_content_type=content_type,
-                    related_object_id=related_object.pk,
-                    balance=ledger_entry.amount,
-                )
+        amounts[ledger_entry.ledger.pk] += ledger_entry.amount
+    post_ledger_balances(evidence, amounts)
 
     LedgerEntry.objects.bulk_create(ledger_entries)
 
@@ -9,6 +9,7 @@ from django.contrib.contenttypes.fields import GenericRelation
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.db.models import Q
+from django.db.models import Sum
 from django.utils.translation import ugettext_lazy as _
 
 from .exceptions import TransactionBalanceException
@@ -281,7 +282,7 @@ class Ledger(models.Model):
         """
         Get the current sum of all the amounts on the entries in this Ledger.
         """
-        return sum([entry.amount for entry in self.entries.all()])
+        return self.entries.aggregate(balance=Sum("amount"))["balance"] or 0
 
     def __str__(self):
         return "Ledger %s" % self.name
@@ -1,9 +1,14 @@
 from __future__ import unicode_literals
 
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 from decimal import Decimal as D
 
-from django.test import TestCase
+from django.db import connection
+from django.db.transaction import atomic
+from django.test import TestCase, TransactionTestCase
 
 from whoweb.accounting.actions import Credit, Debit
 from whoweb.accounting.actions import create_transaction
@@ -12,6 +17,8 @@ from whoweb.accounting.exceptions import NoLedgerEntriesException
 from whoweb.accounting.exceptions import TransactionBalanceException
 from whoweb.accounting.models import LedgerEntry
 from whoweb.accounting.models import Transaction
+from whoweb.accounting.models import get_or_create_manual_transaction_kind
+from whoweb.accounting.queries import get_balances_for_object
 from whoweb.accounting.queries import validate_transaction
 from whoweb.accounting.tests.factories import LedgerFactory
 from whoweb.accounting.tests.factories import TransactionTypeFactory
@@ -193,3 +200,123 @@ class TestRounding(TestCase):
         else:
             self.assertEqual(entry1.amount, amount)
             self.assertEqual(entry2.amount, -amount)
+
+
+class TestLedgerBalances(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.liability = LedgerFactory(name="Credits Outstanding")
+        self.fulfilled = LedgerFactory(name="Credits Fulfilled", liability=False)
+
+    def consume(self, amount, evidence):
+        return create_transaction(
+            self.user,
+            evidence=evidence,
+            ledger_entries=[
+                LedgerEntry(ledger=self.liability, amount=Debit(amount)),
+                LedgerEntry(ledger=self.fulfilled, amount=Credit(amount)),
+            ],
+        )
+
+    def test_balances_by_evidence_and_ledger(self):
+        first, second = UserFactory(), UserFactory()
+        self.consume(100, [first])
+        self.consume(30, [first, second])
+
+        self.assertEqual(
+            get_balances_for_object(first), {self.liability: -130, self.fulfilled: 130},
+        )
+        self.assertEqual(
+            get_balances_for_object(second), {self.liability: -30, self.fulfilled: 30}
+        )
+        self.assertEqual(self.liability.get_balance(), -130)
+        self.assertEqual(self.fulfilled.get_balance(), 130)
+        self.assertEqual(LedgerFactory().get_balance(), 0)
+
+
+class TestConcurrentTransactions(TransactionTestCase):
+    """
+    Transactions held open in another thread while this one posts to the same
+    ledgers.
+    """
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.liability = LedgerFactory(name="Credits Outstanding")
+        self.fulfilled = LedgerFactory(name="Credits Fulfilled", liability=False)
+        self.kind = get_or_create_manual_transaction_kind()
+
+    def consume(self, amount, evidence):
+        return create_transaction(
+            self.user,
+            evidence=evidence,
+            ledger_entries=[
+                LedgerEntry(ledger=self.liability, amount=Debit(amount)),
+                LedgerEntry(ledger=self.fulfilled, amount=Credit(amount)),
+            ],
+            kind=self.kind,
+        )
+
+    @contextmanager
+    def held_open(self, amount, evidence):
+        """Consume in a transaction that stays open until the block exits."""
+        posted, release, errors = threading.Event(), threading.Event(), []
+
+        def run():
+            try:
+                with atomic():
+                    self.consume(amount, evidence)
+                    posted.set()
+                    release.wait(10)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                posted.set()
+                connection.close()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        posted.wait(10)
+        try:
+            yield
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_transactions_for_different_customers_do_not_block(self):
+        first, second = UserFactory(), UserFactory()
+        with self.held_open(100, [first]):
+            with atomic(), connection.cursor() as cursor:
+                # Waiting on the other transaction fails instead of hanging.
+                cursor.execute("SET LOCAL lock_timeout = '2s'")
+                self.consume(30, [second])
+
+        self.assertEqual(get_balances_for_object(first)[self.liability], -100)
+        self.assertEqual(get_balances_for_object(second)[self.liability], -30)
+        self.assertEqual(self.fulfilled.get_balance(), 130)
+
+    def test_first_transactions_for_the_same_customer_both_count(self):
+        customer = UserFactory()
+        errors = []
+
+        def consume():
+            try:
+                self.consume(30, [customer])
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        with self.held_open(100, [customer]):
+            # Waits on the open transaction's new balance rather than failing.
+            thread = threading.Thread(target=consume)
+            thread.start()
+            time.sleep(0.2)
+        thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(
+            get_balances_for_object(customer),
+            {self.liability: -130, self.fulfilled: 130},
+        )
@@ -623,7 +623,7 @@ class BaseCampaignRunner(
         for page, profiles in export.get_profiles_by_page():
             page.data = [
                 profile.generate_icebreaker(template, sender_profile=None).dict(
-                    exclude=SearchExport.PROFILE_EXCLUDES
+                    exclude=SearchExport.STORED_PROFILE_EXCLUDES
                 )
                 for profile in profiles
             ]
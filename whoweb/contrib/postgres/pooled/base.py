@@ -0,0 +1,211 @@
+"""
+PostgreSQL backend sharing a bounded pool of connections between the threads (or
+greenlets) of a process. Django's own backend opens a connection per thread and
+closes it at the end of each request or task, which for a gevent worker running a
+hundred tasks at once is a hundred connections opened and closed against
+pgbouncer per round, each held for the whole task.
+
+Here a connection is taken from the pool when a query needs one and given back
+as soon as it is no longer in use: in autocommit mode once its last cursor is
+closed, otherwise when its transaction ends. At most POOL_SIZE connections are
+open at once; callers wait up to POOL_TIMEOUT seconds for one to be returned.
+
+    DATABASES["default"]["ENGINE"] = "whoweb.contrib.postgres.pooled"
+    DATABASES["default"]["POOL_SIZE"] = 10
+"""
+import os
+import threading
+from collections import deque
+from functools import partial
+
+from django.db.backends import utils
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from whoweb.core.metrics import DB_POOL_CONNECTIONS, DB_POOL_WAITS
+
+
+class PoolTimeout(base.Database.OperationalError):
+    pass
+
+
+class ConnectionPool(object):
+    def __init__(self, alias, size, timeout):
+        self.alias = alias
+        self.size = size
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(size)
+        self.idle = deque()
+        self.lock = threading.Lock()
+        self.opened = 0
+
+    def acquire(self, connect):
+        """An idle connection, or a new one from `connect` if none is idle."""
+        if not self.slots.acquire(blocking=False):
+            DB_POOL_WAITS.labels(self.alias).inc()
+            if not self.slots.acquire(timeout=self.timeout):
+                raise PoolTimeout(
+                    f"No connection to {self.alias} was returned to its pool of "
+                    f"{self.size} within {self.timeout}s."
+                )
+        try:
+            while True:
+                with self.lock:
+                    conn = self.idle.pop() if self.idle else None
+                if conn is None:
+                    conn = connect()
+                    with self.lock:
+                        self.opened += 1
+                    DB_POOL_CONNECTIONS.labels(self.alias).set(self.opened)
+                    return conn
+                if not conn.closed:
+                    return conn
+                self.discard(conn)
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, conn):
+        """Take `conn` back, rolled back to an idle state, or close it if broken."""
+        try:
+            status = conn.info.transaction_status if not conn.closed else None
+            if status not in (
+                extensions.TRANSACTION_STATUS_IDLE,
+                extensions.TRANSACTION_STATUS_INTRANS,
+                extensions.TRANSACTION_STATUS_INERROR,
+            ):
+                self.discard(conn)
+                return
+            if status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except base.Database.Error:
+                    self.discard(conn)
+                    return
+            with self.lock:
+                self.idle.append(conn)
+        finally:
+            self.slots.release()
+
+    def discard(self, conn):
+        if not conn.closed:
+            conn.close()
+        with self.lock:
+            self.opened -= 1
+        DB_POOL_CONNECTIONS.labels(self.alias).set(self.opened)
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = list(self.idle), deque()
+        for conn in idle:
+            self.discard(conn)
+
+
+pools = {}
+_pools_lock = threading.Lock()
+
+
+def _reset_pools():
+    # Connections inherited through fork belong to the parent.
+    global _pools_lock
+    pools.clear()
+    _pools_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_pools)
+
+
+class PooledCursorMixin(object):
+    def __init__(self, cursor, db):
+        super().__init__(cursor, db)
+        self.generation = db.generation
+
+    def close(self):
+        try:
+            self.cursor.close()
+        finally:
+            self.db.cursor_closed(self)
+
+
+class CursorWrapper(PooledCursorMixin, utils.CursorWrapper):
+    pass
+
+
+class CursorDebugWrapper(PooledCursorMixin, utils.CursorDebugWrapper):
+    pass
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.open_cursors = 0
+        self.connecting = False
+        # Bumped on giving a connection back, so cursors left open on it don't
+        # count against the next one.
+        self.generation = 0
+
+    @property
+    def pool(self) -> ConnectionPool:
+        pool = pools.get(self.alias)
+        if pool is None:
+            with _pools_lock:
+                pool = pools.get(self.alias)
+                if pool is None:
+                    pool = pools[self.alias] = ConnectionPool(
+                        self.alias,
+                        size=self.settings_dict.get("POOL_SIZE", 10),
+                        timeout=self.settings_dict.get("POOL_TIMEOUT", 30),
+                    )
+        return pool
+
+    def get_new_connection(self, conn_params):
+        connection = self.pool.acquire(partial(super().get_new_connection, conn_params))
+        # The parent only reads it from connections it opens itself.
+        self.isolation_level = self.settings_dict["OPTIONS"].get(
+            "isolation_level", connection.isolation_level
+        )
+        return connection
+
+    def make_cursor(self, cursor):
+        self.open_cursors += 1
+        return CursorWrapper(cursor, self)
+
+    def make_debug_cursor(self, cursor):
+        self.open_cursors += 1
+        return CursorDebugWrapper(cursor, self)
+
+    def connect(self):
+        self.connecting = True
+        try:
+            super().connect()
+        finally:
+            self.connecting = False
+
+    def release_if_idle(self):
+        """Give the connection back unless a cursor or transaction still uses it."""
+        if (
+            self.connection is not None
+            and not self.connecting
+            and not self.open_cursors
+            and self.autocommit
+            and not self.in_atomic_block
+        ):
+            self.close()
+
+    def cursor_closed(self, cursor):
+        if cursor.generation == self.generation:
+            cursor.generation = None
+            self.open_cursors -= 1
+            self.release_if_idle()
+
+    def set_autocommit(self, autocommit, *args, **kwargs):
+        # Back in autocommit once a transaction ends and its commit hooks ran.
+        super().set_autocommit(autocommit, *args, **kwargs)
+        self.release_if_idle()
+
+    def _close(self):
+        self.open_cursors = 0
+        self.generation += 1
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.release(self.connection)
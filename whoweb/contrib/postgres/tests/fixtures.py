@@ -0,0 +1,30 @@
+import pytest
+from django.db import connection, connections
+
+from whoweb.contrib.postgres.pooled.base import pools
+
+
+@pytest.fixture
+def pooled(monkeypatch):
+    """Alias of the test database through the pooled backend."""
+
+    def configure(size=2, timeout=5):
+        monkeypatch.setitem(
+            connections.databases,
+            "pooled",
+            {
+                **connection.settings_dict,
+                "ENGINE": "whoweb.contrib.postgres.pooled",
+                "POOL_SIZE": size,
+                "POOL_TIMEOUT": timeout,
+            },
+        )
+        return connections["pooled"]
+
+    yield configure
+    if hasattr(connections._connections, "pooled"):
+        connections["pooled"].close()
+        delattr(connections._connections, "pooled")
+    pool = pools.pop("pooled", None)
+    if pool is not None:
+        pool.close()
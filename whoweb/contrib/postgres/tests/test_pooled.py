@@ -0,0 +1,104 @@
+import threading
+
+import psycopg2
+import pytest
+from django.db import OperationalError, connection, connections, transaction
+from psycopg2 import extensions
+
+from whoweb.contrib.postgres.pooled.base import ConnectionPool, PoolTimeout, pools
+
+pytestmark = pytest.mark.django_db
+
+
+def backend_pid(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("select pg_backend_pid()")
+        return cursor.fetchone()[0]
+
+
+def in_thread(func):
+    errors = []
+
+    def run():
+        try:
+            func()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connections["pooled"].close()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, errors
+
+
+def test_connections_go_back_to_the_pool_between_queries(pooled):
+    conn = pooled()
+    pid = backend_pid(conn)
+
+    assert conn.connection is None
+    assert pools["pooled"].opened == 1
+    assert len(pools["pooled"].idle) == 1
+    assert backend_pid(conn) == pid
+
+
+def test_transaction_holds_its_connection_until_it_ends(pooled):
+    conn = pooled()
+    committed = []
+    with transaction.atomic(using="pooled"):
+        pid = backend_pid(conn)
+        transaction.on_commit(lambda: committed.append(True), using="pooled")
+        assert conn.connection is not None
+        assert backend_pid(conn) == pid
+
+    assert committed == [True]
+    assert conn.connection is None
+    assert len(pools["pooled"].idle) == 1
+
+
+def test_threads_share_at_most_pool_size_connections(pooled):
+    pooled(size=2)
+    pids = set()
+
+    def query():
+        with connections["pooled"].cursor() as cursor:
+            cursor.execute("select pg_backend_pid(), pg_sleep(0.1)")
+            pids.add(cursor.fetchone()[0])
+
+    threads = [in_thread(query) for _ in range(6)]
+    for thread, errors in threads:
+        thread.join()
+        assert not errors
+
+    assert len(pids) == 2
+    assert pools["pooled"].opened == 2
+
+
+def test_waiting_for_a_connection_times_out(pooled):
+    conn = pooled(size=1, timeout=0.1)
+    with transaction.atomic(using="pooled"):
+        backend_pid(conn)
+        thread, errors = in_thread(lambda: backend_pid(connections["pooled"]))
+        thread.join()
+
+    assert len(errors) == 1
+    assert isinstance(errors[0], OperationalError)
+    assert isinstance(errors[0].__cause__, PoolTimeout)
+
+
+def test_release_rolls_back_and_discards_broken_connections():
+    params = connection.get_connection_params()
+    pool = ConnectionPool("test", size=1, timeout=1)
+    conn = pool.acquire(lambda: psycopg2.connect(**params))
+    conn.cursor().execute("select 1")
+    assert conn.info.transaction_status == extensions.TRANSACTION_STATUS_INTRANS
+
+    pool.release(conn)
+    assert conn.info.transaction_status == extensions.TRANSACTION_STATUS_IDLE
+    assert pool.acquire(lambda: pytest.fail("opened another")) is conn
+
+    conn.close()
+    pool.release(conn)
+    assert pool.opened == 0
+    assert not pool.idle
+    pool.close()
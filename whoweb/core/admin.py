@@ -1,25 +1,157 @@
 from django.conf import settings
 from django.contrib import admin
 from django.contrib.contenttypes.admin import GenericTabularInline
+from django.contrib.contenttypes.forms import BaseGenericInlineFormSet
+from django.contrib.contenttypes.models import ContentType
+from django.core.paginator import Paginator
 from django.conf.locale.en import formats as en_formats
+from django.db.models import (
+    Count,
+    DurationField,
+    ExpressionWrapper,
+    F,
+    Max,
+    Min,
+    Q,
+    Sum,
+)
+from django.template.loader import render_to_string
 
 from whoweb.core.models import ModelEvent
+from whoweb.core.tracing import SPAN
+
+TRACE_WATERFALL_MAX_SPANS = 200
+
+
+class PaginatedEventFormSet(BaseGenericInlineFormSet):
+    per_page = 25
+    page_param = "events_page"
+    request = None
+
+    def get_queryset(self):
+        if not hasattr(self, "_page"):
+            # Spans are shown in the trace waterfall instead.
+            paginator = Paginator(
+                super().get_queryset().exclude(code=SPAN[0]).order_by("-created"),
+                self.per_page,
+            )
+            number = self.request.GET.get(self.page_param) if self.request else None
+            self._page = paginator.get_page(number)
+        return self._page.object_list
+
+    @property
+    def page(self):
+        self.get_queryset()
+        return self._page
+
+    def page_url(self, number):
+        params = self.request.GET.copy()
+        params[self.page_param] = number
+        return f"?{params.urlencode()}"
+
+    @property
+    def previous_url(self):
+        if self.page.has_previous():
+            return self.page_url(self.page.previous_page_number())
+
+    @property
+    def next_url(self):
+        if self.page.has_next():
+            return self.page_url(self.page.next_page_number())
 
 
 class EventTabularInline(GenericTabularInline):
     model = ModelEvent
+    formset = PaginatedEventFormSet
+    template = "admin/edit_inline/paginated_tabular.html"
     fields = ("code", "message", "data", "start", "end", "created", "modified")
     readonly_fields = fields
     extra = 0
     can_delete = False
 
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.request = request
+        return formset
+
     def has_add_permission(self, request, obj=None):
         return False
 
 
+def trace_waterfall(obj, max_spans=TRACE_WATERFALL_MAX_SPANS):
+    """
+    The latest trace recorded against `obj`: time and count per span name, and
+    its first `max_spans` spans as a waterfall.
+    """
+    events = ModelEvent.objects.filter(
+        content_type=ContentType.objects.get_for_model(obj),
+        object_id=obj.pk,
+        code=SPAN[0],
+    )
+    trace_id = (
+        events.order_by("-created").values_list("data__trace_id", flat=True).first()
+    )
+    if not trace_id:
+        return render_to_string("admin/trace_waterfall.html", {"spans": []})
+    events = events.filter(data__trace_id=trace_id)
+    duration = ExpressionWrapper(F("end") - F("start"), output_field=DurationField())
+    bounds = events.aggregate(start=Min("start"), end=Max("end"), count=Count("pk"))
+    elapsed = max((bounds["end"] - bounds["start"]).total_seconds(), 1e-6)
+
+    summary = [
+        {
+            "name": stage["message"].rsplit(".", 1)[-1],
+            "count": stage["count"],
+            "total": stage["total"].total_seconds(),
+            "longest": stage["longest"].total_seconds(),
+            "errors": stage["errors"],
+        }
+        for stage in events.values("message")
+        .annotate(
+            count=Count("pk"),
+            total=Sum(duration),
+            longest=Max(duration),
+            first=Min("start"),
+            errors=Count("pk", filter=Q(data__status="error")),
+        )
+        .order_by("first")
+    ]
+    depths, spans = {}, []
+    for event in events.order_by("start")[:max_spans]:
+        depth = min(depths.get(event.data.get("parent_id"), -1) + 1, 10)
+        depths[event.data.get("span_id")] = depth
+        seconds = (event.end - event.start).total_seconds()
+        spans.append(
+            {
+                "name": event.message.rsplit(".", 1)[-1],
+                "message": event.message,
+                "kind": event.data.get("kind"),
+                "status": event.data.get("status"),
+                "depth": depth,
+                "duration": seconds,
+                "offset": (event.start - bounds["start"]).total_seconds()
+                / elapsed
+                * 100,
+                "width": max(seconds / elapsed * 100, 0.2),
+            }
+        )
+    return render_to_string(
+        "admin/trace_waterfall.html",
+        {
+            "trace_id": trace_id,
+            "duration": elapsed,
+            "span_count": bounds["count"],
+            "summary": summary,
+            "spans": spans,
+        },
+    )
+
+
 @admin.register(ModelEvent)
 class ModelEventAdmin(admin.ModelAdmin):
     list_filter = ["content_type"]
+    ordering = ["-created"]
+    show_full_result_count = False
 
 
 admin.site.site_url = "/ww/api"
@@ -5,3 +5,42 @@ from django.utils.translation import gettext_lazy as _
 class CoreConfig(AppConfig):
     name = "whoweb.core"
     verbose_name = _("Whoweb Core")
+
+    def ready(self):
+        import atexit
+
+        from functools import partial
+
+        from celery.signals import (
+            before_task_publish,
+            task_postrun,
+            task_prerun,
+            worker_init,
+            worker_process_shutdown,
+            worker_ready,
+        )
+        from django.conf import settings
+        from django.core.signals import request_finished
+
+        from whoweb.core import green, metrics, tracing
+        from whoweb.core.eventlog import event_buffer
+
+        before_task_publish.connect(tracing.inject_headers, weak=False)
+        before_task_publish.connect(metrics.stamp_published, weak=False)
+        task_prerun.connect(metrics.start_task_timer, weak=False)
+        task_prerun.connect(tracing.start_task_span, weak=False)
+        task_prerun.connect(green.warn_cpu_bound_task, weak=False)
+        worker_init.connect(green.setup_green_worker, weak=False)
+        # Before the event buffer's flush, so a task's own span goes out with it.
+        task_postrun.connect(tracing.finish_task_span, weak=False)
+        task_postrun.connect(metrics.finish_task_timer, weak=False)
+        worker_process_shutdown.connect(metrics.mark_process_dead, weak=False)
+        if settings.METRICS_WORKER_PORT:
+            worker_ready.connect(
+                partial(metrics.serve_worker_metrics, settings.METRICS_WORKER_PORT),
+                weak=False,
+            )
+        task_postrun.connect(event_buffer.flush, weak=False)
+        worker_process_shutdown.connect(event_buffer.flush, weak=False)
+        request_finished.connect(event_buffer.flush, weak=False)
+        atexit.register(event_buffer.flush)
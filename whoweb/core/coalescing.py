@@ -0,0 +1,110 @@
+"""
+Coalescing of identical in-flight requests. Concurrent calls with the same
+fingerprint share one upstream call: within a process the callers wait on the
+first one's result, and with `shared` set processes wait on each other through a
+lock and a result key in the cache, where the result stays for
+SINGLEFLIGHT_RESULT_TTL seconds.
+"""
+import copy
+import hashlib
+import json
+import threading
+import time
+import uuid
+
+from bson import json_util
+from django.conf import settings
+from django.core.cache import cache
+
+from whoweb.core.metrics import count_cache
+
+LOCAL = "local"
+SHARED = "shared"
+
+_MISSING = object()
+
+
+def fingerprint(*parts) -> str:
+    """Canonical digest of json-serializable request parts."""
+    canonical = json.dumps(
+        parts, sort_keys=True, separators=(",", ":"), default=json_util.default
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiters = 0
+        self.result = None
+        self.error = None
+
+
+_calls = {}
+_lock = threading.Lock()
+
+
+def singleflight(key, func, shared=False, timeout=30):
+    """
+    Return `func()`, or the result of an identical call already in flight. Callers
+    waiting on another's call get a copy of its result, or its error.
+    """
+    with _lock:
+        call = _calls.get(key)
+        if call is None:
+            call = _calls[key] = _Call()
+            leader = True
+        else:
+            call.waiters += 1
+            leader = False
+    if not leader:
+        call.done.wait()
+        count_cache("singleflight", hit=True)
+        if call.error is not None:
+            raise call.error
+        return copy.deepcopy(call.result)
+
+    try:
+        if shared and settings.SINGLEFLIGHT_SHARED:
+            result = _shared_call(key, func, timeout)
+        else:
+            count_cache("singleflight", hit=False)
+            result = func()
+    except Exception as e:
+        call.error = e
+        raise
+    else:
+        return result
+    finally:
+        with _lock:
+            del _calls[key]
+            if call.waiters and call.error is None:
+                call.result = copy.deepcopy(result)
+        call.done.set()
+
+
+def _shared_call(key, func, timeout):
+    result_key, lock_key = f"singleflight-{key}", f"singleflight-{key}-lock"
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    while True:
+        result = cache.get(result_key, _MISSING)
+        if result is not _MISSING:
+            count_cache("singleflight", hit=True)
+            return result
+        if cache.add(lock_key, token, timeout):
+            count_cache("singleflight", hit=False)
+            try:
+                result = func()
+                cache.set(result_key, result, settings.SINGLEFLIGHT_RESULT_TTL)
+                return result
+            finally:
+                if cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+        if time.monotonic() >= deadline:
+            # The process holding the lock is stuck; don't wait on it any longer.
+            count_cache("singleflight", hit=False)
+            return func()
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
@@ -0,0 +1,86 @@
+import json
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+def prepare_event_data(data):
+    """
+    Make `data` safe to store as a ModelEvent payload.
+
+    Unserializable payloads are stored as their string form, as before. Payloads
+    over EVENT_DATA_MAX_LENGTH are cut down to a preview, except for a sampled
+    EVENT_LARGE_DATA_SAMPLE_RATE fraction which are kept whole.
+    """
+    try:
+        encoded = json.dumps(data)
+    except TypeError:
+        data = str(data)
+        encoded = json.dumps(data)
+    limit = settings.EVENT_DATA_MAX_LENGTH
+    if len(encoded) <= limit or random.random() < settings.EVENT_LARGE_DATA_SAMPLE_RATE:
+        return data
+    return {"truncated": len(encoded), "preview": encoded[:limit]}
+
+
+class EventBuffer:
+    """
+    Per-process buffer of ModelEvents, written with bulk_create once it holds
+    `max_size` events or its oldest event is `max_age` seconds old, and whenever
+    a task or request finishes.
+
+    Size and age only trigger a write outside of an atomic block, so buffered
+    events never join, or roll back with, another caller's transaction.
+    """
+
+    def __init__(self, max_size=None, max_age=None):
+        self._max_size = max_size
+        self._max_age = max_age
+        self.events = []
+        self.oldest = None
+        self.lock = threading.RLock()
+
+    @property
+    def max_size(self):
+        return self._max_size or settings.EVENT_BUFFER_SIZE
+
+    @property
+    def max_age(self):
+        return self._max_age or settings.EVENT_BUFFER_MAX_AGE
+
+    def __len__(self):
+        return len(self.events)
+
+    def add(self, event):
+        with self.lock:
+            if not self.events:
+                self.oldest = time.monotonic()
+            self.events.append(event)
+            full = len(self.events) >= self.max_size
+            stale = time.monotonic() - self.oldest >= self.max_age
+        if (full or stale) and not connection.in_atomic_block:
+            self.flush()
+
+    def flush(self, **kwargs):
+        from whoweb.core.models import ModelEvent
+
+        with self.lock:
+            events, self.events = self.events, []
+            self.oldest = None
+        if not events:
+            return 0
+        try:
+            ModelEvent.objects.bulk_create(events, batch_size=self.max_size)
+        except Exception:
+            logger.exception("Dropped %s buffered model events.", len(events))
+            return 0
+        return len(events)
+
+
+event_buffer = EventBuffer()
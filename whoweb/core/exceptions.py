@@ -1,2 +1,17 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
 class ModelLockedError(Exception):
     pass
+
+
+class ServiceOverloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _("An upstream service is busy; try again shortly.")
+    default_code = "service_unavailable"
+
+    def __init__(self, detail=None, code=None, retry_after=None):
+        super().__init__(detail, code)
+        self.retry_after = retry_after
@@ -0,0 +1,99 @@
+"""
+Support for serving and working under gevent. psycopg2 waits on Postgres in C,
+which would block every greenlet of the process for the length of each query;
+with its wait callback set, it yields to the hub instead.
+
+CPU-bound work blocks the hub just the same, so celery tasks doing it are marked
+`cpu_bound=True` and kept off the queues of gevent workers.
+"""
+import logging
+
+import psycopg2
+from celery.exceptions import WorkerShutdown
+from psycopg2 import extensions
+
+from whoweb.core.metrics import EVENT_LOOP_BLOCKED, GREEN_CPU_BOUND_TASKS
+
+logger = logging.getLogger(__name__)
+
+
+def gevent_wait_callback(conn, timeout=None):
+    from gevent.socket import wait_read, wait_write
+
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise psycopg2.OperationalError(f"Bad result from poll: {state!r}")
+
+
+def make_psycopg_green():
+    """Make connections opened from now on wait cooperatively."""
+    extensions.set_wait_callback(gevent_wait_callback)
+
+
+def is_green():
+    """Whether this process runs under gevent, its sockets monkey-patched."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("socket")
+
+
+def routed_cpu_bound_tasks(app):
+    """Names of the tasks marked `cpu_bound` and the queues they are routed to."""
+    router = app.amqp.router
+    for name, task in sorted(app.tasks.items()):
+        if getattr(task, "cpu_bound", False):
+            queue = router.route({}, name, task_type=task).get("queue")
+            yield name, getattr(queue, "name", queue)
+
+
+def count_blocked_loop(event):
+    from gevent.events import EventLoopBlocked
+
+    if isinstance(event, EventLoopBlocked):
+        EVENT_LOOP_BLOCKED.inc()
+        logger.warning("gevent event loop blocked:\n%s", "\n".join(event.info))
+
+
+# Celery signal receivers
+
+
+def setup_green_worker(sender=None, **kwargs):
+    """
+    On a worker running under gevent, make psycopg2 wait cooperatively, count the
+    times the monitor thread finds the event loop blocked, and refuse to start
+    consuming queues that CPU-bound tasks are routed to: while one runs, every
+    other task of the worker waits.
+    """
+    if not is_green():
+        return
+    consumed = set(sender.app.amqp.queues.consume_from)
+    misrouted = [
+        f"{name} ({queue})"
+        for name, queue in routed_cpu_bound_tasks(sender.app)
+        if queue in consumed
+    ]
+    if misrouted:
+        message = "CPU-bound tasks are routed to this gevent worker: " + ", ".join(
+            misrouted
+        )
+        logger.critical(message)
+        raise WorkerShutdown(message)
+    make_psycopg_green()
+    from gevent import events
+
+    events.subscribers.append(count_blocked_loop)
+
+
+def warn_cpu_bound_task(task=None, **kwargs):
+    if getattr(task, "cpu_bound", False) and is_green():
+        GREEN_CPU_BOUND_TASKS.labels(task.name).inc()
+        logger.warning("CPU-bound task %s is running on a gevent worker.", task.name)
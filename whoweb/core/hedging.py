@@ -0,0 +1,125 @@
+"""
+Request hedging for idempotent routes. A call outstanding for longer than its
+route's HEDGE_PERCENTILE latency sends a duplicate request; whichever attempt
+answers first wins, and the other is abandoned. Each route may hedge at most
+HEDGE_BUDGET of its calls.
+
+Latencies and budgets are kept per process. Attempts run on a bounded thread
+pool; when it is full, calls run unhedged in the caller's thread.
+"""
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+from whoweb.core.metrics import HEDGED_REQUESTS
+
+HEDGE_HEADER = "X-Hedged-Request"
+MIN_SAMPLES = 20
+MAX_TOKENS = 10
+
+
+class HedgePolicy(object):
+    """Recent latencies and remaining hedge budget of a route."""
+
+    def __init__(self, window=200):
+        self.latencies = deque(maxlen=window)
+        self.tokens = 1.0
+        self.lock = threading.Lock()
+
+    def observe(self, latency):
+        with self.lock:
+            self.latencies.append(latency)
+
+    def delay(self):
+        """Seconds to wait on the first attempt before hedging."""
+        with self.lock:
+            ordered = sorted(self.latencies)
+        if len(ordered) < MIN_SAMPLES:
+            return settings.HEDGE_INITIAL_DELAY
+        rank = min(
+            len(ordered) - 1, int(settings.HEDGE_PERCENTILE / 100 * len(ordered))
+        )
+        return max(settings.HEDGE_MIN_DELAY, ordered[rank])
+
+    def earn(self):
+        with self.lock:
+            self.tokens = min(MAX_TOKENS, self.tokens + settings.HEDGE_BUDGET)
+
+    def spend(self):
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class _Pool(object):
+    def __init__(self):
+        self.executor = None
+        self.slots = None
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        """Run `fn` on the pool if a thread is free; return its future or None."""
+        if self.executor is None:
+            with self.lock:
+                if self.executor is None:
+                    self.slots = threading.BoundedSemaphore(settings.HEDGE_MAX_WORKERS)
+                    self.executor = ThreadPoolExecutor(
+                        settings.HEDGE_MAX_WORKERS, thread_name_prefix="hedge"
+                    )
+        if not self.slots.acquire(blocking=False):
+            return None
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def reset(self):
+        self.__init__()
+
+
+policies = defaultdict(HedgePolicy)
+pool = _Pool()
+os.register_at_fork(after_in_child=pool.reset)
+
+
+def _attempt(policy, func, args, kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    policy.observe(time.perf_counter() - started)
+    return result
+
+
+def hedged(route, func, *args, **kwargs):
+    """
+    Call `func`, sending a duplicate call flagged by the HEDGE_HEADER header
+    when the first is slow for `route`. Returns the first successful result, or
+    raises the first attempt's error when every attempt failed.
+    """
+    policy = policies[route]
+    policy.earn()
+    primary = pool.submit(_attempt, policy, func, args, kwargs)
+    if primary is None:
+        return _attempt(policy, func, args, kwargs)
+    done, _ = wait([primary], timeout=policy.delay())
+    if done or not policy.spend():
+        return primary.result()
+
+    headers = {**(kwargs.get("headers") or {}), HEDGE_HEADER: "1"}
+    hedge = pool.submit(_attempt, policy, func, args, {**kwargs, "headers": headers})
+    if hedge is None:
+        return primary.result()
+    pending = {primary, hedge}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                winner = "primary" if future is primary else "hedge"
+                HEDGED_REQUESTS.labels(route, winner).inc()
+                return future.result()
+    HEDGED_REQUESTS.labels(route, "none").inc()
+    return primary.result()
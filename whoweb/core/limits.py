@@ -0,0 +1,209 @@
+"""
+Guards for calls to upstream services, shared by every process through the cache:
+an adaptive concurrency limit and a circuit breaker.
+"""
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from requests import ConnectionError, HTTPError, Timeout
+
+from whoweb.core.exceptions import ServiceOverloaded
+from whoweb.core.metrics import GUARD_REJECTIONS
+from whoweb.core.utils import CacheSemaphore
+
+
+def _incr(key, timeout):
+    """Count in a window of `timeout` seconds opened by the first count."""
+    if cache.add(key, 1, timeout):
+        return 1
+    try:
+        return cache.incr(key)
+    except ValueError:  # expired in between
+        cache.add(key, 1, timeout)
+        return 1
+
+
+class AdaptiveLimiter(object):
+    """
+    Concurrency limit adjusted from the outcome of each call (AIMD). Calls answered
+    within `latency_target` seconds raise the limit by one per `limit` calls; a
+    slow or failed call cuts it by `backoff`, at most once per `latency_target`
+    so a burst of slow calls counts as one signal.
+
+    Updates are last-writer-wins across processes, which only blurs the limit.
+    """
+
+    def __init__(self, key, initial, minimum, maximum, latency_target, backoff):
+        self.key = f"{key}-limit"
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.backoff = backoff
+
+    @property
+    def limit(self) -> float:
+        value = cache.get(self.key)
+        return self.initial if value is None else value
+
+    def record(self, latency, ok=True):
+        limit = self.limit
+        if ok and latency <= self.latency_target:
+            limit = min(self.maximum, limit + 1 / limit)
+        elif cache.add(f"{self.key}-decreased", 1, self.latency_target):
+            limit = max(self.minimum, limit * self.backoff)
+        else:
+            return limit
+        cache.set(self.key, limit, None)
+        return limit
+
+
+class CircuitBreaker(object):
+    """
+    Opens once at least `failure_ratio` of `min_calls` or more calls within a
+    `window` of seconds failed, rejecting calls for `cooldown` seconds. After that
+    one probe call at a time is let through; its success closes the breaker and
+    its failure opens it again. While open, only the probe's own outcome counts:
+    calls that started earlier and finish late are ignored.
+    """
+
+    def __init__(self, key, failure_ratio, min_calls, window, cooldown):
+        self.key = key
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.window = window
+        self.cooldown = cooldown
+        self.probe = None
+
+    @property
+    def open_until(self):
+        return cache.get(f"{self.key}-open")
+
+    @property
+    def retry_after(self) -> float:
+        open_until = self.open_until
+        if open_until is None:
+            return 0
+        return max(open_until - time.time(), 0)
+
+    def allow(self):
+        open_until = self.open_until
+        if open_until is None:
+            return True
+        if time.time() < open_until:
+            return False
+        probe = uuid.uuid4().hex
+        if not cache.add(f"{self.key}-probe", probe, self.cooldown):
+            return False
+        self.probe = probe
+        return True
+
+    def open(self):
+        cache.set(f"{self.key}-open", time.time() + self.cooldown, None)
+        cache.delete(f"{self.key}-probe")
+
+    def close(self):
+        cache.delete_many(
+            [f"{self.key}-{part}" for part in ("open", "probe", "calls", "failures")]
+        )
+
+    def record(self, ok=True):
+        if self.open_until is not None:
+            if self.probe is None or cache.get(f"{self.key}-probe") != self.probe:
+                return
+            if ok:
+                self.close()
+            else:
+                self.open()
+            return
+        calls = _incr(f"{self.key}-calls", self.window)
+        if ok:
+            return
+        failures = _incr(f"{self.key}-failures", self.window)
+        if calls >= self.min_calls and failures / calls >= self.failure_ratio:
+            self.open()
+
+
+class ServiceGuard(object):
+    """
+    Admits calls to an upstream service while its breaker is closed and fewer
+    than its adaptive limit are in flight, raising ServiceOverloaded otherwise.
+    Timeouts, connection errors and 5xx responses count as failures.
+
+    Configured by the `<PREFIX>_LIMIT_*`, `<PREFIX>_BREAKER_*`,
+    `<PREFIX>_LATENCY_TARGET` and `<PREFIX>_SLOT_TIMEOUT` settings.
+    """
+
+    def __init__(self, service, prefix):
+        self.service = service
+        self.prefix = prefix
+        self.key = f"guard-{service}"
+
+    def setting(self, name):
+        return getattr(settings, f"{self.prefix}_{name}")
+
+    @property
+    def limiter(self):
+        return AdaptiveLimiter(
+            self.key,
+            initial=self.setting("LIMIT_INITIAL"),
+            minimum=self.setting("LIMIT_MIN"),
+            maximum=self.setting("LIMIT_MAX"),
+            latency_target=self.setting("LATENCY_TARGET"),
+            backoff=self.setting("LIMIT_BACKOFF"),
+        )
+
+    @property
+    def breaker(self):
+        return CircuitBreaker(
+            self.key,
+            failure_ratio=self.setting("BREAKER_FAILURE_RATIO"),
+            min_calls=self.setting("BREAKER_MIN_CALLS"),
+            window=self.setting("BREAKER_WINDOW"),
+            cooldown=self.setting("BREAKER_COOLDOWN"),
+        )
+
+    @staticmethod
+    def is_failure(exc):
+        if isinstance(exc, HTTPError):
+            return exc.response is None or exc.response.status_code >= 500
+        return isinstance(exc, (Timeout, ConnectionError))
+
+    def reject(self, reason, retry_after):
+        GUARD_REJECTIONS.labels(self.service, reason).inc()
+        raise ServiceOverloaded(
+            detail=f"The {self.service} service is {reason}; try again shortly.",
+            retry_after=retry_after,
+        )
+
+    @contextmanager
+    def slot(self):
+        breaker, limiter = self.breaker, self.limiter
+        if not breaker.allow():
+            self.reject("unavailable", breaker.retry_after)
+        semaphore = CacheSemaphore(
+            f"{self.key}-inflight",
+            limit=int(limiter.limit),
+            timeout=self.setting("SLOT_TIMEOUT"),
+        )
+        if not semaphore.acquire():
+            self.reject("at capacity", limiter.latency_target)
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            failed = self.is_failure(e)
+            breaker.record(ok=not failed)
+            limiter.record(time.monotonic() - started, ok=not failed)
+            raise
+        else:
+            breaker.record(ok=True)
+            limiter.record(time.monotonic() - started, ok=True)
+        finally:
+            semaphore.release()
+
+
+derive_guard = ServiceGuard("derive", "DERIVE")
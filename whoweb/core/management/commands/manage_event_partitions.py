@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from whoweb.core.partitions import (
+    ensure_event_partitions,
+    expired_event_partitions,
+    archive_event_partition,
+    drop_event_partition,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Create upcoming monthly model event partitions and drop, or archive to "
+        "storage and drop, partitions older than the retention window."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--retention-days",
+            type=int,
+            default=settings.EVENT_RETENTION_DAYS,
+            help="Drop partitions whose newest possible event is older than this.",
+        )
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=3,
+            help="Number of future monthly partitions to keep created.",
+        )
+        parser.add_argument(
+            "--archive",
+            action="store_true",
+            help="Write expired partitions to storage as gzipped json lines first.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report expired partitions without archiving or dropping them.",
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        for name in ensure_event_partitions(now, months_ahead=options["months_ahead"]):
+            self.stdout.write(f"Created {name}")
+        cutoff = now - timedelta(days=options["retention_days"])
+        for partition in expired_event_partitions(cutoff):
+            if options["dry_run"]:
+                self.stdout.write(f"Would drop {partition.name}")
+                continue
+            if options["archive"]:
+                path = archive_event_partition(partition.name)
+                self.stdout.write(f"Archived {partition.name} to {path}")
+            drop_event_partition(partition.name)
+            self.stdout.write(f"Dropped {partition.name}")
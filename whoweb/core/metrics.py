@@ -0,0 +1,187 @@
+"""
+Prometheus metrics: latency of router calls, runtime and queue wait of celery
+tasks, rows moved through each export stage, cache hits and misses,
+calls turned away by upstream service guards, hedged requests, the database
+connection pool, and greenlets blocking a gevent worker's event loop.
+
+Processes forked by gunicorn or celery share their samples through the directory
+in PROMETHEUS_MULTIPROC_DIR when it is set; `registry` then collects them all.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+WAIT_BUCKETS = (0.1, 0.5, 1, 5, 15, 30, 60, 300, 900, 1800, 3600)
+
+ROUTER_LATENCY = Histogram(
+    "whoweb_router_request_seconds",
+    "Latency of calls to upstream services by router route.",
+    ["route", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+TASK_RUNTIME = Histogram(
+    "whoweb_celery_task_seconds",
+    "Runtime of celery tasks by task name and final state.",
+    ["task", "state"],
+    buckets=LATENCY_BUCKETS + (900, 1800, 3600),
+)
+TASK_QUEUE_WAIT = Histogram(
+    "whoweb_celery_task_queue_wait_seconds",
+    "Time celery tasks spent queued between publish (or eta) and start.",
+    ["task"],
+    buckets=WAIT_BUCKETS,
+)
+EXPORT_ROWS = Counter(
+    "whoweb_export_rows_total",
+    "Rows moved through each export stage; its rate is rows per second.",
+    ["stage"],
+)
+CACHE_REQUESTS = Counter(
+    "whoweb_cache_requests_total",
+    "Lookups against application caches by cache and result (hit or miss).",
+    ["cache", "result"],
+)
+GUARD_REJECTIONS = Counter(
+    "whoweb_guard_rejections_total",
+    "Calls to upstream services turned away by their guard, by reason.",
+    ["service", "reason"],
+)
+HEDGED_REQUESTS = Counter(
+    "whoweb_hedged_requests_total",
+    "Calls that sent a hedged duplicate request, by which attempt answered first.",
+    ["route", "winner"],
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "whoweb_db_pool_connections",
+    "Database connections open in the connection pools, by database alias.",
+    ["alias"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_WAITS = Counter(
+    "whoweb_db_pool_waits_total",
+    "Connections taken from a pool only after waiting for one to be returned.",
+    ["alias"],
+)
+EVENT_LOOP_BLOCKED = Counter(
+    "whoweb_event_loop_blocked_total",
+    "Times a greenlet kept a gevent worker's event loop from running.",
+)
+GREEN_CPU_BOUND_TASKS = Counter(
+    "whoweb_green_cpu_bound_tasks_total",
+    "CPU-bound celery tasks run by a gevent worker, by task name.",
+    ["task"],
+)
+
+PUBLISHED_AT = "published_at"
+
+
+def registry():
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        collected = CollectorRegistry()
+        multiprocess.MultiProcessCollector(collected)
+        return collected
+    return REGISTRY
+
+
+def render():
+    return generate_latest(registry())
+
+
+def timed(route=None):
+    """Decorate a router route to record the latency of each call."""
+
+    def decorator(func):
+        name = route or func.__name__
+        ok = ROUTER_LATENCY.labels(name, "ok")
+        error = ROUTER_LATENCY.labels(name, "error")
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException:
+                error.observe(time.perf_counter() - started)
+                raise
+            ok.observe(time.perf_counter() - started)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def count_rows(stage, rows):
+    if rows:
+        EXPORT_ROWS.labels(stage).inc(rows)
+
+
+def count_cache(cache, hit):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+# Celery signal receivers
+
+
+class _Context(threading.local):
+    def __init__(self):
+        self.tasks = {}
+
+
+_context = _Context()
+
+
+def stamp_published(headers=None, **kwargs):
+    if headers is None:
+        return
+    published = time.time()
+    if headers.get("eta"):
+        try:
+            published = max(
+                published, datetime.fromisoformat(headers["eta"]).timestamp()
+            )
+        except (TypeError, ValueError):
+            pass
+    headers[PUBLISHED_AT] = published
+
+
+def start_task_timer(task_id=None, task=None, **kwargs):
+    published = getattr(task.request, PUBLISHED_AT, None)
+    if published:
+        TASK_QUEUE_WAIT.labels(task.name).observe(max(time.time() - published, 0))
+    # Eagerly replaced tasks run their replacement under the same id.
+    _context.tasks.setdefault(task_id, []).append(time.perf_counter())
+
+
+def finish_task_timer(task_id=None, task=None, state=None, **kwargs):
+    started = _context.tasks.get(task_id)
+    if not started:
+        return
+    runtime = time.perf_counter() - started.pop()
+    if not started:
+        del _context.tasks[task_id]
+    TASK_RUNTIME.labels(task.name, state or "UNKNOWN").observe(runtime)
+
+
+def serve_worker_metrics(port, **kwargs):
+    """Expose a celery worker's metrics on `port`, as gunicorn does at /metrics."""
+    start_http_server(port, registry=registry())
+
+
+def mark_process_dead(pid=None, **kwargs):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid or os.getpid())
@@ -2,6 +2,7 @@ import json
 import logging
 from functools import partial
 
+from django.conf import settings
 from django.http import HttpResponse, HttpResponseServerError
 from promise import is_thenable
 from sentry_sdk import capture_exception
@@ -23,6 +24,8 @@ class HealthCheckMiddleware(object):
                 return self.readiness(request)
             elif request.path == "/liveness":
                 return self.liveness(request)
+            elif request.path == "/metrics" and settings.METRICS_ENABLED:
+                return self.metrics(request)
         return self.get_response(request)
 
     def liveness(self, request):
@@ -31,6 +34,16 @@ class HealthCheckMiddleware(object):
         """
         return HttpResponse("OK")
 
+    def metrics(self, request):
+        """
+        Prometheus metrics of every process sharing PROMETHEUS_MULTIPROC_DIR, or
+        of this one.
+        """
+        from whoweb.core import metrics
+        from prometheus_client import CONTENT_TYPE_LATEST
+
+        return HttpResponse(metrics.render(), content_type=CONTENT_TYPE_LATEST)
+
     def readiness(self, request):
         # Connect to each database
         try:
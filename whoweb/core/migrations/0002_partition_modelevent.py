@@ -0,0 +1,138 @@
+from django.db import migrations, models
+
+# The existing rows become the first partition. Attaching a table scans it under
+# an exclusive lock unless a valid constraint already proves its rows fit the
+# partition; validating one first only blocks schema changes, not writes.
+BOUND_SQL = """
+DO $$
+BEGIN
+    EXECUTE format(
+        'ALTER TABLE core_modelevent ADD CONSTRAINT core_modelevent_legacy_bound '
+        'CHECK (created < %L) NOT VALID',
+        (date_trunc('month', now() AT TIME ZONE 'UTC') + interval '1 month')
+        AT TIME ZONE 'UTC'
+    );
+END $$;
+"""
+
+VALIDATE_BOUND_SQL = """
+ALTER TABLE core_modelevent VALIDATE CONSTRAINT core_modelevent_legacy_bound;
+"""
+
+DROP_BOUND_SQL = """
+ALTER TABLE core_modelevent DROP CONSTRAINT IF EXISTS core_modelevent_legacy_bound;
+"""
+
+# Attaching also builds, under the same lock, every index of the partitioned table
+# the legacy rows don't already have. Build them beforehand without blocking
+# writes, for the primary key and the per-object lookup.
+LEGACY_INDEXES_SQL = [
+    """
+    CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS core_modelevent_legacy_key
+        ON core_modelevent (id, created);
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS core_modelevent_legacy_ref_idx
+        ON core_modelevent (content_type_id, object_id, created);
+    """,
+]
+
+DROP_LEGACY_INDEXES_SQL = [
+    "DROP INDEX CONCURRENTLY IF EXISTS core_modelevent_legacy_ref_idx;",
+    "DROP INDEX CONCURRENTLY IF EXISTS core_modelevent_legacy_key;",
+]
+
+PARTITION_SQL = """
+BEGIN;
+ALTER TABLE core_modelevent RENAME TO core_modelevent_legacy;
+ALTER TABLE core_modelevent_legacy DROP CONSTRAINT core_modelevent_pkey;
+ALTER TABLE core_modelevent_legacy
+    ADD CONSTRAINT core_modelevent_legacy_pkey
+    PRIMARY KEY USING INDEX core_modelevent_legacy_key;
+CREATE TABLE core_modelevent (
+    LIKE core_modelevent_legacy INCLUDING DEFAULTS INCLUDING CONSTRAINTS
+) PARTITION BY RANGE (created);
+ALTER TABLE core_modelevent DROP CONSTRAINT core_modelevent_legacy_bound;
+ALTER SEQUENCE core_modelevent_id_seq OWNED BY core_modelevent.id;
+ALTER TABLE core_modelevent ADD PRIMARY KEY (id, created);
+ALTER TABLE core_modelevent
+    ADD CONSTRAINT core_modelevent_content_type_id_fk
+    FOREIGN KEY (content_type_id) REFERENCES django_content_type (id)
+    DEFERRABLE INITIALLY DEFERRED;
+CREATE INDEX core_modelevent_content_type_id_part_idx
+    ON core_modelevent (content_type_id);
+CREATE INDEX core_modelevent_ref_idx
+    ON ONLY core_modelevent (content_type_id, object_id, created);
+DO $$
+DECLARE
+    month timestamp := date_trunc('month', now() AT TIME ZONE 'UTC');
+BEGIN
+    EXECUTE format(
+        'ALTER TABLE core_modelevent ATTACH PARTITION core_modelevent_legacy '
+        'FOR VALUES FROM (MINVALUE) TO (%L)',
+        (month + interval '1 month') AT TIME ZONE 'UTC'
+    );
+    ALTER INDEX core_modelevent_ref_idx
+        ATTACH PARTITION core_modelevent_legacy_ref_idx;
+    FOR i IN 1..3 LOOP
+        month := month + interval '1 month';
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF core_modelevent FOR VALUES FROM (%L) TO (%L)',
+            'core_modelevent_p' || to_char(month, 'YYYYMM'),
+            month AT TIME ZONE 'UTC',
+            (month + interval '1 month') AT TIME ZONE 'UTC'
+        );
+    END LOOP;
+END $$;
+ALTER TABLE core_modelevent_legacy DROP CONSTRAINT core_modelevent_legacy_bound;
+COMMIT;
+"""
+
+UNPARTITION_SQL = """
+BEGIN;
+CREATE TABLE core_modelevent_unpartitioned (
+    LIKE core_modelevent INCLUDING DEFAULTS INCLUDING CONSTRAINTS
+);
+INSERT INTO core_modelevent_unpartitioned SELECT * FROM core_modelevent;
+ALTER SEQUENCE core_modelevent_id_seq OWNED BY core_modelevent_unpartitioned.id;
+DROP TABLE core_modelevent;
+ALTER TABLE core_modelevent_unpartitioned RENAME TO core_modelevent;
+ALTER TABLE core_modelevent ADD PRIMARY KEY (id);
+ALTER TABLE core_modelevent
+    ADD CONSTRAINT core_modelevent_content_type_id_fk
+    FOREIGN KEY (content_type_id) REFERENCES django_content_type (id)
+    DEFERRABLE INITIALLY DEFERRED;
+CREATE INDEX core_modelevent_content_type_id_idx
+    ON core_modelevent (content_type_id);
+COMMIT;
+"""
+
+
+class Migration(migrations.Migration):
+    # Each step commits on its own, so validating doesn't hold the rename's lock,
+    # and indexes can be built concurrently.
+    atomic = False
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("core", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunSQL(BOUND_SQL, DROP_BOUND_SQL),
+        migrations.RunSQL(VALIDATE_BOUND_SQL, migrations.RunSQL.noop),
+        migrations.RunSQL(LEGACY_INDEXES_SQL, DROP_LEGACY_INDEXES_SQL),
+        migrations.RunSQL(PARTITION_SQL, UNPARTITION_SQL),
+        # Built on the partitions by PARTITION_SQL.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name="modelevent",
+                    index=models.Index(
+                        fields=["content_type", "object_id", "created"],
+                        name="core_modelevent_ref_idx",
+                    ),
+                ),
+            ]
+        ),
+    ]
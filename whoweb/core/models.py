@@ -1,11 +1,24 @@
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.postgres.fields import JSONField
+from django.conf import settings
 from django.db import models
 
 from model_utils.models import TimeStampedModel, TimeFramedModel
 from six import string_types
 
+from whoweb.core.eventlog import event_buffer, prepare_event_data
+from whoweb.core.partitions import writing_events
+
+
+class ModelEventQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        return writing_events(
+            lambda: super(ModelEventQuerySet, self).bulk_create(objs, *args, **kwargs),
+            [obj.created for obj in objs],
+        )
+
 
 class ModelEvent(TimeStampedModel, TimeFramedModel):
     message = models.TextField()
@@ -16,8 +29,22 @@ class ModelEvent(TimeStampedModel, TimeFramedModel):
     object_id = models.PositiveIntegerField(null=True)
     ref = GenericForeignKey()
 
+    objects = ModelEventQuerySet.as_manager()
+
     class Meta:
         verbose_name = "event"
+        indexes = [
+            models.Index(
+                fields=["content_type", "object_id", "created"],
+                name="core_modelevent_ref_idx",
+            )
+        ]
+
+    def save(self, *args, **kwargs):
+        # Events go to the partition of their month, created here if missing.
+        return writing_events(
+            lambda: super(ModelEvent, self).save(*args, **kwargs), [self.created]
+        )
 
 
 DEFAULT_REVERSE_NAME = "EVENT_REVERSE_NAME"
@@ -45,7 +72,14 @@ class EventLoggingModel(models.Model):
     class Meta:
         abstract = True
 
-    def log_event(self, evt, *, start=None, end=None, task=None, **data):
+    def log_event(self, evt, *, start=None, end=None, task=None, sync=False, **data):
+        """
+        Record an event against this object.
+
+        Events are buffered and written in batches unless `sync` is set or
+        EVENT_BUFFERING is off; pass `sync=True` for events that must be on
+        record before the caller carries on.
+        """
         if hasattr(task, "id"):
             data["task_id"] = task.id
         if isinstance(evt, string_types):
@@ -54,16 +88,15 @@ class EventLoggingModel(models.Model):
         else:
             code = evt[0]
             message = evt[1]
-        try:
-            ModelEvent.objects.create(
-                ref=self, code=code, message=message, start=start, end=end, data=data
-            )
-        except TypeError:
-            ModelEvent.objects.create(
-                ref=self,
-                code=code,
-                message=message,
-                start=start,
-                end=end,
-                data=str(data),
-            )
+        event = ModelEvent(
+            ref=self,
+            code=code,
+            message=message,
+            start=start,
+            end=end,
+            data=prepare_event_data(data),
+        )
+        if sync or not settings.EVENT_BUFFERING:
+            event.save()
+        else:
+            event_buffer.add(event)
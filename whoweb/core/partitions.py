@@ -0,0 +1,198 @@
+import gzip
+import re
+from datetime import datetime, timezone
+from tempfile import TemporaryFile
+from typing import Callable, Iterable, List, NamedTuple, Optional, TypeVar
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, OperationalError, connection, transaction
+from psycopg2 import errorcodes
+
+EVENT_TABLE = "core_modelevent"
+
+BOUND_RE = re.compile(r"TO \('([^']+?)([+-]\d\d)?(?::?(\d\d))?'\)")
+
+
+T = TypeVar("T")
+
+# How long a partition created on its own connection waits for the event table.
+PARTITION_LOCK_TIMEOUT = "2s"
+
+ARCHIVE_PAGE_SIZE = 2000
+
+
+class Partition(NamedTuple):
+    name: str
+    upper: Optional[datetime]
+
+
+def month_start(when: datetime, months=0) -> datetime:
+    index = when.year * 12 + when.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{EVENT_TABLE}_p{month:%Y%m}"
+
+
+def parse_upper_bound(bound: str) -> Optional[datetime]:
+    match = BOUND_RE.search(bound)
+    if not match:
+        return None  # unbounded
+    stamp, hours, minutes = match.groups()
+    upper = datetime.fromisoformat(stamp)
+    offset = f"{hours or '+00'}:{minutes or '00'}"
+    return datetime.fromisoformat(f"{upper.isoformat()}{offset}").astimezone(
+        timezone.utc
+    )
+
+
+def event_partitions(conn=connection) -> List[Partition]:
+    """Partitions of the event table, oldest first."""
+    with conn.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits
+            JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+            JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+            WHERE parent.relname = %s
+            """,
+            [EVENT_TABLE],
+        )
+        rows = cursor.fetchall()
+    partitions = []
+    for name, bound in rows:
+        upper = parse_upper_bound(bound)
+        partitions.append(Partition(name, upper))
+    return sorted(
+        partitions, key=lambda p: p.upper or datetime.max.replace(tzinfo=timezone.utc)
+    )
+
+
+def create_event_partition(month: datetime, conn=connection) -> bool:
+    """Create the partition holding events from `month`. False if it already exists."""
+    name = partition_name(month)
+    if name in {p.name for p in event_partitions(conn)}:
+        return False
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {conn.ops.quote_name(name)} "
+            f"PARTITION OF {EVENT_TABLE} "
+            f"FOR VALUES FROM (%s) TO (%s)",
+            [month, month_start(month, 1)],
+        )
+    return True
+
+
+def ensure_event_partitions(now: datetime, months_ahead=3) -> List[str]:
+    """Create any missing partitions from the current month through `months_ahead`."""
+    covered = max((p.upper for p in event_partitions() if p.upper), default=None)
+    created = []
+    for months in range(months_ahead + 1):
+        month = month_start(now, months)
+        if covered and month < covered:
+            continue
+        if create_event_partition(month):
+            created.append(partition_name(month))
+    return created
+
+
+def is_missing_partition(error: Exception) -> bool:
+    cause = error.__cause__
+    if getattr(cause, "pgcode", None) != errorcodes.CHECK_VIOLATION:
+        return False
+    return "no partition" in str(cause)
+
+
+def _create_partitions(months: Iterable[datetime], conn) -> None:
+    covered = max((p.upper for p in event_partitions(conn) if p.upper), default=None)
+    for month in months:
+        if not covered or month >= covered:
+            create_event_partition(month, conn)
+
+
+def _create_partitions_apart(months: Iterable[datetime], conn) -> None:
+    """
+    Create partitions in a transaction of their own on a copy of `conn`, waiting
+    at most PARTITION_LOCK_TIMEOUT for the event table.
+    """
+    own = conn.copy()
+    try:
+        # One transaction, so a pooled connection is held throughout and the
+        # lock timeout ends with it.
+        own.set_autocommit(False)
+        with own.cursor() as cursor:
+            cursor.execute(f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'")
+        _create_partitions(months, own)
+        own.commit()
+    finally:
+        own.close()
+
+
+def writing_events(write: Callable[[], T], created: Iterable[datetime]) -> T:
+    """
+    Run `write`, which inserts events created at `created`. When no partition
+    takes some of them, because manage_event_partitions hasn't run ahead of them,
+    create the partitions for their months and write again.
+
+    Creating a partition locks the whole event table until it commits, so inside
+    a transaction the partitions are created on a connection of their own. If
+    that can't get the lock, because this transaction already wrote events,
+    they are created here instead.
+    """
+    try:
+        with transaction.atomic():
+            return write()
+    except IntegrityError as e:
+        if not is_missing_partition(e):
+            raise
+    months = sorted({month_start(when) for when in created})
+    if not connection.in_atomic_block:
+        _create_partitions(months, connection)
+        return write()
+    try:
+        _create_partitions_apart(months, connection)
+    except OperationalError:
+        _create_partitions(months, connection)
+    return write()
+
+
+def archive_event_partition(name: str, storage=default_storage) -> str:
+    """
+    Write a partition's rows to storage as gzipped json lines, paging through
+    them by primary key.
+    """
+    path = f"events/archive/{name}.jsonl.gz"
+    query = (
+        f"SELECT t.id, row_to_json(t)::text FROM {connection.ops.quote_name(name)} t "
+        f"WHERE t.id > %s ORDER BY t.id LIMIT %s"
+    )
+    with TemporaryFile() as tmp:
+        with gzip.GzipFile(fileobj=tmp, mode="wb") as gz:
+            last = 0
+            with connection.cursor() as cursor:
+                while True:
+                    cursor.execute(query, [last, ARCHIVE_PAGE_SIZE])
+                    rows = cursor.fetchall()
+                    if not rows:
+                        break
+                    gz.writelines(row.encode("utf-8") + b"\n" for _, row in rows)
+                    last = rows[-1][0]
+        tmp.seek(0)
+        return storage.save(path, File(tmp))
+
+
+def drop_event_partition(name: str):
+    with connection.cursor() as cursor:
+        # Flush deferred content type checks on rows written in this transaction.
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(
+            f"ALTER TABLE {EVENT_TABLE} DETACH PARTITION {connection.ops.quote_name(name)}"
+        )
+        cursor.execute(f"DROP TABLE {connection.ops.quote_name(name)}")
+
+
+def expired_event_partitions(cutoff: datetime) -> List[Partition]:
+    return [p for p in event_partitions() if p.upper and p.upper <= cutoff]
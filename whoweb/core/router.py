@@ -3,12 +3,19 @@ from __future__ import unicode_literals
 import json
 import uuid
 from datetime import timedelta
+from functools import partial
 
 import requests
 from bson import json_util
 from django.conf import settings
 from requests_cache import CachedSession
 
+from whoweb.core.coalescing import SHARED, fingerprint, singleflight
+from whoweb.core.hedging import hedged
+from whoweb.core.limits import derive_guard
+from whoweb.core.metrics import count_cache, timed
+from whoweb.core.tracing import current_span, traced
+
 GET = requests.get
 POST = requests.post
 
@@ -21,6 +28,8 @@ class Requestor(object):
         if "json" in kwargs and not "data" in kwargs:
             kwargs["data"] = json.dumps(kwargs.pop("json"), default=encoder)
         r = requestfunc(url, params=params, **kwargs)
+        if hasattr(r, "from_cache"):
+            count_cache("http", r.from_cache)
         r.raise_for_status()
         if r.content:
             return r.json(object_hook=json_util.object_hook)
@@ -29,14 +38,29 @@ class Requestor(object):
     def request(cls, method, url, params=None, cache=False, **kwargs):
         kwargs.setdefault("headers", {})
         kwargs["headers"]["X-Request-Id"] = kwargs.pop("request_id", str(uuid.uuid4()))
+        hedge = kwargs.pop("hedge", None)
+        coalesce = kwargs.pop("coalesce", None)
         producer = kwargs.pop("request_producer", None)
         if producer:
             kwargs["headers"]["X-Request-Producer"] = producer
+        span = current_span()
+        if span is not None:
+            kwargs["headers"]["X-Trace-Id"] = span.trace_id
 
         if cache:
             return cls.with_cache(method, url, params=params, **kwargs)
+        if hedge in settings.HEDGE_ROUTES:
+            call = partial(hedged, hedge, cls._request, method, url, params, **kwargs)
         else:
-            return cls._request(method, url, params=params, **kwargs)
+            call = partial(cls._request, method, url, params=params, **kwargs)
+        if coalesce:
+            key = fingerprint(
+                method.__name__, url, params, kwargs.get("json"), kwargs.get("data")
+            )
+            return singleflight(
+                key, call, shared=coalesce == SHARED, timeout=kwargs.get("timeout", 30),
+            )
+        return call()
 
     @classmethod
     def with_cache(cls, method, url, cache_expires=None, **kwargs):
@@ -73,20 +97,33 @@ class Router(object):
         )
 
     # xperdata routes
+    @traced()
+    @timed()
     def unified_search(self, **kwargs):
-        return self.xperdata("unified_search", POST, **kwargs)
+        return self.xperdata("unified_search", POST, hedge="unified_search", **kwargs)
 
+    @traced()
+    @timed()
     def profile_lookup(self, **kwargs):
-        return self.xperdata("2017-09-29/unified_profile", POST, **kwargs)
+        return self.xperdata(
+            "2017-09-29/unified_profile", POST, hedge="profile_lookup", **kwargs
+        )
 
     # derive routes
+    @traced()
+    @timed()
     def derive_email(self, **kwargs):
-        return self.derive_service("contact", GET, **kwargs)
+        with derive_guard.slot():
+            return self.derive_service("contact", GET, **kwargs)
 
+    @traced()
+    @timed()
     def update_validations(self, **kwargs):
         return self.derive_service("validation", POST, **kwargs)
 
     # xperweb routes
+    @traced()
+    @timed()
     def make_exportable_invite_key(self, **kwargs):
         return self.xperweb(
             "internal/invite/keys",
@@ -96,6 +133,8 @@ class Router(object):
             json=kwargs,
         )
 
+    @traced()
+    @timed()
     def alert_xperweb_export_completion(self, idempotency_key, amount, **kwargs):
         return self.xperweb(
             "internal/export/settleup",
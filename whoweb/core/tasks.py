@@ -0,0 +1,8 @@
+from celery import shared_task
+from django.conf import settings
+from django.core.management import call_command
+
+
+@shared_task(ignore_result=True)
+def manage_event_partitions():
+    call_command("manage_event_partitions", archive=settings.EVENT_RETENTION_ARCHIVE)
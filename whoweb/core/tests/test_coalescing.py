@@ -0,0 +1,103 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+from django.core.cache import cache
+
+from whoweb.core.coalescing import LOCAL, SHARED, fingerprint, singleflight
+from whoweb.core.router import router
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+class Upstream(object):
+    def __init__(self, delay=0.1, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise ValueError("upstream")
+        return {"total_results": 7, "results": []}
+
+
+def run_concurrently(fn, times=8):
+    with ThreadPoolExecutor(max_workers=times) as pool:
+        return [pool.submit(fn) for _ in range(times)]
+
+
+def test_fingerprint_is_canonical():
+    assert fingerprint("post", {"a": 1, "b": [1, 2]}) == fingerprint(
+        "post", {"b": [1, 2], "a": 1}
+    )
+    assert fingerprint("post", {"a": 1}) != fingerprint("post", {"a": 2})
+
+
+def test_concurrent_calls_share_one_call():
+    upstream = Upstream()
+    futures = run_concurrently(lambda: singleflight("key", upstream))
+    results = [f.result() for f in futures]
+    assert upstream.calls == 1
+    assert all(r == {"total_results": 7, "results": []} for r in results)
+    assert len({id(r) for r in results}) == len(results)  # each caller gets a copy
+
+
+def test_errors_reach_every_waiter():
+    upstream = Upstream(fail=True)
+    futures = run_concurrently(lambda: singleflight("key", upstream))
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result()
+    assert upstream.calls == 1
+
+
+def test_shared_calls_wait_on_result_key(settings):
+    settings.SINGLEFLIGHT_RESULT_TTL = 60
+    upstream = Upstream(delay=0)
+    # another process holds the lock and publishes its result
+    cache.add("singleflight-key-lock", "other", 30)
+    timer = threading.Timer(
+        0.1, cache.set, args=("singleflight-key", {"total_results": 3}, 60)
+    )
+    timer.start()
+    assert singleflight("key", upstream, shared=True) == {"total_results": 3}
+    assert upstream.calls == 0
+
+
+def test_shared_calls_take_over_from_failed_leader():
+    upstream = Upstream(delay=0)
+    cache.add("singleflight-key-lock", "other", 30)
+    threading.Timer(0.1, cache.delete, args=("singleflight-key-lock",)).start()
+    assert singleflight("key", upstream, shared=True)["total_results"] == 7
+    assert upstream.calls == 1
+    assert cache.get("singleflight-key-lock") is None
+
+
+@patch("whoweb.core.router.Requestor._request")
+def test_router_coalesces_identical_requests(request_mock):
+    upstream = Upstream()
+    request_mock.side_effect = upstream
+    futures = run_concurrently(
+        lambda: router.unified_search(json={"filters": {"limit": 1}}, coalesce=LOCAL)
+    )
+    futures += run_concurrently(
+        lambda: router.unified_search(json={"filters": {"limit": 2}}, coalesce=SHARED)
+    )
+    assert [f.result()["total_results"] for f in futures] == [7] * 16
+    assert upstream.calls == 2
+
+    router.unified_search(json={"filters": {"limit": 1}})
+    router.unified_search(json={"filters": {"limit": 1}})
+    assert upstream.calls == 4
@@ -0,0 +1,89 @@
+import pytest
+from celery import shared_task
+from django.db import transaction
+
+from whoweb.core.eventlog import event_buffer, prepare_event_data
+from whoweb.core.models import ModelEvent
+from whoweb.search.events import GENERATING_PAGES, FINALIZING_LOCKED
+from whoweb.search.tests.factories import SearchExportFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def buffered(settings):
+    settings.EVENT_BUFFERING = True
+    settings.EVENT_BUFFER_SIZE = 3
+    settings.EVENT_BUFFER_MAX_AGE = 60
+    yield event_buffer
+    event_buffer.flush()
+
+
+@shared_task
+def log_events_task(export_pk):
+    export = SearchExportFactory._meta.model.objects.get(pk=export_pk)
+    export.log_event(GENERATING_PAGES)
+    export.log_event(GENERATING_PAGES)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_buffered_events_flush_on_size(buffered):
+    export = SearchExportFactory()
+    export.log_event(GENERATING_PAGES)
+    export.log_event(GENERATING_PAGES, data={"page": 1})
+    assert export.events.count() == 0
+    assert len(buffered) == 2
+
+    export.log_event(GENERATING_PAGES)
+    assert export.events.count() == 3
+    assert len(buffered) == 0
+    assert export.events.filter(code=GENERATING_PAGES[0]).count() == 3
+
+
+@pytest.mark.django_db(transaction=True)
+def test_buffered_events_wait_for_transaction(buffered):
+    export = SearchExportFactory()
+    with pytest.raises(ValueError), transaction.atomic():
+        for _ in range(4):
+            export.log_event(GENERATING_PAGES)
+        raise ValueError
+    assert export.events.count() == 0
+    assert len(buffered) == 4
+
+    export.log_event(GENERATING_PAGES)
+    assert export.events.count() == 5
+    assert len(buffered) == 0
+
+
+def test_buffered_events_flush_at_task_end(buffered, settings):
+    settings.CELERY_TASK_ALWAYS_EAGER = True
+    export = SearchExportFactory()
+    log_events_task.delay(export.pk)
+    assert export.events.count() == 2
+
+
+def test_sync_events_skip_buffer(buffered):
+    export = SearchExportFactory()
+    export.log_event(FINALIZING_LOCKED, sync=True)
+    assert export.events.count() == 1
+    assert len(buffered) == 0
+
+
+def test_prepare_event_data(settings):
+    settings.EVENT_DATA_MAX_LENGTH = 50
+    settings.EVENT_LARGE_DATA_SAMPLE_RATE = 0
+    assert prepare_event_data({"page": 1}) == {"page": 1}
+    assert prepare_event_data({"obj": object}).startswith("{'obj': ")
+
+    truncated = prepare_event_data({"signatures": "x" * 200})
+    assert truncated["truncated"] > 200
+    assert len(truncated["preview"]) == 50
+
+    settings.EVENT_LARGE_DATA_SAMPLE_RATE = 1
+    assert prepare_event_data({"signatures": "x" * 200}) == {"signatures": "x" * 200}
+
+
+def test_unbuffered_by_default():
+    export = SearchExportFactory()
+    export.log_event(GENERATING_PAGES)
+    assert ModelEvent.objects.filter(object_id=export.pk).count() == 1
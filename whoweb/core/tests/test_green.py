@@ -0,0 +1,69 @@
+import time
+from types import SimpleNamespace
+
+import gevent
+import psycopg2
+import pytest
+from celery.exceptions import WorkerShutdown
+from django.db import connection
+from gevent import events
+from psycopg2 import extensions
+
+from config.celery_app import app
+from whoweb.core import green
+from whoweb.core.green import make_psycopg_green
+
+
+@pytest.fixture
+def green_psycopg():
+    make_psycopg_green()
+    yield
+    extensions.set_wait_callback(None)
+
+
+def test_green_connections_wait_cooperatively(green_psycopg):
+    params = connection.get_connection_params()
+
+    def sleep():
+        with psycopg2.connect(**params) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("select pg_sleep(0.5)")
+        conn.close()
+
+    started = time.perf_counter()
+    gevent.joinall([gevent.spawn(sleep) for _ in range(3)], raise_error=True)
+    assert time.perf_counter() - started < 1.0
+
+
+@pytest.fixture
+def consumed_queues(monkeypatch):
+    queues = app.amqp.queues
+
+    def consume(*names):
+        monkeypatch.setattr(queues, "_consume_from", {n: queues[n] for n in names})
+        return SimpleNamespace(app=app)
+
+    monkeypatch.setattr(green, "is_green", lambda: True)
+    monkeypatch.setattr(green, "make_psycopg_green", lambda: None)
+    monkeypatch.setattr(events, "subscribers", [])
+    return consume
+
+
+def test_cpu_bound_tasks_stay_off_the_low_queue():
+    routed = dict(green.routed_cpu_bound_tasks(app))
+
+    assert "whoweb.search.tasks.finalize_page" in routed
+    assert "whoweb_low" not in routed.values()
+
+
+def test_green_worker_starts_on_the_low_queue(consumed_queues):
+    green.setup_green_worker(sender=consumed_queues("whoweb_low"))
+
+    assert events.subscribers == [green.count_blocked_loop]
+
+
+def test_green_worker_refuses_queues_of_cpu_bound_tasks(consumed_queues):
+    with pytest.raises(WorkerShutdown, match="finalize_page"):
+        green.setup_green_worker(
+            sender=consumed_queues("whoweb_low", app.conf.task_default_queue)
+        )
@@ -0,0 +1,73 @@
+import time
+from unittest.mock import patch
+
+import pytest
+
+from whoweb.core import hedging
+from whoweb.core.router import router
+
+
+@pytest.fixture(autouse=True)
+def fresh_policies(settings):
+    settings.HEDGE_INITIAL_DELAY = 0.01
+    settings.HEDGE_BUDGET = 0
+    hedging.policies.clear()
+    yield
+    hedging.policies.clear()
+
+
+def slow_unless_hedged(delay=0.5, fail=False):
+    def request(headers=None):
+        hedge = bool((headers or {}).get(hedging.HEDGE_HEADER))
+        if not hedge:
+            time.sleep(delay)
+        if fail:
+            raise ValueError("hedge" if hedge else "primary")
+        return "hedge" if hedge else "primary"
+
+    return request
+
+
+def test_hedge_answers_for_slow_primary():
+    started = time.perf_counter()
+    assert hedging.hedged("test", slow_unless_hedged(), headers={}) == "hedge"
+    assert time.perf_counter() - started < 0.4
+
+
+def test_hedging_stays_within_budget():
+    request = slow_unless_hedged(delay=0.05)
+    assert hedging.hedged("test", request, headers={}) == "hedge"
+    assert hedging.hedged("test", request, headers={}) == "primary"
+
+
+def test_fast_calls_are_not_hedged():
+    assert hedging.hedged("test", slow_unless_hedged(delay=0), headers={}) == "primary"
+    assert hedging.policies["test"].tokens == 1
+
+
+def test_failed_attempts_raise_primary_error():
+    with pytest.raises(ValueError, match="primary"):
+        hedging.hedged("test", slow_unless_hedged(delay=0.05, fail=True), headers={})
+
+
+def test_hedge_delay_follows_latency_percentile(settings):
+    settings.HEDGE_PERCENTILE = 90
+    policy = hedging.policies["test"]
+    for n in range(100):
+        policy.observe(n / 100)
+    assert policy.delay() == 0.9
+    settings.HEDGE_MIN_DELAY = 1
+    assert policy.delay() == 1
+
+
+@patch("whoweb.core.router.Requestor._request")
+@patch("whoweb.core.router.hedged")
+def test_only_enabled_routes_are_hedged(hedged_mock, request_mock, settings):
+    settings.HEDGE_ROUTES = []
+    router.unified_search(json={})
+    hedged_mock.assert_not_called()
+    settings.HEDGE_ROUTES = ["unified_search"]
+    router.unified_search(json={})
+    router.derive_email(params={})
+    assert hedged_mock.call_count == 1
+    assert hedged_mock.call_args[0][0] == "unified_search"
@@ -0,0 +1,119 @@
+from unittest.mock import Mock, patch
+
+import pytest
+from django.core.cache import cache
+from requests import HTTPError, Timeout
+
+from whoweb.core.exceptions import ServiceOverloaded
+from whoweb.core.limits import AdaptiveLimiter, CircuitBreaker, derive_guard
+from whoweb.core.router import router
+from whoweb.core.utils import CacheSemaphore
+
+
+@pytest.fixture(autouse=True)
+def clean_cache(settings):
+    settings.DERIVE_LIMIT_INITIAL = 2
+    settings.DERIVE_LIMIT_MIN = 1
+    settings.DERIVE_BREAKER_MIN_CALLS = 4
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def test_limiter_grows_additively_and_backs_off_once_per_interval():
+    limiter = AdaptiveLimiter(
+        "test", initial=4, minimum=1, maximum=5, latency_target=1, backoff=0.5
+    )
+    limiter.record(0.1)
+    assert limiter.limit == 4.25
+    for _ in range(4):
+        limiter.record(0.1)
+    assert limiter.limit == 5
+
+    limiter.record(2)
+    assert limiter.limit == 2.5
+    limiter.record(0.1, ok=False)
+    assert limiter.limit == 2.5
+
+
+def test_breaker_opens_probes_and_closes():
+    breaker = CircuitBreaker(
+        "test", failure_ratio=0.5, min_calls=4, window=60, cooldown=30
+    )
+    for ok in (True, False, True):
+        breaker.record(ok)
+    assert breaker.allow()
+    breaker.record(ok=False)
+    assert not breaker.allow()
+    assert 0 < breaker.retry_after <= 30
+
+    cache.set("test-open", 0, None)  # cooldown elapsed
+    assert breaker.allow()
+    assert not breaker.allow()  # one probe at a time
+    breaker.record(ok=False)
+    assert not breaker.allow()
+
+    cache.set("test-open", 0, None)
+    assert breaker.allow()
+    breaker.record(ok=True)
+    assert breaker.open_until is None
+    assert breaker.allow()
+
+
+def test_breaker_ignores_calls_started_before_the_probe():
+    settings = dict(failure_ratio=0.5, min_calls=1, window=60, cooldown=30)
+    stale = CircuitBreaker("test", **settings)
+    assert stale.allow()
+    stale.record(ok=False)
+
+    cache.set("test-open", 0, None)
+    probe = CircuitBreaker("test", **settings)
+    assert probe.allow()
+    stale.record(ok=True)
+    assert probe.open_until is not None
+    probe.record(ok=True)
+    assert probe.open_until is None
+
+
+def test_semaphore_counts_holders():
+    first, second = CacheSemaphore("test", limit=1), CacheSemaphore("test", limit=1)
+    assert first.acquire()
+    assert not second.acquire()
+    assert cache.get("test") == 1
+    first.release()
+    first.release()
+    assert cache.get("test") == 0
+    assert second.acquire()
+
+
+@patch("whoweb.core.router.Requestor.request")
+def test_derive_email_rejected_at_capacity(request_mock):
+    with derive_guard.slot(), derive_guard.slot():
+        with pytest.raises(ServiceOverloaded) as exc:
+            router.derive_email(params={})
+    assert exc.value.status_code == 503
+    request_mock.assert_not_called()
+    router.derive_email(params={})
+    request_mock.assert_called_once()
+
+
+@patch("whoweb.core.router.Requestor.request")
+def test_derive_email_failures_open_breaker(request_mock):
+    request_mock.side_effect = Timeout()
+    for _ in range(4):
+        with pytest.raises(Timeout):
+            router.derive_email(params={})
+    with pytest.raises(ServiceOverloaded) as exc:
+        router.derive_email(params={})
+    assert exc.value.retry_after > 0
+    assert request_mock.call_count == 4
+    assert derive_guard.limiter.limit == 1.5
+
+
+@patch("whoweb.core.router.Requestor.request")
+def test_client_errors_do_not_count_as_failures(request_mock):
+    request_mock.side_effect = HTTPError(response=Mock(status_code=404))
+    for _ in range(5):
+        with pytest.raises(HTTPError):
+            router.derive_email(params={})
+    assert derive_guard.breaker.allow()
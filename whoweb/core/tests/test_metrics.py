@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from celery import shared_task
+from prometheus_client import REGISTRY
+
+from whoweb.core import metrics
+from whoweb.search.models import ScrollSearch
+
+pytestmark = pytest.mark.django_db
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@shared_task
+def timed_task():
+    return 1
+
+
+def test_timed_records_latency_by_outcome():
+    @metrics.timed("test_route")
+    def route(fail=False):
+        if fail:
+            raise ValueError()
+        return 1
+
+    count = "whoweb_router_request_seconds_count"
+    ok = sample(count, route="test_route", outcome="ok")
+    error = sample(count, route="test_route", outcome="error")
+    assert route() == 1
+    with pytest.raises(ValueError):
+        route(fail=True)
+    assert sample(count, route="test_route", outcome="ok") == ok + 1
+    assert sample(count, route="test_route", outcome="error") == error + 1
+
+
+def test_task_runtime_is_recorded(settings):
+    settings.CELERY_TASK_ALWAYS_EAGER = True
+    name = "whoweb_celery_task_seconds_count"
+    task = "whoweb.core.tests.test_metrics.timed_task"
+    before = sample(name, task=task, state="SUCCESS")
+    timed_task.delay()
+    assert sample(name, task=task, state="SUCCESS") == before + 1
+
+
+def test_publish_stamp_waits_for_eta():
+    headers = {}
+    metrics.stamp_published(headers=headers)
+    assert headers[metrics.PUBLISHED_AT] == pytest.approx(
+        datetime.now().timestamp(), abs=5
+    )
+
+    eta = datetime.now(timezone.utc) + timedelta(minutes=10)
+    headers = {"eta": eta.isoformat()}
+    metrics.stamp_published(headers=headers)
+    assert headers[metrics.PUBLISHED_AT] == pytest.approx(eta.timestamp())
+
+
+def test_scroll_page_cache_counts_hits():
+    search = ScrollSearch.objects.create(page_size=5)
+    search.set_web_ids(["wp:1"], page=0)
+    hits = sample("whoweb_cache_requests_total", cache="scroll_page", result="hit")
+    assert search.get_ids_for_page(0) == ["wp:1"]
+    assert (
+        sample("whoweb_cache_requests_total", cache="scroll_page", result="hit")
+        == hits + 1
+    )
+
+
+def test_metrics_endpoint(client, settings):
+    metrics.count_rows("derive", 3)
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp["Content-Type"].startswith("text/plain")
+    body = resp.content.decode()
+    assert 'whoweb_export_rows_total{stage="derive"}' in body
+    assert "whoweb_router_request_seconds_bucket" in body
+
+    settings.METRICS_ENABLED = False
+    assert client.get("/metrics").status_code == 404
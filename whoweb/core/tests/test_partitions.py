@@ -0,0 +1,121 @@
+import gzip
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest.mock import patch
+
+import pytest
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from whoweb.contrib.postgres.pooled.base import pools
+from whoweb.core.models import ModelEvent
+from whoweb.core.partitions import (
+    _create_partitions_apart,
+    event_partitions,
+    month_start,
+    partition_name,
+)
+from whoweb.search.events import GENERATING_PAGES
+from whoweb.search.tests.factories import SearchExportFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def test_events_are_partitioned_by_month():
+    now = timezone.now()
+    names = [p.name for p in event_partitions()]
+    assert names[0] == "core_modelevent_legacy"
+    assert partition_name(month_start(now, 3)) in names
+
+    export = SearchExportFactory()
+    export.log_event(GENERATING_PAGES)
+    ModelEvent.objects.create(
+        ref=export, message="next month", created=month_start(now, 2)
+    )
+    assert export.events.count() == 2
+
+
+def test_events_beyond_partitions_create_theirs():
+    export = SearchExportFactory()
+    later = month_start(timezone.now(), 9)
+    ModelEvent.objects.create(ref=export, message="later", created=later)
+    ModelEvent.objects.bulk_create(
+        [
+            ModelEvent(
+                ref=export, message="later still", created=month_start(later, 1)
+            ),
+            ModelEvent(ref=export, message="later", created=later),
+        ]
+    )
+
+    names = [p.name for p in event_partitions()]
+    assert names[-2:] == [partition_name(later), partition_name(month_start(later, 1))]
+    assert export.events.count() == 3
+
+
+def test_partitions_created_apart_leave_pooled_connection_clean(pooled):
+    conn = pooled(size=1)
+    month = datetime(2090, 1, 1, tzinfo=dt_timezone.utc)
+    name = partition_name(month)
+    try:
+        _create_partitions_apart([month], conn)
+        assert conn.connection is None
+        assert len(pools["pooled"].idle) == 1
+        assert name in {p.name for p in event_partitions(conn)}
+        with conn.cursor() as cursor:
+            cursor.execute("SHOW lock_timeout")
+            assert cursor.fetchone()[0] == "0"
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {name}")
+
+
+def test_manage_event_partitions_archives_expired(media_storage):
+    export = SearchExportFactory()
+    export.log_event(GENERATING_PAGES)
+    export.log_event(GENERATING_PAGES)
+    later = timezone.now() + timedelta(days=365)
+
+    with patch("django.utils.timezone.now", return_value=later), patch(
+        "whoweb.core.partitions.ARCHIVE_PAGE_SIZE", 1
+    ):
+        call_command("manage_event_partitions", retention_days=180, archive=True)
+
+    names = [p.name for p in event_partitions()]
+    assert "core_modelevent_legacy" not in names
+    assert names[-1] == partition_name(month_start(later, 3))
+    assert not export.events.exists()
+    with default_storage.open(
+        "events/archive/core_modelevent_legacy.jsonl.gz", "rb"
+    ) as f:
+        rows = [json.loads(line) for line in gzip.open(f)]
+    assert [row["code"] for row in rows] == [GENERATING_PAGES[0]] * 2
+    assert rows[0]["id"] < rows[1]["id"]
+    assert rows[0]["object_id"] == export.pk
+
+
+def test_manage_event_partitions_dry_run():
+    before = event_partitions()
+    with patch(
+        "django.utils.timezone.now", return_value=timezone.now() + timedelta(days=365),
+    ):
+        call_command("manage_event_partitions", dry_run=True, months_ahead=0)
+    assert {p.name for p in before} <= {p.name for p in event_partitions()}
+
+
+def test_admin_inline_pages_events(su, client):
+    client.force_login(su, backend="django.contrib.auth.backends.ModelBackend")
+    export = SearchExportFactory()
+    for i in range(30):
+        export.log_event(GENERATING_PAGES)
+    url = reverse("admin:search_searchexport_change", args=[export.pk])
+
+    first = client.get(url)
+    assert first.status_code == 200
+    assert first.content.count(b"<p>Generating pages.</p>") == 25
+    assert b"events_page=2" in first.content
+
+    second = client.get(url, {"events_page": 2})
+    assert second.content.count(b"<p>Generating pages.</p>") == 5
@@ -0,0 +1,152 @@
+from unittest.mock import patch
+
+import pytest
+from celery import shared_task
+from django.urls import reverse
+
+from whoweb.core import tracing
+from whoweb.core.admin import trace_waterfall
+from whoweb.core.models import ModelEvent
+from whoweb.core.router import router
+from whoweb.search.events import GENERATING_PAGES
+from whoweb.search.tests.factories import SearchExportFactory
+
+pytestmark = pytest.mark.django_db
+
+
+class CollectingSink(tracing.SpanSink):
+    spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+
+@pytest.fixture
+def collected(settings):
+    settings.TRACING_SINK = "whoweb.core.tests.test_tracing.CollectingSink"
+    settings.TRACING_SAMPLE_RATE = 1.0
+    CollectingSink.spans = []
+    yield CollectingSink.spans
+
+
+@shared_task
+def traced_parent_task():
+    router.derive_email(params={"first": "a"})
+    traced_child_task.delay()
+
+
+@shared_task
+def traced_child_task():
+    return 1
+
+
+@shared_task(bind=True)
+def traced_replaced_task(self):
+    return self.replace(traced_child_task.si())
+
+
+def test_spans_outside_a_trace_are_not_recorded(collected):
+    with tracing.span("untraced") as span:
+        assert span is None
+    assert collected == []
+
+
+def test_spans_nest_within_a_trace(collected):
+    export = SearchExportFactory()
+    headers = tracing.trace_headers(export)
+    assert headers[tracing.TRACE_REF] == f"search.searchexport:{export.pk}"
+
+    with tracing.span("outer", headers=headers) as outer:
+        with tracing.span("inner", kind="client") as inner:
+            assert tracing.current_span() is inner
+        assert tracing.current_span() is outer
+    assert tracing.current_span() is None
+
+    assert [s.name for s in collected] == ["inner", "outer"]
+    assert inner.trace_id == outer.trace_id == headers[tracing.TRACE_ID]
+    assert inner.parent_id == outer.span_id
+    assert outer.parent_id is None
+    assert inner.start <= inner.end <= outer.end
+
+
+def test_span_records_errors(collected):
+    headers = tracing.trace_headers(SearchExportFactory())
+    with pytest.raises(ValueError):
+        with tracing.span("failing", headers=headers):
+            raise ValueError("nope")
+    assert collected[0].status == "error"
+    assert "nope" in collected[0].attrs["error"]
+
+
+def test_trace_headers_honor_sampling(settings):
+    settings.TRACING_SAMPLE_RATE = 0
+    assert tracing.trace_headers(SearchExportFactory()) == {}
+
+
+def test_inject_headers_keeps_explicit_trace(collected):
+    headers = tracing.trace_headers(SearchExportFactory())
+    with tracing.span("publisher", headers=headers) as publisher:
+        message_headers = {}
+        tracing.inject_headers(headers=message_headers)
+        assert message_headers[tracing.TRACE_PARENT] == publisher.span_id
+
+        explicit = {tracing.TRACE_ID: "other", tracing.TRACE_REF: "x.y:1"}
+        tracing.inject_headers(headers=explicit)
+        assert explicit[tracing.TRACE_ID] == "other"
+
+
+@patch("whoweb.core.router.Requestor.request")
+def test_tasks_and_router_calls_record_spans(request_mock, settings, collected):
+    settings.CELERY_TASK_ALWAYS_EAGER = True
+    headers = tracing.trace_headers(SearchExportFactory())
+    traced_parent_task.apply(headers=headers)
+
+    spans = {span.name: span for span in collected}
+    parent = spans["whoweb.core.tests.test_tracing.traced_parent_task"]
+    child = spans["whoweb.core.tests.test_tracing.traced_child_task"]
+    call = spans["derive_email"]
+    assert parent.kind == "task"
+    assert call.kind == "client"
+    assert call.parent_id == child.parent_id == parent.span_id
+    assert {s.trace_id for s in collected} == {headers[tracing.TRACE_ID]}
+    assert tracing.current_span() is None
+
+
+def test_eagerly_replaced_tasks_keep_both_spans(settings, collected):
+    settings.CELERY_TASK_ALWAYS_EAGER = True
+    headers = tracing.trace_headers(SearchExportFactory())
+    traced_replaced_task.apply(headers=headers)
+
+    assert sorted(span.name.rsplit(".", 1)[-1] for span in collected) == [
+        "traced_child_task",
+        "traced_replaced_task",
+    ]
+    assert tracing.current_span() is None
+
+
+def test_model_event_sink_and_waterfall(su, client, settings):
+    settings.TRACING_SINK = "whoweb.core.tracing.ModelEventSink"
+    settings.TRACING_SAMPLE_RATE = 1.0
+    export = SearchExportFactory()
+    export.log_event(GENERATING_PAGES)
+    headers = tracing.trace_headers(export)
+    with tracing.span("whoweb.search.tasks.generate_pages", headers=headers):
+        with tracing.span("unified_search", kind="client"):
+            pass
+
+    spans = ModelEvent.objects.filter(object_id=export.pk, code=tracing.SPAN[0])
+    assert spans.count() == 2
+    span = spans.get(message="unified_search")
+    assert span.start is not None and span.end >= span.start
+    assert span.data["trace_id"] == headers[tracing.TRACE_ID]
+
+    html = trace_waterfall(export)
+    assert headers[tracing.TRACE_ID] in html
+    assert "generate_pages" in html
+
+    client.force_login(su, backend="django.contrib.auth.backends.ModelBackend")
+    resp = client.get(reverse("admin:search_searchexport_change", args=[export.pk]))
+    assert resp.status_code == 200
+    assert "unified_search" in resp.content.decode()
+    events = resp.context["inline_admin_formsets"][0].formset.get_queryset()
+    assert [e.code for e in events] == [GENERATING_PAGES[0]]
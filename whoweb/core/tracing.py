@@ -0,0 +1,261 @@
+"""
+Lightweight tracing. A trace is rooted at a model object, started with the celery
+headers from `trace_headers`, and follows the work it spawns: every celery task
+run and every traced router call inside it records a span, and tasks published
+from inside a span carry the trace on in their message headers.
+
+Finished spans go to the TRACING_SINK: by default they are logged, and the
+ModelEventSink records them as ModelEvents against the trace's root object.
+"""
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from whoweb.core.eventlog import event_buffer, prepare_event_data
+
+logger = logging.getLogger(__name__)
+
+SPAN = 10, "Trace span."
+
+TRACE_ID = "trace_id"
+TRACE_PARENT = "trace_parent"
+TRACE_REF = "trace_ref"
+TRACE_HEADERS = (TRACE_ID, TRACE_PARENT, TRACE_REF)
+
+
+class Span(object):
+    def __init__(self, name, trace_id, ref, parent_id=None, kind="internal", **attrs):
+        self.name = name
+        self.trace_id = trace_id
+        self.ref = ref
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attrs = attrs
+        self.span_id = uuid.uuid4().hex[:16]
+        self.status = "ok"
+        self.start = timezone.now()
+        self.end = None
+        self.duration = None
+        self._started = time.perf_counter()
+
+    def finish(self, status=None):
+        self.duration = time.perf_counter() - self._started
+        self.end = self.start + timedelta(seconds=self.duration)
+        if status:
+            self.status = status
+
+    def headers(self):
+        """Headers continuing this trace, with this span as parent."""
+        return {
+            TRACE_ID: self.trace_id,
+            TRACE_PARENT: self.span_id,
+            TRACE_REF: self.ref,
+        }
+
+    def as_dict(self):
+        return {
+            **self.attrs,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "kind": self.kind,
+            "status": self.status,
+            "duration": self.duration,
+        }
+
+
+class SpanSink(object):
+    def export(self, span: Span):
+        raise NotImplementedError
+
+
+class ModelEventSink(SpanSink):
+    """
+    Records spans as ModelEvents against the trace's root object, filling in the
+    event's start and end. Written through the event buffer like logged events.
+    """
+
+    def export(self, span):
+        from django.contrib.contenttypes.models import ContentType
+        from whoweb.core.models import ModelEvent
+
+        label, object_id = span.ref.rsplit(":", 1)
+        content_type = ContentType.objects.get_by_natural_key(*label.split("."))
+        event = ModelEvent(
+            content_type=content_type,
+            object_id=object_id,
+            code=SPAN[0],
+            message=span.name,
+            start=span.start,
+            end=span.end,
+            data=prepare_event_data(span.as_dict()),
+        )
+        if settings.EVENT_BUFFERING:
+            event_buffer.add(event)
+        else:
+            event.save()
+
+
+class LoggingSink(SpanSink):
+    """Logs spans as json lines, for shipping to an external collector."""
+
+    def export(self, span):
+        logger.info(
+            json.dumps(
+                {
+                    **span.as_dict(),
+                    "name": span.name,
+                    "ref": span.ref,
+                    "start": span.start.isoformat(),
+                    "end": span.end.isoformat(),
+                },
+                default=str,
+            )
+        )
+
+
+@lru_cache(maxsize=None)
+def get_sink(path) -> SpanSink:
+    return import_string(path)()
+
+
+def export_span(span):
+    if not settings.TRACING_SINK:
+        return
+    try:
+        get_sink(settings.TRACING_SINK).export(span)
+    except Exception:
+        logger.exception("Dropped span %s of trace %s.", span.name, span.trace_id)
+
+
+class _Context(threading.local):
+    def __init__(self):
+        self.stack = []
+        self.tasks = {}
+
+
+_context = _Context()
+
+
+def current_span():
+    if _context.stack:
+        return _context.stack[-1]
+
+
+def trace_headers(obj):
+    """
+    Celery headers starting a new trace rooted at `obj`, or none when tracing is
+    off or the trace falls outside TRACING_SAMPLE_RATE.
+    """
+    if not settings.TRACING_SINK or random.random() >= settings.TRACING_SAMPLE_RATE:
+        return {}
+    return {TRACE_ID: uuid.uuid4().hex, TRACE_REF: f"{obj._meta.label_lower}:{obj.pk}"}
+
+
+def start_span(name, kind="internal", headers=None, **attrs):
+    """
+    Open a span continuing the trace in `headers`, or else the current span's.
+    Outside of any trace this does nothing and returns None.
+    """
+    parent = current_span()
+    if headers and headers.get(TRACE_ID):
+        trace_id, ref = headers[TRACE_ID], headers[TRACE_REF]
+        parent_id = headers.get(TRACE_PARENT)
+    elif parent is not None:
+        trace_id, ref, parent_id = parent.trace_id, parent.ref, parent.span_id
+    else:
+        return None
+    span = Span(name, trace_id, ref, parent_id=parent_id, kind=kind, **attrs)
+    _context.stack.append(span)
+    return span
+
+
+def finish_span(span, status=None):
+    if span is None:
+        return
+    if span in _context.stack:
+        _context.stack.remove(span)
+    span.finish(status)
+    export_span(span)
+
+
+@contextmanager
+def span(name, kind="internal", **attrs):
+    current = start_span(name, kind=kind, **attrs)
+    status = None
+    try:
+        yield current
+    except Exception as e:
+        if current is not None:
+            current.attrs["error"] = repr(e)
+        status = "error"
+        raise
+    finally:
+        finish_span(current, status)
+
+
+def traced(name=None, kind="client"):
+    """Decorate a function to record a span for each call made inside a trace."""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _context.stack:
+                return func(*args, **kwargs)
+            with span(name or func.__name__, kind=kind):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# Celery signal receivers
+
+
+def request_headers(request):
+    """
+    Trace headers of a task request. Worker requests carry them as attributes,
+    eager ones under `headers`.
+    """
+    headers = dict(getattr(request, "headers", None) or {})
+    for key in TRACE_HEADERS:
+        value = getattr(request, key, None)
+        if value:
+            headers.setdefault(key, value)
+    return headers
+
+
+def inject_headers(headers=None, **kwargs):
+    current = current_span()
+    if current is not None and headers is not None and not headers.get(TRACE_ID):
+        headers.update(current.headers())
+
+
+def start_task_span(task_id=None, task=None, **kwargs):
+    current = start_span(
+        task.name, kind="task", headers=request_headers(task.request), task_id=task_id
+    )
+    if current is not None:
+        # Eagerly replaced tasks run their replacement under the same id.
+        _context.tasks.setdefault(task_id, []).append(current)
+
+
+def finish_task_span(task_id=None, state=None, **kwargs):
+    spans = _context.tasks.get(task_id)
+    if spans:
+        current = spans.pop()
+        if not spans:
+            del _context.tasks[task_id]
+        status = {"FAILURE": "error", "RETRY": "retry"}.get(state, "ok")
+        finish_span(current, status)
@@ -20,6 +20,45 @@ class IdempotentRequest(object):
         cache.delete(self.key)
 
 
+class CacheSemaphore(object):
+    """
+    Counting semaphore shared by every process using the cache, kept as a single
+    counter so acquiring or rejecting costs one or two cache round trips.
+    The counter expires ``timeout`` seconds after the last acquire, so slots leaked
+    by a crashed holder are given back once the semaphore goes quiet.
+    """
+
+    def __init__(self, key, limit, timeout=300):
+        self.key = key
+        self.limit = limit
+        self.timeout = timeout
+        self.held = False
+
+    def acquire(self):
+        try:
+            count = cache.incr(self.key)
+        except ValueError:  # no holders for a while
+            count = 1 if cache.add(self.key, 1, self.timeout) else cache.incr(self.key)
+        if count > self.limit:
+            self._decr()
+            return False
+        cache.touch(self.key, self.timeout)
+        self.held = True
+        return True
+
+    def release(self):
+        if self.held:
+            self._decr()
+            self.held = False
+
+    def _decr(self):
+        try:
+            if cache.decr(self.key) < 0:  # the counter expired under a holder
+                cache.delete(self.key)
+        except ValueError:
+            pass
+
+
 PERSONAL_DOMAINS = {
     "aol.com",
     "att.net",
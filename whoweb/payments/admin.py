@@ -110,6 +110,7 @@ class WKPlanAdmin(admin.ModelAdmin):
         "credits_per_work_email",
         "credits_per_personal_email",
         "credits_per_phone",
+        "export_scheduling_weight",
         "permission_group",
     )
     readonly_fields = (
@@ -0,0 +1,31 @@
+# Generated by Django 2.2.19 on 2026-10-18 23:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0034_auto_20201113_1309"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="wkplan",
+            name="export_scheduling_weight",
+            field=models.PositiveSmallIntegerField(
+                default=1,
+                help_text="Relative share of export page workers given to accounts on this plan when exports compete.",
+                verbose_name="Export Scheduling Weight",
+            ),
+        ),
+        migrations.AddField(
+            model_name="wkplanpreset",
+            name="export_scheduling_weight",
+            field=models.PositiveSmallIntegerField(
+                default=1,
+                help_text="Relative share of export page workers given to accounts on this plan when exports compete.",
+                verbose_name="Export Scheduling Weight",
+            ),
+        ),
+    ]
@@ -50,6 +50,11 @@ class AbstractPlanModel(ObscureIdMixin, models.Model):
         verbose_name="Credits per Phone Derivation",
         help_text="Number of credits charged for a service call returning any phone numbers.",
     )
+    export_scheduling_weight = models.PositiveSmallIntegerField(
+        default=1,
+        verbose_name="Export Scheduling Weight",
+        help_text="Relative share of export page workers given to accounts on this plan when exports compete.",
+    )
 
 
 class WKPlan(SoftDeletableModel, AbstractPlanModel):
@@ -130,6 +135,7 @@ class WKPlanPreset(AbstractPlanModel):
             credits_per_work_email=self.credits_per_work_email,
             credits_per_personal_email=self.credits_per_personal_email,
             credits_per_phone=self.credits_per_phone,
+            export_scheduling_weight=self.export_scheduling_weight,
         )
 
     def validate_items(self, items):
@@ -60,7 +60,7 @@ def test_charges_phone():
 
 
 def test_plan_preset_creates_plan():
-    plan_preset: WKPlanPreset = WKPlanPresetFactory()
+    plan_preset: WKPlanPreset = WKPlanPresetFactory(export_scheduling_weight=3)
     plan = plan_preset.create()
     assert plan_preset.permission_group == plan.permission_group
     assert plan_preset.credits_per_phone == plan.credits_per_phone
@@ -68,6 +68,7 @@ def test_plan_preset_creates_plan():
     assert plan_preset.credits_per_personal_email == plan.credits_per_personal_email
     assert plan_preset.credits_per_enrich == plan.credits_per_enrich
     assert plan_preset.marketing_name == plan.marketing_name
+    assert plan.export_scheduling_weight == 3
 
 
 def test_expire_all_remaining_credits(su):
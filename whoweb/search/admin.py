@@ -7,7 +7,6 @@ from django.contrib.admin import TabularInline
 from django.contrib.admin.options import IncorrectLookupParameters
 from django.contrib.humanize.templatetags.humanize import naturaltime
 from django.core.exceptions import ValidationError
-from django.db.models import Sum, Max, Case, When, DateTimeField, Value
 from django.shortcuts import redirect
 from django.template.defaultfilters import date
 from django.urls import reverse
@@ -16,12 +15,37 @@ from django.utils.safestring import mark_safe
 from django.utils.timezone import localtime
 from django.utils.translation import gettext_lazy as _
 
-from whoweb.core.admin import EventTabularInline
+from whoweb.core.admin import EventTabularInline, trace_waterfall
 from whoweb.search.events import ENQUEUED_FROM_ADMIN
-from whoweb.search.models import SearchExport, ScrollSearch, FilterValueList
+from whoweb.search.models import (
+    SearchExport,
+    ScrollSearch,
+    FilterValueList,
+    ExportWebhookDelivery,
+)
 from whoweb.search.models.export import SearchExportPage
 
-epoch = datetime.datetime(1970, 1, 1, 0, 0, 0, tzinfo=timezone.get_default_timezone())
+
+class ExportWebhookDeliveryInline(TabularInline):
+    model = ExportWebhookDelivery
+    fields = (
+        "url",
+        "page_num",
+        "batch",
+        "size",
+        "status",
+        "attempts",
+        "response_status",
+        "delivered_at",
+    )
+    readonly_fields = fields
+    extra = 0
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer("body")
+
+    def has_add_permission(self, request, obj=None):
+        return False
 
 
 class SearchExportPageInline(TabularInline):
@@ -78,6 +102,9 @@ class SearchExportPageAdmin(ActionsModelAdmin):
         "count",
         "pending_count",
         "progress_counter",
+        "scheduled_at",
+        "released_at",
+        "archived_at",
     )
     readonly_fields = fields
 
@@ -94,7 +121,7 @@ class SearchExportPageAdmin(ActionsModelAdmin):
 
 class LatestPageModificationFilter(admin.SimpleListFilter):
     title = "Latest Page Update Time"
-    parameter_name = "_latest_page_modified"
+    parameter_name = "latest_page_modified"
 
     def __init__(self, request, params, model, model_admin):
         self.field_generic = "%s__" % self.parameter_name
@@ -183,7 +210,7 @@ class ExportAdmin(ActionsModelAdmin):
         "billing_seat",
         "status",
         "rows_enqueued",
-        "latest_page_modified",
+        "latest_page_update",
         "progress_counter",
         "target",
         "rows_uploaded",
@@ -221,9 +248,10 @@ class ExportAdmin(ActionsModelAdmin):
                     "queue_priority",
                     "rows_enqueued",
                     "working_count",
-                    "latest_page_modified",
+                    "latest_page_update",
                     ("sent", "sent_at",),
                     "validation_list_id",
+                    "page_archive",
                 ),
             },
         ),
@@ -234,6 +262,7 @@ class ExportAdmin(ActionsModelAdmin):
                 "fields": (("charge", "notify", "on_trial"), "column_names",),
             },
         ),
+        ("Trace", {"classes": ("collapse",), "fields": ("trace",)}),
     )
     readonly_fields = (
         "sent",
@@ -242,61 +271,40 @@ class ExportAdmin(ActionsModelAdmin):
         "rows_enqueued",
         "rows_uploaded",
         "queue_priority",
-        "latest_page_modified",
+        "latest_page_update",
         "status_changed",
         "scroller",
         "column_names",
+        "page_archive",
+        "trace",
     )
-    inlines = [EventTabularInline, SearchExportPageInline]
+    inlines = [EventTabularInline, SearchExportPageInline, ExportWebhookDeliveryInline]
     actions_row = ("download", "download_json")
     actions_detail = ("run_publication_tasks", "download", "download_json")
     actions = ("store_validation_results", "compute_rows_uploaded")
 
-    def get_queryset(self, request):
-        return (
-            super()
-            .get_queryset(request)
-            .annotate(
-                _working_count=Sum("pages__progress_counter"),
-                _rows_enqueued=Sum("pages__pending_count"),
-                _page_modified=Max("pages__modified"),
-            )
-            .annotate(
-                _latest_page_modified=Case(
-                    When(_page_modified__isnull=False, then="_page_modified"),
-                    default=Value(epoch),  # sorts null to bottom
-                    output_field=DateTimeField(),
-                )
-            )
-        )
-
-    def working_count(self, obj):
-        return obj._working_count
-
-    working_count.short_description = "Working Rows"
-
-    def rows_enqueued(self, obj):
-        return obj._rows_enqueued
-
-    rows_enqueued.admin_order_field = "_rows_enqueued"
-
-    def latest_page_modified(self, obj):
-        return (
-            "n/a"
-            if obj._latest_page_modified == epoch
-            else "{} ({})".format(
-                date(localtime(obj._latest_page_modified), settings.DATETIME_FORMAT),
-                naturaltime(obj._latest_page_modified),
-            )
+    def latest_page_update(self, obj):
+        if obj.latest_page_modified is None:
+            return "n/a"
+        return "{} ({})".format(
+            date(localtime(obj.latest_page_modified), settings.DATETIME_FORMAT),
+            naturaltime(obj.latest_page_modified),
         )
 
-    latest_page_modified.admin_order_field = "_latest_page_modified"
+    latest_page_update.short_description = "Latest page modified"
+    latest_page_update.admin_order_field = "latest_page_modified"
 
     def column_names(self, obj):
         return ", ".join(obj.get_column_names())
 
     column_names.short_description = "columns"
 
+    @mark_safe
+    def trace(self, obj):
+        return trace_waterfall(obj)
+
+    trace.short_description = "latest trace"
+
     @mark_safe
     def scroller(self, obj):
         if obj.scroll:
@@ -331,7 +339,10 @@ class ExportAdmin(ActionsModelAdmin):
         self.message_user(request, f"Result ID: {res}", level=messages.INFO)
 
         export.log_event(
-            evt=ENQUEUED_FROM_ADMIN, signatures=str(sigs), async_result=str(res)
+            evt=ENQUEUED_FROM_ADMIN,
+            sync=True,
+            signatures=str(sigs),
+            async_result=str(res),
         )
         return redirect(reverse("admin:search_searchexport_change", args=[pk]))
 
@@ -14,12 +14,16 @@ VALIDATION_COMPLETE_LOCKED = 551, "Failed to get lock to perform post-validation
 REFUNDING_INVALID = 560, "Refunding user credits for invalid emails."
 SPAWN_MX = 600, "Generated mx-domain task group."
 UPLOAD_TO_BUCKET = 850, "Uploading completed export as csv to static bucket."
+PAGES_ARCHIVED = 860, "Moved page rows to the export's page archive."
 ALERT_XPERWEB = 750, "Notified xperweb of export completion."
 
 POPULATE_DATA = 400, "Populating page directly from search data."
 PAGES_SPAWNED = 350, "Scheduling batch of pages to process."
+PAGES_QUEUED = 351, "Queued batch of pages with the fair-share scheduler."
+PAGES_RELEASED = 355, "Scheduler released pages to workers."
 COMPRESSING_PAGES = 320, "Compressing working data into export pages."
 FINALIZE_PAGE = 300, "Page finalizing."
+STALE_PAGE = 305, "Finalizing page whose derivation counter went stale."
 
 COLDLIST_PENDING = 1000, "Set for upload as coldemail list."
 
@@ -0,0 +1,155 @@
+"""
+Microbenchmarks for the search data-model hot paths, run over the sample search
+results and derived profiles the tests use. An op is one pass over the sample.
+
+Run with ``manage.py benchmark_search_models``.
+"""
+import json
+import timeit
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+from bson.json_util import object_hook
+from django.db import connection
+
+from whoweb.contrib.fields import CompressedBinaryJSONField, ObscuredInt
+from whoweb.core.metrics import timed
+from whoweb.core.tracing import traced
+from whoweb.search.models import ResultProfile, SearchExport
+from whoweb.search.models.profile import VALIDATED
+from .json_data import DONE, PENDING
+
+REPEAT = 5
+
+
+def sample_rows() -> List[dict]:
+    return [
+        *json.loads(PENDING, object_hook=object_hook, strict=False),
+        *json.loads(DONE, object_hook=object_hook, strict=False),
+    ]
+
+
+def profile_init(rows):
+    return lambda: [ResultProfile(**row) for row in rows]
+
+
+def profile_from_trusted(rows):
+    stored = [
+        ResultProfile(**row).dict(exclude=SearchExport.PROFILE_EXCLUDES) for row in rows
+    ]
+    return lambda: [ResultProfile.from_trusted(row) for row in stored]
+
+
+def profile_dict(rows):
+    profiles = [ResultProfile(**row) for row in rows]
+    return lambda: [p.dict(exclude=SearchExport.PROFILE_EXCLUDES) for p in profiles]
+
+
+def profile_to_version(rows):
+    profiles = [ResultProfile(**row) for row in rows]
+    return lambda: [p.to_version() for p in profiles]
+
+
+def compressed_json_encode(rows):
+    field = CompressedBinaryJSONField()
+    data = [ResultProfile(**row).dict() for row in rows]
+    return lambda: field.get_db_prep_value(data, connection)
+
+
+def compressed_json_decode(rows):
+    field = CompressedBinaryJSONField()
+    data = [ResultProfile(**row).dict() for row in rows]
+    blob = field.get_db_prep_value(data, connection).adapted  # unwrap psycopg2 Binary
+    return lambda: field.from_db_value(blob)
+
+
+def csv_row(rows):
+    export = SearchExport()
+    # Validated, so rows carry the graded email and phone columns.
+    profiles = [
+        ResultProfile(**{**row, "derivation_status": VALIDATED}) for row in rows
+    ]
+    return lambda: [export.get_csv_row(p, enforce_valid_contact=True) for p in profiles]
+
+
+def obscured_int_encode(rows):
+    ids = range(1, len(rows) + 1)
+    return lambda: [ObscuredInt.encode(i, prefix="pk") for i in ids]
+
+
+def obscured_int_decode(rows):
+    encoded = [ObscuredInt.encode(i, prefix="pk") for i in range(1, len(rows) + 1)]
+    return lambda: [ObscuredInt.decode(value) for value in encoded]
+
+
+def bare_call(rows):
+    route = lambda: None
+    return lambda: [route() for _ in rows]
+
+
+def instrumented_call(rows):
+    # A router route's metrics and tracing wrappers, outside of any trace; compare
+    # with bare_call for the per-call overhead.
+    route = traced("benchmark")(timed("benchmark")(lambda: None))
+    return lambda: [route() for _ in rows]
+
+
+BENCHMARKS: Dict[str, Callable[[List[dict]], Callable]] = {
+    "profile_init": profile_init,
+    "profile_from_trusted": profile_from_trusted,
+    "profile_dict": profile_dict,
+    "profile_to_version": profile_to_version,
+    "compressed_json_encode": compressed_json_encode,
+    "compressed_json_decode": compressed_json_decode,
+    "csv_row": csv_row,
+    "obscured_int_encode": obscured_int_encode,
+    "obscured_int_decode": obscured_int_decode,
+    "bare_call": bare_call,
+    "instrumented_call": instrumented_call,
+}
+
+
+def measure(op: Callable, min_time=0.2, repeat=REPEAT) -> dict:
+    """
+    Best ops/sec over `repeat` timings of at least `min_time` seconds each, and
+    the peak memory allocated by a single op.
+    """
+    timer = timeit.Timer(op)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    best = min(timer.repeat(repeat=repeat, number=number))
+    tracemalloc.start()
+    try:
+        op()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"ops_per_sec": number / best, "peak_bytes": peak}
+
+
+def run_benchmarks(names: Optional[List[str]] = None, min_time=0.2) -> dict:
+    rows = sample_rows()
+    return {
+        name: measure(BENCHMARKS[name](rows), min_time=min_time)
+        for name in (names or BENCHMARKS)
+    }
+
+
+def compare(results: dict, baseline: dict, threshold=0.1) -> Dict[str, dict]:
+    """
+    Change of each metric against the baseline, as a fraction; the ``regressed``
+    flag is set when ops/sec dropped or peak memory grew by more than `threshold`.
+    """
+    changes = {}
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        speed = result["ops_per_sec"] / baseline[name]["ops_per_sec"] - 1
+        memory = (result["peak_bytes"] + 1) / (baseline[name]["peak_bytes"] + 1) - 1
+        changes[name] = {
+            "ops_per_sec": speed,
+            "peak_bytes": memory,
+            "regressed": speed < -threshold or memory > threshold,
+        }
+    return changes
@@ -0,0 +1,893 @@
+"""
+End-to-end export load harness: runs concurrent ``SearchExport.processing_signatures``
+chains against the `UpstreamStandIn` services, either eagerly in harness threads
+or on an in-process celery worker, and reports throughput, per-stage latency
+percentiles and database query counts.
+
+Run with ``manage.py export_load_test``, ``manage.py hedging_load_test`` for
+the latency of a single hedged route with and without hedging,
+``manage.py occupancy_load_test`` for the database connection time of the single
+profile endpoints, ``manage.py pod_concurrency_load_test`` for the requests a
+pod of sync or gevent gunicorn workers serves at once, and
+``manage.py green_worker_load_test`` for the throughput and database connections
+of a gevent celery worker.
+"""
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
+from typing import List, Optional
+from unittest import mock
+
+import psycopg2
+import requests
+
+from celery import current_app
+from celery.contrib.testing.worker import start_worker
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.test import override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import SlidingToken
+
+from whoweb.core import hedging
+from whoweb.core.router import router
+from whoweb.payments.tests.factories import BillingAccountMemberFactory
+from whoweb.search.models import SearchExport
+from whoweb.search.models.profile import BatchProfileActionResult
+from whoweb.users.tests.factories import UserFactory
+from .upstream_server import UpstreamStandIn
+
+HARNESS_STAGE = "(harness)"
+
+
+class ThreadJoinGuard(threading.local):
+    """
+    Per-thread stand-in for celery's process-wide flag forbidding result joins
+    inside tasks. Eager tasks raise the flag while they run, which would fail the
+    joins eager chains make on other harness threads.
+    """
+
+    blocks = False
+
+    def set(self, blocks):
+        self.blocks = blocks
+
+    def get(self):
+        return self.blocks
+
+
+def load_query(target, derive=True, defer_validation=False, with_invites=False):
+    defer = ["degree_levels", "company_counts"]
+    if not derive:
+        defer.append("contact")
+    if defer_validation:
+        defer.append("validation")
+    return {
+        "user_id": "512cce8c7cc2133a2be3543d",
+        "defer": defer,
+        "with_invites": with_invites,
+        "contact_filters": ["work", "personal"],
+        "filters": {
+            "required": [
+                {"field": "industry", "value": ["Load Testing"], "truth": True}
+            ],
+            "limit": target,
+            "skip": 0,
+        },
+    }
+
+
+def percentiles(values: List[float]) -> dict:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "p50": rank(50),
+        "p90": rank(90),
+        "p99": rank(99),
+        "max": ordered[-1],
+    }
+
+
+class StageRecorder(object):
+    """
+    Times the celery tasks run in this process by task name and attributes the
+    database queries they make to them. Eagerly run tasks nest, so a stage's time
+    includes the tasks it ran inline, while each query counts for the innermost.
+    """
+
+    def __init__(self):
+        self.durations = defaultdict(list)
+        self.queries = Counter()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.active = False
+
+    @property
+    def stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def __enter__(self):
+        self.active = True
+        task_prerun.connect(self.task_started, weak=False)
+        task_postrun.connect(self.task_finished, weak=False)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.active = False
+        task_prerun.disconnect(self.task_started)
+        task_postrun.disconnect(self.task_finished)
+
+    def watch_connection(self):
+        if self.count_query not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self.count_query)
+
+    def task_started(self, task=None, **kwargs):
+        self.watch_connection()
+        self.stack.append((task.name, time.perf_counter()))
+
+    def task_finished(self, task=None, **kwargs):
+        if not self.stack:
+            return
+        name, started = self.stack.pop()
+        with self.lock:
+            self.durations[name].append(time.perf_counter() - started)
+
+    def count_query(self, execute, sql, params, many, context):
+        if self.active:
+            stage = self.stack[-1][0] if self.stack else HARNESS_STAGE
+            with self.lock:
+                self.queries[stage] += 1
+        return execute(sql, params, many, context)
+
+    def report(self):
+        stages = {}
+        for name in set(self.durations).union(self.queries):
+            stages[name] = {
+                **percentiles(self.durations.get(name, [])),
+                "queries": self.queries.get(name, 0),
+            }
+        return stages
+
+
+def run_load(
+    exports=4,
+    concurrency=4,
+    target=30,
+    derive=True,
+    defer_validation=False,
+    with_invites=False,
+    workers=0,
+    rate_limits=False,
+    timeout=600,
+    stand_in: Optional[UpstreamStandIn] = None,
+    keep=False,
+) -> dict:
+    """
+    Run `exports` exports of `target` rows each, `concurrency` at a time in
+    harness threads with eager tasks, or all at once on an in-process worker
+    with `workers` threads when `workers` is set. The worker ignores task rate
+    limits unless `rate_limits` is set, since they would throttle the run to the
+    limiter's pace.
+    """
+    with ExitStack() as stack:
+        if stand_in is None:
+            stand_in = UpstreamStandIn()
+        if not stand_in.thread.is_alive():
+            stand_in.start()
+            stack.callback(stand_in.stop)
+        media_root = stack.enter_context(tempfile.TemporaryDirectory())
+        stack.enter_context(
+            override_settings(
+                **stand_in.settings,
+                CELERY_TASK_ALWAYS_EAGER=not workers,
+                DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage",
+                MEDIA_ROOT=media_root,
+            )
+        )
+        recorder = stack.enter_context(StageRecorder())
+        recorder.watch_connection()
+
+        seat = BillingAccountMemberFactory()
+        query = load_query(
+            target,
+            derive=derive,
+            defer_validation=defer_validation,
+            with_invites=with_invites,
+        )
+        export_ids = [
+            SearchExport.objects.create(
+                billing_seat=seat, query=query, target=target, charge=False
+            ).pk
+            for _ in range(exports)
+        ]
+
+        started = time.perf_counter()
+        if workers:
+            latencies, errors = run_on_worker(
+                export_ids, workers, timeout, rate_limits=rate_limits
+            )
+        else:
+            guard = ThreadJoinGuard()
+            with mock.patch.multiple(
+                "celery.result",
+                _set_task_join_will_block=guard.set,
+                task_join_will_block=guard.get,
+            ):
+                latencies, errors = run_eager(export_ids, concurrency)
+        elapsed = time.perf_counter() - started
+
+        finished = SearchExport.objects.filter(
+            pk__in=export_ids, status=SearchExport.ExportStatusOptions.COMPLETE
+        )
+        rows = sum(finished.values_list("progress_counter", flat=True))
+        report = {
+            "mode": f"worker ({workers} threads)" if workers else "eager",
+            "exports": exports,
+            "completed": finished.count(),
+            "errors": errors,
+            "seconds": elapsed,
+            "exports_per_second": finished.count() / elapsed,
+            "rows_per_second": rows / elapsed,
+            "latency": percentiles(latencies),
+            "stages": recorder.report(),
+            "queries": sum(recorder.queries.values()),
+            "upstream_requests": dict(stand_in.requests),
+            "upstream_errors": dict(stand_in.errors),
+        }
+        if not keep:
+            for export in SearchExport.objects.filter(pk__in=export_ids):
+                export.delete(soft=False)
+        return report
+
+
+def run_eager(export_ids, concurrency):
+    def run(export_id):
+        started = time.perf_counter()
+        try:
+            export = SearchExport.objects.get(pk=export_id)
+            export.processing_signatures().apply_async().get()
+            return time.perf_counter() - started, None
+        except Exception as e:
+            return time.perf_counter() - started, f"{export_id}: {e!r}"
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(run, export_ids))
+    return [latency for latency, _ in outcomes], [e for _, e in outcomes if e]
+
+
+def run_on_worker(export_ids, workers, timeout, rate_limits=False, poll=0.25):
+    queues = {settings.CELERY_TASK_DEFAULT_QUEUE}.union(
+        route["queue"] for route in settings.CELERY_TASK_ROUTES.values()
+    )
+    with start_worker(
+        current_app,
+        pool="threads",
+        concurrency=workers,
+        perform_ping_check=False,
+        queues=sorted(queues),
+        disable_rate_limits=not rate_limits,
+        shutdown_timeout=30,
+    ):
+        dispatched = {}
+        for export in SearchExport.objects.filter(pk__in=export_ids):
+            export.processing_signatures().apply_async()
+            dispatched[export.pk] = time.perf_counter()
+        latencies, deadline = [], time.perf_counter() + timeout
+        while dispatched and time.perf_counter() < deadline:
+            done = SearchExport.objects.filter(
+                pk__in=dispatched, status=SearchExport.ExportStatusOptions.COMPLETE
+            ).values_list("pk", flat=True)
+            for export_id in done:
+                latencies.append(time.perf_counter() - dispatched.pop(export_id))
+            time.sleep(poll)
+    errors = [f"{export_id}: timed out" for export_id in dispatched]
+    return latencies, errors
+
+
+def run_hedging(
+    calls=200,
+    concurrency=4,
+    route="unified_search",
+    stand_in: Optional[UpstreamStandIn] = None,
+) -> dict:
+    """
+    Make `calls` calls to a router `route`, `concurrency` at a time, first
+    without and then with hedging, and report the latency percentiles of each.
+    Both runs start with `hedging.MIN_SAMPLES` unmeasured calls, so the hedged
+    run begins with a learned hedge delay as it would in a long-lived process.
+    """
+    payload = {"filters": {"limit": 10, "skip": 0}}
+    call = getattr(router, route)
+
+    def timed_call(_):
+        started = time.perf_counter()
+        call(json=payload, timeout=30)
+        return time.perf_counter() - started
+
+    with ExitStack() as stack:
+        if stand_in is None:
+            stand_in = UpstreamStandIn()
+        if not stand_in.thread.is_alive():
+            stand_in.start()
+            stack.callback(stand_in.stop)
+        stack.enter_context(override_settings(**stand_in.settings))
+        pool = stack.enter_context(ThreadPoolExecutor(max_workers=concurrency))
+
+        report = {}
+        for mode, routes in (("plain", []), ("hedged", [route])):
+            with override_settings(HEDGE_ROUTES=routes):
+                hedging.policies.pop(route, None)
+                list(pool.map(timed_call, range(hedging.MIN_SAMPLES)))
+                hedged_before = stand_in.hedged[route]
+                started = time.perf_counter()
+                latencies = list(pool.map(timed_call, range(calls)))
+                report[mode] = {
+                    **percentiles(latencies),
+                    "seconds": time.perf_counter() - started,
+                    "hedged_requests": stand_in.hedged[route] - hedged_before,
+                }
+        report["p99_speedup"] = report["plain"]["p99"] / report["hedged"]["p99"]
+        return report
+
+
+class ConnectionOccupancy(object):
+    """
+    Times how long database connections are held the way pgbouncer in transaction
+    pooling mode holds its server connections: for the whole of every outermost
+    transaction, and for the single query otherwise. Tracks the most connections
+    held at once.
+    """
+
+    def __init__(self):
+        self.transactions = []
+        self.query_seconds = 0.0
+        self.held = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @property
+    def stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def hold(self, delta):
+        with self.lock:
+            self.held += delta
+            self.peak = max(self.peak, self.held)
+
+    def __enter__(self):
+        recorder, enter, exit = (
+            self,
+            transaction.Atomic.__enter__,
+            transaction.Atomic.__exit__,
+        )
+
+        def atomic_enter(atomic):
+            outermost = not transaction.get_connection(atomic.using).in_atomic_block
+            if outermost:
+                recorder.hold(1)
+            recorder.stack.append((outermost, time.perf_counter()))
+            return enter(atomic)
+
+        def atomic_exit(atomic, *exc_info):
+            try:
+                return exit(atomic, *exc_info)
+            finally:
+                outermost, started = recorder.stack.pop()
+                if outermost:
+                    recorder.hold(-1)
+                    with recorder.lock:
+                        recorder.transactions.append(time.perf_counter() - started)
+
+        self.patch = mock.patch.multiple(
+            transaction.Atomic, __enter__=atomic_enter, __exit__=atomic_exit
+        )
+        self.patch.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.patch.stop()
+
+    def watch_query(self, execute, sql, params, many, context):
+        if context["connection"].in_atomic_block:
+            return execute(sql, params, many, context)
+        self.hold(1)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.hold(-1)
+            with self.lock:
+                self.query_seconds += time.perf_counter() - started
+
+    def report(self, requests, seconds):
+        held = sum(self.transactions) + self.query_seconds
+        return {
+            "transactions": percentiles(self.transactions),
+            "transaction_seconds": sum(self.transactions),
+            "autocommit_query_seconds": self.query_seconds,
+            "connection_seconds_per_request": held / requests,
+            "mean_connections": held / seconds,
+            "peak_connections": self.peak,
+        }
+
+
+OCCUPANCY_ENDPOINTS = {
+    "derive": ("/ww/api/profiles/derive/", lambda n: {"id": f"wp:standin{n:010d}"}),
+    "enrich": (
+        "/ww/api/profiles/enrich/",
+        lambda n: {"profile_id": f"wp:standin{n:010d}"},
+    ),
+    "expand": (
+        "/ww/api/profiles/expand/",
+        lambda n: {"profile_id": f"wp:standin{n:010d}"},
+    ),
+}
+
+
+def run_occupancy(
+    requests=40,
+    concurrency=8,
+    endpoint="derive",
+    stand_in: Optional[UpstreamStandIn] = None,
+) -> dict:
+    """
+    POST `requests` requests to a single profile `endpoint`, `concurrency` at a
+    time, first each inside one request-wide transaction as under
+    ATOMIC_REQUESTS, then as the endpoint runs them, and report the latency and
+    database connection occupancy of both runs.
+    """
+    url, payload = OCCUPANCY_ENDPOINTS[endpoint]
+    with ExitStack() as stack:
+        if stand_in is None:
+            stand_in = UpstreamStandIn(latency=0.2)
+        if not stand_in.thread.is_alive():
+            stand_in.start()
+            stack.callback(stand_in.stop)
+        stack.enter_context(
+            override_settings(
+                **stand_in.settings,
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+            )
+        )
+        pool = stack.enter_context(ThreadPoolExecutor(max_workers=concurrency))
+        user = UserFactory(is_superuser=True, is_staff=True)
+        seat = BillingAccountMemberFactory(seat_credits=10 ** 9)
+
+        def post(n, occupancy, request_transaction):
+            client = APIClient()
+            client.force_authenticate(user=user)
+            data = {"billing_seat": seat.public_id, **payload(n)}
+            started = time.perf_counter()
+            try:
+                with ExitStack() as request:
+                    request.enter_context(
+                        connection.execute_wrapper(occupancy.watch_query)
+                    )
+                    if request_transaction:
+                        request.enter_context(transaction.atomic())
+                    resp = client.post(url, data, format="json")
+                return time.perf_counter() - started, resp.status_code
+            finally:
+                connections.close_all()
+
+        report = {}
+        for mode in ("request_transaction", "endpoint"):
+            with ConnectionOccupancy() as occupancy:
+                started = time.perf_counter()
+                outcomes = list(
+                    pool.map(
+                        lambda n: post(n, occupancy, mode == "request_transaction"),
+                        range(requests),
+                    )
+                )
+                elapsed = time.perf_counter() - started
+                report[mode] = {
+                    **occupancy.report(requests, elapsed),
+                    "seconds": elapsed,
+                    "latency": percentiles([latency for latency, _ in outcomes]),
+                    "statuses": dict(Counter(status for _, status in outcomes)),
+                }
+        return report
+
+
+GUNICORN_CONFIGS = {"sync": "config/gunicorn.py", "gevent": "config/gunicorn_io.py"}
+
+
+def database_url(alias="default"):
+    db = connections[alias].settings_dict
+    return (
+        f"postgres://{db['USER']}:{db['PASSWORD']}@{db['HOST'] or 'localhost'}"
+        f":{db['PORT'] or 5432}/{db['NAME']}"
+    )
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class GunicornPod(object):
+    """
+    A gunicorn server in a subprocess, started with one of the deployed
+    GUNICORN_CONFIGS and `workers` workers, serving the app against the current
+    database and the `stand_in` upstream services.
+    """
+
+    def __init__(self, worker_class, workers, stand_in, env=None, startup=30):
+        self.port = free_port()
+        root = Path(str(settings.ROOT_DIR))
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                "from gunicorn.app.wsgiapp import run; run()",
+                "whoweb.search.loadtest.load_wsgi",
+                "-c",
+                str(root / GUNICORN_CONFIGS[worker_class]),
+                "--workers",
+                str(workers),
+                "--bind",
+                f"127.0.0.1:{self.port}",
+                "--chdir",
+                str(root),
+            ],
+            env={
+                **os.environ,
+                "DATABASE_URL": database_url(),
+                "DJANGO_SETTINGS_MODULE": os.environ["DJANGO_SETTINGS_MODULE"],
+                "XPERDATA_URI": stand_in.settings["ANALYTICS_SERVICE"],
+                "DERIVE_URI": stand_in.settings["DERIVE_SERVICE"],
+                "XPERWEB_URI": stand_in.settings["XPERWEB_URI"],
+                **(env or {}),
+            },
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + startup
+        while True:
+            try:
+                requests.get(f"{self.url}/liveness", timeout=1).raise_for_status()
+                break
+            except requests.RequestException:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError(f"gunicorn ({worker_class}) did not start")
+                time.sleep(0.2)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def run_pod_concurrency(
+    calls=200,
+    concurrency=50,
+    workers=2,
+    endpoint="derive",
+    worker_classes=("sync", "gevent"),
+    stand_in: Optional[UpstreamStandIn] = None,
+) -> dict:
+    """
+    POST `calls` requests to a single profile `endpoint`, `concurrency`
+    at a time, to a pod of `workers` gunicorn workers of each of
+    `worker_classes`, and report the throughput, latency and most upstream calls
+    in flight at once of each. The derive guard's limit is raised to
+    `concurrency` so that it doesn't turn requests away.
+    """
+    path, payload = OCCUPANCY_ENDPOINTS[endpoint]
+    with ExitStack() as stack:
+        if stand_in is None:
+            stand_in = UpstreamStandIn(latency=1.0, hit_rate=1)
+        if not stand_in.thread.is_alive():
+            stand_in.start()
+            stack.callback(stand_in.stop)
+        pool = stack.enter_context(ThreadPoolExecutor(max_workers=concurrency))
+        user = UserFactory(is_superuser=True, is_staff=True)
+        seat = BillingAccountMemberFactory(seat_credits=10 ** 9)
+        headers = {"Authorization": f"Bearer {SlidingToken.for_user(user)}"}
+        limit = str(max(concurrency, settings.DERIVE_LIMIT_MAX))
+
+        report = {}
+        for worker_class in worker_classes:
+            pod = GunicornPod(
+                worker_class,
+                workers,
+                stand_in,
+                env={"DERIVE_LIMIT_INITIAL": limit, "DERIVE_LIMIT_MAX": limit},
+            )
+            stack.callback(pod.stop)
+
+            def post(n):
+                started = time.perf_counter()
+                try:
+                    resp = requests.post(
+                        f"{pod.url}{path}",
+                        json={"billing_seat": seat.public_id, **payload(n)},
+                        headers=headers,
+                        timeout=300,
+                    )
+                    status = resp.status_code
+                except requests.RequestException as e:
+                    status = type(e).__name__
+                return time.perf_counter() - started, status
+
+            stand_in.peak_in_flight = 0
+            started = time.perf_counter()
+            outcomes = list(pool.map(post, range(calls)))
+            elapsed = time.perf_counter() - started
+            pod.stop()
+            report[worker_class] = {
+                "seconds": elapsed,
+                "requests_per_second": calls / elapsed,
+                "peak_upstream_calls": stand_in.peak_in_flight,
+                "latency": percentiles([latency for latency, _ in outcomes]),
+                "statuses": dict(Counter(status for _, status in outcomes)),
+            }
+        return report
+
+
+GREEN_WORKER_MODES = {
+    # As workers ran before: psycopg2 blocking the hub, a connection per task.
+    "plain": {"LOAD_WORKER_GREEN": "0"},
+    # Cooperative psycopg2, still a connection per greenlet.
+    "green": {},
+    # Cooperative psycopg2 and a pool of DATABASE_POOL_SIZE connections.
+    "pooled": {"DATABASE_POOL": "1"},
+}
+
+
+class GreenWorker(object):
+    """
+    A celery worker in a subprocess consuming the whoweb_low queue with a gevent
+    pool of `concurrency` greenlets, as start-lowQ runs it, against the current
+    database and the `stand_in` upstream services. Tasks are published to it
+    through a filesystem broker.
+    """
+
+    def __init__(self, concurrency, stand_in, env=None, startup=60):
+        self.folder = Path(tempfile.mkdtemp(prefix="load-worker-"))
+        self.broker = self.folder / "broker"
+        self.broker.mkdir()
+        ready = self.folder / "ready"
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "celery",
+                "-A",
+                "whoweb.search.loadtest.load_worker",
+                "worker",
+                "-P",
+                "gevent",
+                "-c",
+                str(concurrency),
+                "-Q",
+                "whoweb_low",
+                "-l",
+                "WARNING",
+                "--without-heartbeat",
+                "--without-gossip",
+                "--without-mingle",
+            ],
+            cwd=str(settings.ROOT_DIR),
+            env={
+                **os.environ,
+                "DATABASE_URL": database_url(),
+                "DJANGO_SETTINGS_MODULE": os.environ["DJANGO_SETTINGS_MODULE"],
+                "XPERDATA_URI": stand_in.settings["ANALYTICS_SERVICE"],
+                "DERIVE_URI": stand_in.settings["DERIVE_SERVICE"],
+                "XPERWEB_URI": stand_in.settings["XPERWEB_URI"],
+                "LOAD_BROKER_DIR": str(self.broker),
+                "LOAD_WORKER_READY": str(ready),
+                **(env or {}),
+            },
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + startup
+        while not ready.exists():
+            if self.process.poll() is not None or time.monotonic() > deadline:
+                self.stop()
+                raise RuntimeError("celery worker did not start")
+            time.sleep(0.2)
+
+    def publish(self, name, calls):
+        """Send the task `name` once with each of the argument tuples `calls`."""
+        with current_app.connection_for_write(
+            "filesystem://",
+            transport_options={
+                "data_folder_in": str(self.broker),
+                "data_folder_out": str(self.broker),
+                "control_folder": str(self.folder / "control"),
+            },
+        ) as conn:
+            for args in calls:
+                current_app.send_task(
+                    name, args=args, queue="whoweb_low", connection=conn
+                )
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+
+class ConnectionSampler(object):
+    """
+    Connections other than the harness's own open to the current database,
+    sampled every `interval` seconds on a connection of its own: the most at
+    once, and the number opened meanwhile where Postgres counts them (14+).
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self.opened = None
+        self.stopped = threading.Event()
+        self.ready = threading.Event()
+
+    def sessions(self, cursor):
+        if cursor.connection.server_version < 140000:
+            return None
+        cursor.execute(
+            "select sessions from pg_stat_database where datname = current_database()"
+        )
+        return cursor.fetchone()[0]
+
+    def sample(self, harness, params):
+        conn = psycopg2.connect(**params)
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("select pg_backend_pid()")
+                harness = [harness, cursor.fetchone()[0]]
+                started = self.sessions(cursor)
+                self.ready.set()
+                while not self.stopped.wait(self.interval):
+                    cursor.execute(
+                        "select count(*) from pg_stat_activity "
+                        "where datname = current_database() "
+                        "and backend_type = 'client backend' and pid <> all(%s)",
+                        [harness],
+                    )
+                    self.peak = max(self.peak, cursor.fetchone()[0])
+                if started is not None:
+                    self.opened = self.sessions(cursor) - started
+        finally:
+            conn.close()
+
+    def __enter__(self):
+        with connection.cursor() as cursor:
+            cursor.execute("select pg_backend_pid()")
+            harness = cursor.fetchone()[0]
+        self.thread = threading.Thread(
+            target=self.sample,
+            args=(harness, connection.get_connection_params()),
+            daemon=True,
+        )
+        self.thread.start()
+        self.ready.wait()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+
+def run_green_worker(
+    tasks=200,
+    concurrency=100,
+    chunk=1,
+    pool_size=10,
+    modes=("plain", "pooled"),
+    stand_in: Optional[UpstreamStandIn] = None,
+    timeout=300,
+    poll=0.1,
+) -> dict:
+    """
+    Derive the contacts of `tasks` batches of `chunk` profiles each, a
+    derive_batch_chunk task per batch, on a gevent worker of `concurrency`
+    greenlets in each of GREEN_WORKER_MODES, and report the throughput and the
+    connections the worker held to the database: the most at once and the number
+    it opened. Pooled workers hold at most `pool_size`.
+    """
+    with ExitStack() as stack:
+        if stand_in is None:
+            stand_in = UpstreamStandIn(latency=0.5, hit_rate=1)
+        if not stand_in.thread.is_alive():
+            stand_in.start()
+            stack.callback(stand_in.stop)
+        seat = BillingAccountMemberFactory(seat_credits=10 ** 9)
+        limit = str(max(concurrency, settings.DERIVE_LIMIT_MAX))
+
+        report = {}
+        for m, mode in enumerate(modes):
+            batches = []
+            for t in range(tasks):
+                profiles = [
+                    stand_in.profile((m * tasks + t) * chunk + i) for i in range(chunk)
+                ]
+                batch = BatchProfileActionResult.objects.create(
+                    billing_seat=seat,
+                    initiated_by=seat.user,
+                    size=chunk,
+                    pending_count=chunk,
+                )
+                entities = [
+                    {
+                        "_id": profile["profile_id"],
+                        "first_name": profile["first_name"],
+                        "last_name": profile["last_name"],
+                        "company": profile["company"],
+                        "filters": ["personal", "work"],
+                    }
+                    for profile in profiles
+                ]
+                batches.append((batch.pk, entities))
+            worker = GreenWorker(
+                concurrency,
+                stand_in,
+                env={
+                    **GREEN_WORKER_MODES[mode],
+                    "DATABASE_POOL_SIZE": str(pool_size),
+                    "DERIVE_LIMIT_INITIAL": limit,
+                    "DERIVE_LIMIT_MAX": limit,
+                },
+            )
+            stack.callback(worker.stop)
+
+            pending = BatchProfileActionResult.objects.filter(
+                pk__in=[pk for pk, _ in batches]
+            ).exclude(status=BatchProfileActionResult.BatchStatusOptions.COMPLETE)
+            stand_in.peak_in_flight = 0
+            with ConnectionSampler() as sampler:
+                started = time.perf_counter()
+                worker.publish("whoweb.search.tasks.derive_batch_chunk", batches)
+                deadline = started + timeout
+                while pending.exists() and time.perf_counter() < deadline:
+                    time.sleep(poll)
+                elapsed = time.perf_counter() - started
+            worker.stop()
+            report[mode] = {
+                "seconds": elapsed,
+                "tasks_per_second": tasks / elapsed,
+                "incomplete": pending.count(),
+                "peak_connections": sampler.peak,
+                "connections_opened": sampler.opened,
+                "peak_upstream_calls": stand_in.peak_in_flight,
+            }
+        return report
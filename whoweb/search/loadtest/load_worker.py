@@ -0,0 +1,31 @@
+"""
+Celery app run by the gevent workers of the load harness: the app, on a
+filesystem broker in LOAD_BROKER_DIR that the harness publishes to. The worker
+touches LOAD_WORKER_READY once it consumes, and with LOAD_WORKER_GREEN=0 runs
+without the setup of green workers, as workers did before it.
+"""
+import os
+from pathlib import Path
+
+from celery.signals import worker_ready
+
+from config.celery_app import app
+from whoweb.core import green
+
+# Celery prefers the environment's broker url to its configured one.
+os.environ["CELERY_BROKER_URL"] = "filesystem://"
+app.conf.broker_transport_options = {
+    "data_folder_in": os.environ["LOAD_BROKER_DIR"],
+    "data_folder_out": os.environ["LOAD_BROKER_DIR"],
+    "control_folder": str(Path(os.environ["LOAD_BROKER_DIR"]).parent / "control"),
+    "polling_interval": 0.05,
+}
+app.conf.task_always_eager = False
+
+if os.environ.get("LOAD_WORKER_GREEN") == "0":
+    green.is_green = lambda: False
+
+
+@worker_ready.connect
+def announce(**kwargs):
+    Path(os.environ["LOAD_WORKER_READY"]).touch()
@@ -0,0 +1,10 @@
+"""
+WSGI application served by the gunicorn pods of the load harness: the app, with
+the loopback host the harness calls it on allowed. The harness points the upstream
+service settings at its stand-in through their environment variables.
+"""
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+
+application = get_wsgi_application()
+settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, "127.0.0.1"]
@@ -0,0 +1,262 @@
+import csv
+import json
+import random
+import threading
+import time
+import uuid
+import zipfile
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from urllib.parse import parse_qs, urlparse
+
+from bson.json_util import object_hook
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from whoweb.core.hedging import HEDGE_HEADER
+from .json_data import PENDING
+
+GRADES = ["A+", "A", "B", "C", "F"]
+
+
+class UpstreamStandIn(object):
+    """
+    Local http server standing in for the services an export depends on: xperdata
+    search, the derive service, xperweb invite keys and DataValidation.
+
+    Serves a synthetic dataset of `population` profiles modelled on the sample
+    search results. Every request waits `latency` seconds (plus up to `jitter`),
+    `slow_rate` of them `slow_latency` seconds more as if served by a slow shard,
+    and `error_rate` of them fail with a 503. The derive service finds an email
+    for `hit_rate` of profiles. `peak_in_flight` is the most requests it was
+    serving at once.
+    """
+
+    def __init__(
+        self,
+        population=1000,
+        latency=0.0,
+        jitter=0.0,
+        error_rate=0.0,
+        hit_rate=0.8,
+        slow_rate=0.0,
+        slow_latency=0.0,
+        seed=None,
+    ):
+        self.population = population
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.hit_rate = hit_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.random = random.Random(seed)
+        self.templates = json.loads(PENDING, object_hook=object_hook, strict=False)
+        self.scrolls = {}
+        self.validation_lists = {}
+        self.requests = Counter()
+        self.errors = Counter()
+        self.hedged = Counter()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def settings(self):
+        """Settings pointing the app's service clients at this server."""
+        return {
+            "ANALYTICS_SERVICE": f"{self.url}/xperdata",
+            "DERIVE_SERVICE": f"{self.url}/derive",
+            "XPERWEB_URI": f"{self.url}/xperweb",
+            "DATAVALIDATION_URL": f"{self.url}/datavalidation",
+        }
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # Dataset
+
+    @staticmethod
+    def profile_id(n):
+        return f"wp:standin{n:010d}"
+
+    def profile(self, n):
+        template = self.templates[n % len(self.templates)]
+        profile_id = self.profile_id(n)
+        return {
+            **template,
+            "profile_id": profile_id,
+            "pk": profile_id,
+            "first_name": f"First{n}",
+            "last_name": f"Last{n}",
+            "company": template.get("company") or f"Company {n % 97}",
+        }
+
+    def ids(self, skip, limit):
+        return range(skip, min(skip + limit, self.population))
+
+    # Routes
+
+    def unified_search(self, query):
+        filters = query.get("filters", {})
+        for required in filters.get("required", []):
+            if required.get("field") == "_id":
+                wanted = [
+                    int(pid.replace("wp:standin", "")) for pid in required["value"]
+                ]
+                return {"results": [self.profile(n) for n in wanted]}
+        limit = int(filters.get("limit") or 0)
+        if scroll := filters.get("scroll"):
+            with self.lock:
+                skip = self.scrolls.get(scroll, 0)
+                self.scrolls[scroll] = skip + limit
+        else:
+            skip = int(filters.get("skip") or 0)
+        ids = self.ids(skip, limit)
+        if query.get("ids_only"):
+            results = [{"profile_id": self.profile_id(n)} for n in ids]
+        else:
+            results = [self.profile(n) for n in ids]
+        return {"total_results": self.population, "results": results}
+
+    def derive_contact(self, params):
+        if self.random.random() >= self.hit_rate:
+            return {"status": "failed"}
+        first, last = params.get("first", [""])[0], params.get("last", [""])[0]
+        email = f"{first}.{last}@example.com".lower()
+        return {
+            "status": "complete",
+            "email": email,
+            "emails": [email],
+            "graded_emails": {email: self.random.choice(GRADES[:3])},
+            "filters": params.get("filter", []),
+        }
+
+    def create_validation_list(self, form):
+        list_id = f"lst_{uuid.uuid4().hex}"
+        url = form.get("url", [""])[0]
+        emails = []
+        if url.startswith(settings.MEDIA_URL):
+            with default_storage.open(url[len(settings.MEDIA_URL) :], "r") as f:
+                emails = list(csv.reader(f))
+        with self.lock:
+            self.validation_lists[list_id] = emails
+        return list_id
+
+    def validation_result(self, list_id):
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        for row in self.validation_lists.get(list_id, []):
+            writer.writerow(row[:2] + [self.random.choice(GRADES)])
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, "w") as z:
+            z.writestr(f"{list_id}.csv", buffer.getvalue())
+        return archive.getvalue()
+
+    def route(self, path, query, body):
+        """
+        Name of the route serving a request and a callable producing its response,
+        json or bytes.
+        """
+        if path.endswith("/unified_search"):
+            return "unified_search", lambda: self.unified_search(json.loads(body))
+        if path.endswith("/unified_profile"):
+            profile_id = json.loads(body).get("profile_id") or "wp:standin0"
+            n = int(profile_id.replace("wp:standin", ""))
+            return "profile_lookup", lambda: {"results": [self.profile(n)]}
+        if path.endswith("/derive/contact"):
+            return "derive_email", lambda: self.derive_contact(query)
+        if path.endswith("/derive/validation"):
+            return "update_validations", dict
+        if path.endswith("/internal/invite/keys"):
+            return "invite_key", lambda: {"key": uuid.uuid4().hex}
+        if path.endswith("/internal/export/settleup"):
+            return "settleup", dict
+        if path.endswith("/list/create_from_url/"):
+            form = parse_qs(body.decode())
+            return "datavalidation", lambda: self.create_validation_list(form)
+        if path.endswith("/download_result/"):
+            list_id = path.split("/")[-3]
+            return "datavalidation", lambda: self.validation_result(list_id)
+        if "/list/" in path:
+            return (
+                "datavalidation",
+                lambda: {"status_value": "COMPLETE", "status_percent_complete": 100},
+            )
+        return None, None
+
+    def _handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def respond(self, method):
+                url = urlparse(self.path)
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                name, response = stand_in.route(url.path, parse_qs(url.query), body)
+                delay = stand_in.latency + stand_in.random.random() * stand_in.jitter
+                if stand_in.random.random() < stand_in.slow_rate:
+                    delay += stand_in.slow_latency
+                with stand_in.lock:
+                    stand_in.in_flight += 1
+                    stand_in.peak_in_flight = max(
+                        stand_in.peak_in_flight, stand_in.in_flight
+                    )
+                try:
+                    if delay:
+                        time.sleep(delay)
+                finally:
+                    with stand_in.lock:
+                        stand_in.in_flight -= 1
+                with stand_in.lock:
+                    stand_in.requests[name] += 1
+                    if self.headers.get(HEDGE_HEADER):
+                        stand_in.hedged[name] += 1
+                    failed = stand_in.random.random() < stand_in.error_rate
+                    if failed:
+                        stand_in.errors[name] += 1
+                if name is None or failed:
+                    self.send_response(404 if name is None else 503)
+                    self.end_headers()
+                    return
+                payload = response()
+                if isinstance(payload, bytes):
+                    content, content_type = payload, "application/zip"
+                else:
+                    content, content_type = (
+                        json.dumps(payload).encode(),
+                        "application/json",
+                    )
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                if method != "HEAD":
+                    self.wfile.write(content)
+
+            def do_GET(self):
+                self.respond("GET")
+
+            def do_POST(self):
+                self.respond("POST")
+
+            def do_HEAD(self):
+                self.respond("HEAD")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
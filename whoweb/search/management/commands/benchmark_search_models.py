@@ -0,0 +1,63 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from whoweb.search.loadtest.benchmarks import BENCHMARKS, compare, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the search data-model hot paths (profile parsing and "
+        "serialization, page blob encoding, csv rows, obscured ids), optionally "
+        "saving the results as a baseline or comparing them against one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "benchmarks",
+            nargs="*",
+            help=f"Benchmarks to run, of {', '.join(BENCHMARKS)}. All by default.",
+        )
+        parser.add_argument(
+            "--min-time",
+            type=float,
+            default=0.2,
+            help="Minimum duration in seconds of each timing run.",
+        )
+        parser.add_argument(
+            "--save", metavar="PATH", help="Write the results to PATH as a baseline.",
+        )
+        parser.add_argument(
+            "--compare",
+            metavar="PATH",
+            help="Compare the results with the baseline at PATH.",
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.1,
+            help="Fractional slowdown or memory growth that counts as a regression.",
+        )
+
+    def handle(self, *args, **options):
+        if unknown := set(options["benchmarks"]).difference(BENCHMARKS):
+            raise CommandError(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+        results = run_benchmarks(options["benchmarks"], min_time=options["min_time"])
+        changes = {}
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                changes = compare(results, json.load(f), options["threshold"])
+        for name, result in results.items():
+            line = f"{name:<24} {result['ops_per_sec']:>12,.1f} ops/s {result['peak_bytes']:>12,} B"
+            if name in changes:
+                change = changes[name]
+                line += f"  {change['ops_per_sec']:+7.1%} ops/s {change['peak_bytes']:+7.1%} B"
+                if change["regressed"]:
+                    line += "  REGRESSED"
+            self.stdout.write(line)
+        if options["save"]:
+            with open(options["save"], "w") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Saved baseline to {options['save']}")
+        if regressed := sorted(name for name, c in changes.items() if c["regressed"]):
+            raise CommandError(f"Regressed beyond threshold: {', '.join(regressed)}")
@@ -0,0 +1,155 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from whoweb.search.loadtest.load import run_load
+from whoweb.search.loadtest.upstream_server import UpstreamStandIn
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent exports end to end against local stand-ins for xperdata, "
+        "the derive service, xperweb and DataValidation, and report throughput, "
+        "latency percentiles, per-task timings and database query counts. Creates "
+        "its own billing seat and exports in the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--exports", type=int, default=4, help="Number of exports to run."
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="Exports run at once in eager mode.",
+        )
+        parser.add_argument(
+            "--target", type=int, default=30, help="Rows requested per export."
+        )
+        parser.add_argument(
+            "--no-derive",
+            action="store_false",
+            dest="derive",
+            help="Export search results without deriving contacts.",
+        )
+        parser.add_argument(
+            "--defer-validation",
+            action="store_true",
+            help="Skip the DataValidation round trip.",
+        )
+        parser.add_argument(
+            "--invites", action="store_true", help="Fetch an invite key per row."
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=0,
+            help=(
+                "Run the tasks on an in-process celery worker with this many "
+                "threads, over the configured broker, instead of eagerly."
+            ),
+        )
+        parser.add_argument(
+            "--rate-limits",
+            action="store_true",
+            help="Honour task rate limits on the worker.",
+        )
+        parser.add_argument(
+            "--population",
+            type=int,
+            default=1000,
+            help="Profiles in the stand-in dataset.",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.0,
+            help="Seconds each stand-in request takes.",
+        )
+        parser.add_argument(
+            "--jitter",
+            type=float,
+            default=0.0,
+            help="Up to this many seconds added to each request's latency.",
+        )
+        parser.add_argument(
+            "--error-rate",
+            type=float,
+            default=0.0,
+            help="Fraction of stand-in requests failing with a 503.",
+        )
+        parser.add_argument(
+            "--hit-rate",
+            type=float,
+            default=0.8,
+            help="Fraction of profiles the derive stand-in finds an email for.",
+        )
+        parser.add_argument(
+            "--seed", type=int, help="Seed for the stand-in's randomness."
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=600,
+            help="Seconds to wait for worker runs to complete.",
+        )
+        parser.add_argument(
+            "--keep", action="store_true", help="Keep the exports after the run."
+        )
+        parser.add_argument(
+            "--json", action="store_true", help="Print the report as json."
+        )
+
+    def handle(self, *args, **options):
+        if options["exports"] < 1 or options["target"] < 1:
+            raise CommandError("--exports and --target must be positive.")
+        stand_in = UpstreamStandIn(
+            population=options["population"],
+            latency=options["latency"],
+            jitter=options["jitter"],
+            error_rate=options["error_rate"],
+            hit_rate=options["hit_rate"],
+            seed=options["seed"],
+        )
+        report = run_load(
+            exports=options["exports"],
+            concurrency=options["concurrency"],
+            target=options["target"],
+            derive=options["derive"],
+            defer_validation=options["defer_validation"],
+            with_invites=options["invites"],
+            workers=options["workers"],
+            rate_limits=options["rate_limits"],
+            timeout=options["timeout"],
+            stand_in=stand_in,
+            keep=options["keep"],
+        )
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+            return
+        self.stdout.write(
+            f"{report['mode']}: {report['completed']}/{report['exports']} exports "
+            f"in {report['seconds']:.2f}s, "
+            f"{report['exports_per_second']:.2f} exports/s, "
+            f"{report['rows_per_second']:.1f} rows/s, {report['queries']} queries"
+        )
+        latency = report["latency"]
+        if latency:
+            self.stdout.write(
+                f"export latency  p50 {latency['p50']:.3f}s  "
+                f"p90 {latency['p90']:.3f}s  p99 {latency['p99']:.3f}s"
+            )
+        for name, stage in sorted(report["stages"].items()):
+            line = f"{name.rsplit('.', 1)[-1]:<32} {stage['queries']:>7} queries"
+            if "count" in stage:
+                line += (
+                    f" {stage['count']:>6} runs  p50 {stage['p50']:.3f}s  "
+                    f"p90 {stage['p90']:.3f}s  p99 {stage['p99']:.3f}s"
+                )
+            self.stdout.write(line)
+        for name, count in sorted(report["upstream_requests"].items()):
+            errors = report["upstream_errors"].get(name, 0)
+            self.stdout.write(f"upstream {name:<24} {count:>7} ({errors} failed)")
+        for error in report["errors"]:
+            self.stderr.write(error)
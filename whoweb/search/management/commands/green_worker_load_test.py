@@ -0,0 +1,89 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from whoweb.search.loadtest.load import GREEN_WORKER_MODES, run_green_worker
+from whoweb.search.loadtest.upstream_server import UpstreamStandIn
+
+
+class Command(BaseCommand):
+    help = (
+        "Run batch derivation tasks on a gevent celery worker of the whoweb_low "
+        "queue, as it ran before and with green database waits and a connection "
+        "pool, against local upstream stand-ins, and report the throughput and "
+        "database connections of each."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tasks", type=int, default=200, help="Tasks per worker.")
+        parser.add_argument(
+            "--concurrency", type=int, default=100, help="Greenlets per worker."
+        )
+        parser.add_argument(
+            "--chunk", type=int, default=1, help="Profiles derived per task."
+        )
+        parser.add_argument(
+            "--pool-size",
+            type=int,
+            default=10,
+            help="Connections in the pool of pooled workers.",
+        )
+        parser.add_argument(
+            "--mode",
+            action="append",
+            choices=sorted(GREEN_WORKER_MODES),
+            help="Workers to run; plain and pooled by default.",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.5,
+            help="Seconds each stand-in request takes.",
+        )
+        parser.add_argument(
+            "--timeout", type=float, default=300, help="Seconds to wait per worker."
+        )
+        parser.add_argument(
+            "--seed", type=int, help="Seed for the stand-in's randomness."
+        )
+        parser.add_argument(
+            "--json", action="store_true", help="Print the report as json."
+        )
+
+    def handle(self, *args, **options):
+        if (
+            min(
+                options["tasks"],
+                options["concurrency"],
+                options["chunk"],
+                options["pool_size"],
+            )
+            < 1
+        ):
+            raise CommandError(
+                "--tasks, --concurrency, --chunk and --pool-size must be positive."
+            )
+        stand_in = UpstreamStandIn(
+            latency=options["latency"], hit_rate=1, seed=options["seed"]
+        )
+        report = run_green_worker(
+            tasks=options["tasks"],
+            concurrency=options["concurrency"],
+            chunk=options["chunk"],
+            pool_size=options["pool_size"],
+            modes=options["mode"] or ("plain", "pooled"),
+            stand_in=stand_in,
+            timeout=options["timeout"],
+        )
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+            return
+        for mode, run in report.items():
+            opened = run["connections_opened"]
+            self.stdout.write(
+                f"{mode:<6} {run['tasks_per_second']:.1f} tasks/s  "
+                f"{run['peak_connections']} connections at once  "
+                f"{'?' if opened is None else opened} opened  "
+                f"{run['peak_upstream_calls']} upstream calls at once  "
+                f"{run['incomplete']} incomplete"
+            )
@@ -0,0 +1,86 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from whoweb.search.loadtest.load import run_hedging
+from whoweb.search.loadtest.upstream_server import UpstreamStandIn
+
+
+class Command(BaseCommand):
+    help = (
+        "Call a hedgeable router route against a local xperdata stand-in with a "
+        "slow-shard tail, without and then with request hedging, and report the "
+        "latency percentiles of both runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--route",
+            default="unified_search",
+            choices=["unified_search", "profile_lookup"],
+            help="Router route to call.",
+        )
+        parser.add_argument(
+            "--calls", type=int, default=200, help="Measured calls per run."
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=4, help="Calls made at once."
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.05,
+            help="Seconds each stand-in request takes.",
+        )
+        parser.add_argument(
+            "--jitter",
+            type=float,
+            default=0.01,
+            help="Up to this many seconds added to each request's latency.",
+        )
+        parser.add_argument(
+            "--slow-rate",
+            type=float,
+            default=0.03,
+            help="Fraction of requests served by the slow shard.",
+        )
+        parser.add_argument(
+            "--slow-latency",
+            type=float,
+            default=1.0,
+            help="Seconds the slow shard adds to a request.",
+        )
+        parser.add_argument(
+            "--seed", type=int, help="Seed for the stand-in's randomness."
+        )
+        parser.add_argument(
+            "--json", action="store_true", help="Print the report as json."
+        )
+
+    def handle(self, *args, **options):
+        if options["calls"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--calls and --concurrency must be positive.")
+        stand_in = UpstreamStandIn(
+            latency=options["latency"],
+            jitter=options["jitter"],
+            slow_rate=options["slow_rate"],
+            slow_latency=options["slow_latency"],
+            seed=options["seed"],
+        )
+        report = run_hedging(
+            calls=options["calls"],
+            concurrency=options["concurrency"],
+            route=options["route"],
+            stand_in=stand_in,
+        )
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+            return
+        for mode in ("plain", "hedged"):
+            run = report[mode]
+            self.stdout.write(
+                f"{mode:<7} p50 {run['p50']:.3f}s  p90 {run['p90']:.3f}s  "
+                f"p99 {run['p99']:.3f}s  max {run['max']:.3f}s  "
+                f"{run['hedged_requests']} hedged requests"
+            )
+        self.stdout.write(f"p99 speedup {report['p99_speedup']:.1f}x")
@@ -0,0 +1,66 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from whoweb.search.loadtest.load import OCCUPANCY_ENDPOINTS, run_occupancy
+from whoweb.search.loadtest.upstream_server import UpstreamStandIn
+
+
+class Command(BaseCommand):
+    help = (
+        "POST to a single profile endpoint against local upstream stand-ins, "
+        "first inside a request-wide transaction and then as the endpoint runs, "
+        "and report how long database connections were held in each run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--endpoint",
+            default="derive",
+            choices=sorted(OCCUPANCY_ENDPOINTS),
+            help="Profile endpoint to call.",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=40, help="Requests per run."
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=8, help="Requests made at once."
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.2,
+            help="Seconds each stand-in request takes.",
+        )
+        parser.add_argument(
+            "--seed", type=int, help="Seed for the stand-in's randomness."
+        )
+        parser.add_argument(
+            "--json", action="store_true", help="Print the report as json."
+        )
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--requests and --concurrency must be positive.")
+        stand_in = UpstreamStandIn(
+            population=options["requests"],
+            latency=options["latency"],
+            hit_rate=1,
+            seed=options["seed"],
+        )
+        report = run_occupancy(
+            requests=options["requests"],
+            concurrency=options["concurrency"],
+            endpoint=options["endpoint"],
+            stand_in=stand_in,
+        )
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+            return
+        for mode, run in report.items():
+            self.stdout.write(
+                f"{mode:<19} {run['connection_seconds_per_request']:.3f} "
+                f"connection-seconds per request  "
+                f"{run['mean_connections']:.2f} connections held on average  "
+                f"p50 {run['latency']['p50']:.3f}s  p99 {run['latency']['p99']:.3f}s"
+            )
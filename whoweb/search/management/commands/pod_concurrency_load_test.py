@@ -0,0 +1,79 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from whoweb.search.loadtest.load import (
+    GUNICORN_CONFIGS,
+    OCCUPANCY_ENDPOINTS,
+    run_pod_concurrency,
+)
+from whoweb.search.loadtest.upstream_server import UpstreamStandIn
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the app from a gunicorn pod of sync workers and then of gevent "
+        "workers, POST to a single profile endpoint against local upstream "
+        "stand-ins, and report how many requests each pod serves at once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--endpoint",
+            default="derive",
+            choices=sorted(OCCUPANCY_ENDPOINTS),
+            help="Profile endpoint to call.",
+        )
+        parser.add_argument("--calls", type=int, default=200, help="Requests per pod.")
+        parser.add_argument(
+            "--concurrency", type=int, default=50, help="Requests made at once."
+        )
+        parser.add_argument(
+            "--workers", type=int, default=2, help="Gunicorn workers per pod."
+        )
+        parser.add_argument(
+            "--worker-class",
+            action="append",
+            choices=sorted(GUNICORN_CONFIGS),
+            help="Pods to run; both by default.",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=1.0,
+            help="Seconds each stand-in request takes.",
+        )
+        parser.add_argument(
+            "--seed", type=int, help="Seed for the stand-in's randomness."
+        )
+        parser.add_argument(
+            "--json", action="store_true", help="Print the report as json."
+        )
+
+    def handle(self, *args, **options):
+        if min(options["calls"], options["concurrency"], options["workers"]) < 1:
+            raise CommandError("--calls, --concurrency and --workers must be positive.")
+        stand_in = UpstreamStandIn(
+            population=options["calls"],
+            latency=options["latency"],
+            hit_rate=1,
+            seed=options["seed"],
+        )
+        report = run_pod_concurrency(
+            calls=options["calls"],
+            concurrency=options["concurrency"],
+            workers=options["workers"],
+            endpoint=options["endpoint"],
+            worker_classes=options["worker_class"] or ("sync", "gevent"),
+            stand_in=stand_in,
+        )
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+            return
+        for worker_class, run in report.items():
+            self.stdout.write(
+                f"{worker_class:<6} {run['requests_per_second']:.1f} requests/s  "
+                f"{run['peak_upstream_calls']} upstream calls at once  "
+                f"p50 {run['latency']['p50']:.3f}s  p99 {run['latency']['p99']:.3f}s  "
+                f"{run['statuses']}"
+            )
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.19 on 2026-10-18 22:48
+
+from django.db import migrations, models
+import whoweb.search.models.export
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("search", "0039_auto_20210910_1826"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="searchexport",
+            name="json_file",
+            field=models.FileField(
+                blank=True,
+                null=True,
+                upload_to=whoweb.search.models.export.download_file_location,
+            ),
+        ),
+    ]
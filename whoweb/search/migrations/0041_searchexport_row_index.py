@@ -0,0 +1,23 @@
+# Generated by Django 2.2.19 on 2026-10-18 22:51
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("search", "0040_searchexport_json_file"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="searchexport",
+            name="row_index",
+            field=django.contrib.postgres.fields.jsonb.JSONField(
+                editable=False,
+                help_text="Prefix sums of row counts of completed pages, set once all pages are done.",
+                null=True,
+            ),
+        ),
+    ]
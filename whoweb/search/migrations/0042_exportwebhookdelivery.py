@@ -0,0 +1,90 @@
+# Generated by Django 2.2.19 on 2026-10-18 23:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("search", "0041_searchexport_row_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExportWebhookDelivery",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created",
+                    model_utils.fields.AutoCreatedField(
+                        default=django.utils.timezone.now,
+                        editable=False,
+                        verbose_name="created",
+                    ),
+                ),
+                (
+                    "modified",
+                    model_utils.fields.AutoLastModifiedField(
+                        default=django.utils.timezone.now,
+                        editable=False,
+                        verbose_name="modified",
+                    ),
+                ),
+                ("url", models.URLField(max_length=2000)),
+                ("page_num", models.PositiveIntegerField(blank=True, null=True)),
+                ("batch", models.PositiveIntegerField(default=0)),
+                (
+                    "size",
+                    models.IntegerField(
+                        default=0, help_text="Number of rows in the batch."
+                    ),
+                ),
+                ("body", models.BinaryField(null=True)),
+                (
+                    "status",
+                    models.IntegerField(
+                        blank=True,
+                        choices=[(0, "PENDING"), (4, "DELIVERED"), (8, "FAILED")],
+                        db_index=True,
+                        default=0,
+                        verbose_name="status",
+                    ),
+                ),
+                (
+                    "status_changed",
+                    model_utils.fields.MonitorField(
+                        default=django.utils.timezone.now,
+                        monitor="status",
+                        verbose_name="status changed",
+                    ),
+                ),
+                ("attempts", models.IntegerField(default=0)),
+                ("response_status", models.IntegerField(blank=True, null=True)),
+                ("response_body", models.TextField(blank=True, default="")),
+                ("delivered_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "export",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="webhook_deliveries",
+                        to="search.SearchExport",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["export", "page_num", "batch", "url"],
+                "unique_together": {("export", "url", "page_num", "batch")},
+            },
+        ),
+    ]
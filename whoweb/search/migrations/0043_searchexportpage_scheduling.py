@@ -0,0 +1,34 @@
+# Generated by Django 2.2.19 on 2026-10-18 23:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("search", "0042_exportwebhookdelivery"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="searchexportpage",
+            name="released_at",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                help_text="When the scheduler released the page to workers.",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="searchexportpage",
+            name="scheduled_at",
+            field=models.DateTimeField(
+                blank=True,
+                db_index=True,
+                editable=False,
+                help_text="When the page was queued with the fair-share scheduler.",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 2.2.19 on 2026-10-18 23:45
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_page_stats(apps, schema_editor):
+    SearchExport = apps.get_model("search", "searchexport")
+    SearchExportPage = apps.get_model("search", "searchexportpage")
+    pages = (
+        SearchExportPage.objects.filter(export=OuterRef("pk"))
+        .order_by()
+        .values("export")
+    )
+    SearchExport.objects.update(
+        working_count=Coalesce(
+            Subquery(pages.annotate(total=Sum("progress_counter")).values("total")), 0
+        ),
+        rows_enqueued=Coalesce(
+            Subquery(pages.annotate(total=Sum("pending_count")).values("total")), 0
+        ),
+        latest_page_modified=Subquery(
+            pages.annotate(latest=Max("modified")).values("latest")
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("search", "0043_searchexportpage_scheduling"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="searchexport",
+            name="latest_page_modified",
+            field=models.DateTimeField(
+                blank=True, db_index=True, editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="searchexport",
+            name="rows_enqueued",
+            field=models.IntegerField(
+                db_index=True,
+                default=0,
+                editable=False,
+                help_text="Derivations still pending in pages",
+            ),
+        ),
+        migrations.AddField(
+            model_name="searchexport",
+            name="working_count",
+            field=models.IntegerField(
+                db_index=True,
+                default=0,
+                editable=False,
+                help_text="Profiles saved in pages",
+            ),
+        ),
+        migrations.RunPython(
+            backfill_page_stats, reverse_code=migrations.RunPython.noop
+        ),
+    ]
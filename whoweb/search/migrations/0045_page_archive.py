@@ -0,0 +1,44 @@
+# Generated by Django 2.2.19 on 2026-10-18 23:53
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import whoweb.search.models.export
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("search", "0044_searchexport_page_stats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="searchexport",
+            name="page_archive",
+            field=models.FileField(
+                blank=True,
+                editable=False,
+                null=True,
+                upload_to=whoweb.search.models.export.archive_file_location,
+            ),
+        ),
+        migrations.AddField(
+            model_name="searchexport",
+            name="page_archive_manifest",
+            field=django.contrib.postgres.fields.jsonb.JSONField(
+                editable=False,
+                help_text="Byte range [start, end) of each archived page in page_archive, by page number.",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="searchexportpage",
+            name="archived_at",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                help_text="When the page's rows were moved to the export's page archive.",
+                null=True,
+            ),
+        ),
+    ]
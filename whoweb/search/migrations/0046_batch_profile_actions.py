@@ -0,0 +1,112 @@
+# Generated by Django 2.2.19 on 2026-10-19 00:51
+
+from django.conf import settings
+import django.contrib.postgres.fields
+import django.contrib.postgres.fields.jsonb
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("search", "0045_page_archive"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="batchprofileactionresult",
+            name="credits_used",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="batchprofileactionresult",
+            name="initiated_by",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddField(
+            model_name="batchprofileactionresult",
+            name="pending_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="batchprofileactionresult",
+            name="status",
+            field=models.IntegerField(
+                blank=True,
+                choices=[(0, "PENDING"), (2, "WORKING"), (4, "COMPLETE")],
+                db_index=True,
+                default=0,
+                verbose_name="status",
+            ),
+        ),
+        migrations.AddField(
+            model_name="batchprofileactionresult",
+            name="status_changed",
+            field=model_utils.fields.MonitorField(
+                default=django.utils.timezone.now,
+                monitor="status",
+                verbose_name="status changed",
+            ),
+        ),
+        migrations.AddField(
+            model_name="batchprofileactionresult",
+            name="webhooks",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.URLField(max_length=2000),
+                blank=True,
+                default=list,
+                size=None,
+            ),
+        ),
+        migrations.AddField(
+            model_name="exportwebhookdelivery",
+            name="batch_result",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="webhook_deliveries",
+                to="search.BatchProfileActionResult",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="batchprofileactionresult",
+            name="group_task_id",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.AlterField(
+            model_name="batchprofileactionresult",
+            name="results",
+            field=django.contrib.postgres.fields.jsonb.JSONField(
+                default=list, encoder=django.core.serializers.json.DjangoJSONEncoder
+            ),
+        ),
+        migrations.AlterField(
+            model_name="exportwebhookdelivery",
+            name="export",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="webhook_deliveries",
+                to="search.SearchExport",
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="exportwebhookdelivery",
+            unique_together={
+                ("export", "url", "page_num", "batch"),
+                ("batch_result", "url", "batch"),
+            },
+        ),
+    ]
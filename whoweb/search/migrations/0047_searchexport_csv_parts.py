@@ -0,0 +1,23 @@
+# Generated by Django 2.2.19 on 2026-10-19 02:19
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("search", "0046_batch_profile_actions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="searchexport",
+            name="csv_parts",
+            field=django.contrib.postgres.fields.jsonb.JSONField(
+                editable=False,
+                help_text="Csv part files written so far, by part number, and the number still pending.",
+                null=True,
+            ),
+        ),
+    ]
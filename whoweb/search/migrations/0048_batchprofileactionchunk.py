@@ -0,0 +1,97 @@
+# Generated by Django 2.2.19 on 2026-10-19 09:12
+
+import django.contrib.postgres.fields.jsonb
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+
+
+def move_results_to_chunks(apps, schema_editor):
+    BatchProfileActionResult = apps.get_model("search", "BatchProfileActionResult")
+    BatchProfileActionChunk = apps.get_model("search", "BatchProfileActionChunk")
+    batches = (
+        BatchProfileActionResult.objects.exclude(results=[])
+        .exclude(results__isnull=True)
+        .values_list("pk", "results")
+    )
+    BatchProfileActionChunk.objects.bulk_create(
+        (
+            BatchProfileActionChunk(batch_id=pk, results=results)
+            for pk, results in batches.iterator()
+        ),
+        batch_size=100,
+    )
+
+
+def move_chunks_to_results(apps, schema_editor):
+    BatchProfileActionResult = apps.get_model("search", "BatchProfileActionResult")
+    BatchProfileActionChunk = apps.get_model("search", "BatchProfileActionChunk")
+    results = {}
+    for pk, chunk in (
+        BatchProfileActionChunk.objects.order_by("pk")
+        .values_list("batch_id", "results")
+        .iterator()
+    ):
+        results.setdefault(pk, []).extend(chunk)
+    for pk, batch_results in results.items():
+        BatchProfileActionResult.objects.filter(pk=pk).update(results=batch_results)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("search", "0047_searchexport_csv_parts"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BatchProfileActionChunk",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created",
+                    model_utils.fields.AutoCreatedField(
+                        default=django.utils.timezone.now,
+                        editable=False,
+                        verbose_name="created",
+                    ),
+                ),
+                (
+                    "modified",
+                    model_utils.fields.AutoLastModifiedField(
+                        default=django.utils.timezone.now,
+                        editable=False,
+                        verbose_name="modified",
+                    ),
+                ),
+                (
+                    "results",
+                    django.contrib.postgres.fields.jsonb.JSONField(
+                        default=list,
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                    ),
+                ),
+                (
+                    "batch",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="chunks",
+                        to="search.BatchProfileActionResult",
+                    ),
+                ),
+            ],
+            options={"abstract": False,},
+        ),
+        migrations.RunPython(move_results_to_chunks, move_chunks_to_results),
+        migrations.RemoveField(model_name="batchprofileactionresult", name="results",),
+    ]
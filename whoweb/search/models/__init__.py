@@ -9,6 +9,8 @@ from .scroll import ScrollSearch
 from .export import SearchExport
 from .profile import ResultProfile, DerivedContact, DerivationCache
 from .filter_value_list import FilterValueList
+from .webhooks import ExportWebhookDelivery
+from .scheduling import ExportPageScheduler
 
 __all__ = [
     "FilteredSearchQuery",
@@ -22,4 +24,5 @@ __all__ = [
     "QuerySource",
     "DerivationCache",
     "FilterValueList",
+    "ExportWebhookDelivery",
 ]
@@ -1,9 +1,17 @@
+import binascii
+import json
+import struct
+import zlib
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from bisect import bisect_right
 from enum import Enum, IntEnum
 from io import TextIOWrapper, StringIO
-from typing import Optional, List, Iterable, Dict, Iterator, Tuple
+from typing import Optional, List, Iterable, Dict, Iterator, Tuple, Set
 
 import csv
+import itertools
 import logging
+import shutil
 import requests
 import uuid as uuid
 import zipfile
@@ -12,14 +20,17 @@ from datetime import timedelta
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.postgres.fields import JSONField, ArrayField
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.core.files.base import ContentFile
+from django.core.files.base import ContentFile, File
 from django.core.mail import send_mail
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models, transaction
-from django.db.models import F
+from django.db.models import ExpressionWrapper, F, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
 from dns import resolver
@@ -30,6 +41,7 @@ from model_utils.managers import QueryManagerMixin
 from model_utils.models import TimeStampedModel, SoftDeletableModel
 from requests_cache import CachedSession
 from six import BytesIO
+from tempfile import TemporaryFile
 from storages.backends.gcloud import GoogleCloudStorage
 from tagulous.models import TagField
 
@@ -39,8 +51,10 @@ from whoweb.accounting.queries import get_balances_for_object
 from whoweb.coldemail.models import ColdEmailTagModel
 from whoweb.contrib.fields import CompressedBinaryJSONField
 from whoweb.contrib.postgres.fields import EmbeddedModelField
+from whoweb.core.metrics import count_rows
 from whoweb.core.models import EventLoggingModel
 from whoweb.core.router import router, external_link
+from whoweb.core.tracing import trace_headers
 from whoweb.payments.exceptions import SubscriptionError
 from whoweb.payments.models import WKPlan, BillingAccountMember
 from whoweb.search.events import (
@@ -56,14 +70,15 @@ from whoweb.search.events import (
     VALIDATION_COMPLETE_LOCKED,
     COMPRESSING_PAGES,
     UPLOAD_TO_BUCKET,
+    PAGES_ARCHIVED,
 )
 from whoweb.users.models import Seat
 from .profile import ResultProfile, WORK, PERSONAL, SOCIAL, PROFILE, VALIDATED
 from .scroll import FilteredSearchQuery, ScrollSearch
+from .webhooks import ExportWebhookDelivery
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
-DATAVALIDATION_URL = "https://dv3.datavalidation.com/api/v2/user/me"
 
 
 def validation_file_location(instance, filename):
@@ -74,6 +89,60 @@ def download_file_location(instance, filename):
     return f"exports/{instance.uuid.hex}/download/{filename}"
 
 
+def archive_file_location(instance, filename):
+    return f"exports/{instance.uuid.hex}/archive/{filename}"
+
+
+GCS_MAX_COMPOSE_SOURCES = 32
+
+
+def gcs_blob_name(file_storage: GoogleCloudStorage, name):
+    return file_storage.url(name).split(settings.GS_BUCKET_NAME + "/", maxsplit=1)[-1]
+
+
+def compose_blobs(
+    file_storage: GoogleCloudStorage,
+    sources: List[str],
+    destination,
+    content_type="text/csv",
+):
+    """
+    Concatenate blobs in order, in rounds, as GCS composes at most 32 sources at once.
+    """
+    bucket = file_storage.bucket
+    blobs = [bucket.blob(source) for source in sources]
+    intermediates = []
+    while len(blobs) > GCS_MAX_COMPOSE_SOURCES:
+        composed = []
+        for start in range(0, len(blobs), GCS_MAX_COMPOSE_SOURCES):
+            chunk = blobs[start : start + GCS_MAX_COMPOSE_SOURCES]
+            blob = bucket.blob(f"{destination}.compose-{len(intermediates)}")
+            blob.compose(chunk)
+            intermediates.append(blob)
+            composed.append(blob)
+        blobs = composed
+    blob = bucket.blob(destination)
+    blob.content_type = content_type
+    blob.compose(blobs)
+    if file_storage.default_acl:
+        blob.acl.save_predefined(file_storage.default_acl)
+    for intermediate in intermediates:
+        intermediate.delete()
+    return blob
+
+
+def read_byte_range(file_storage, name, start, end) -> bytes:
+    """
+    Bytes [start, end) of a stored file. On GCS only that range is downloaded.
+    """
+    if isinstance(file_storage, GoogleCloudStorage):
+        blob = file_storage.bucket.blob(gcs_blob_name(file_storage, name))
+        return blob.download_as_bytes(start=start, end=end - 1)
+    with file_storage.open(name, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
 class SearchExportManager(QueryManagerMixin, models.Manager):
     pass
 
@@ -82,6 +151,9 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
     DERIVATION_RATIO = 3
     PREFETCH_MULTIPLIER = 2
     PAGE_DELAY = 180
+    PAGES_PER_CSV_PART = 10
+    ARCHIVE_PAGES_PER_READ = 10
+    PARTIAL_RESULTS_LIMIT = 1000
     SIMPLE_CAP = 1000
     SKIP_CODE = "MAGIC_SKIP_CODE_NO_VALIDATION_NEEDED"
 
@@ -135,7 +207,10 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
         "business_function",
         "diversity",
         "updated",
+        "schema_version",
     }
+    # Profiles stored on pages keep the schema tag ResultProfile.from_trusted reads.
+    STORED_PROFILE_EXCLUDES = PROFILE_EXCLUDES - {"schema_version"}
     INTRO_COLS = [0]
     BASE_COLS = list(range(1, 10)) + [25]
     DERIVATION_COLS = list(range(10, 25)) + [26, 27, 28]
@@ -167,6 +242,22 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
     )
     validation_list_id = models.CharField(max_length=50, null=True, blank=True)
     csv = models.FileField(upload_to=download_file_location, null=True, blank=True)
+    json_file = models.FileField(
+        upload_to=download_file_location, null=True, blank=True
+    )
+    page_archive = models.FileField(
+        upload_to=archive_file_location, null=True, blank=True, editable=False
+    )
+    page_archive_manifest = JSONField(
+        null=True,
+        editable=False,
+        help_text="Byte range [start, end) of each archived page in page_archive, by page number.",
+    )
+    csv_parts = JSONField(
+        null=True,
+        editable=False,
+        help_text="Csv part files written so far, by part number, and the number still pending.",
+    )
 
     status = models.IntegerField(
         _("status"),
@@ -185,6 +276,26 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
     )
     target = models.IntegerField(default=0)
     rows_uploaded = models.IntegerField(default=0)
+    row_index = JSONField(
+        null=True,
+        editable=False,
+        help_text="Prefix sums of row counts of completed pages, set once all pages are done.",
+    )
+    # Page aggregates, refreshed as pages are dispatched and finalized, and at most
+    # every EXPORT_PAGE_STATS_INTERVAL seconds while they count down
+    # (see `refresh_page_stats`).
+    working_count = models.IntegerField(
+        default=0, editable=False, db_index=True, help_text="Profiles saved in pages"
+    )
+    rows_enqueued = models.IntegerField(
+        default=0,
+        editable=False,
+        db_index=True,
+        help_text="Derivations still pending in pages",
+    )
+    latest_page_modified = models.DateTimeField(
+        null=True, blank=True, editable=False, db_index=True
+    )
 
     notify = models.BooleanField(default=False)
     charge = models.BooleanField(default=False)
@@ -201,9 +312,53 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
     class Meta:
         verbose_name = "export"
 
+    PAGE_STATS_FIELDS = ("working_count", "rows_enqueued", "latest_page_modified")
+    # Written only through queryset updates, by whichever task owns them.
+    UPDATED_FIELDS = PAGE_STATS_FIELDS + (
+        "row_index",
+        "csv_parts",
+        "page_archive",
+        "page_archive_manifest",
+    )
+
     def __str__(self):
         return "%s (%s) %s" % (self.__class__.__name__, self.pk, self.uuid.hex)
 
+    def save(self, *args, **kwargs):
+        # A full save of an instance older than the latest queryset updates must
+        # not overwrite them; name the fields in `update_fields` to write them.
+        if (
+            not self._state.adding
+            and not kwargs.get("force_insert")
+            and kwargs.get("update_fields") is None
+        ):
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.UPDATED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def refresh_page_stats(cls, export_id):
+        pages = (
+            SearchExportPage.objects.filter(export=OuterRef("pk"))
+            .order_by()
+            .values("export")
+        )
+        cls.objects.filter(pk=export_id).update(
+            working_count=Coalesce(
+                Subquery(pages.annotate(total=Sum("progress_counter")).values("total")),
+                0,
+            ),
+            rows_enqueued=Coalesce(
+                Subquery(pages.annotate(total=Sum("pending_count")).values("total")), 0,
+            ),
+            latest_page_modified=Subquery(
+                pages.annotate(latest=Max("modified")).values("latest")
+            ),
+        )
+
     @classmethod
     def create_from_query(
         cls, billing_seat: BillingAccountMember, query: dict, **kwargs
@@ -391,20 +546,273 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
         return self.scroll.ensure_live(force=force)
 
     def get_raw(self) -> Iterator[ResultProfile]:
-        for page in self.pages.filter(data__isnull=False).iterator(chunk_size=1):
-            for row in page.data:
+        for page, data in self.get_raw_by_page():
+            for row in data:
                 yield row
 
     def get_raw_by_page(self) -> Iterator[Iterable[ResultProfile]]:
-        for page in self.pages.filter(data__isnull=False).iterator(chunk_size=1):
-            yield page, page.data
+        return self.iter_page_data(self.pages.finished().iterator(chunk_size=1))
+
+    def iter_page_data(
+        self, pages: Iterable["SearchExportPage"]
+    ) -> Iterator[Tuple["SearchExportPage", List[dict]]]:
+        """
+        Each of `pages`, in order, with its rows. Rows of archived pages are read
+        from the page archive, ARCHIVE_PAGES_PER_READ pages per range request;
+        rows written back to the database after archiving take precedence.
+        """
+        archived = []
+        for page in pages:
+            if page.data is None and page.archived_at:
+                archived.append(page)
+                if len(archived) >= self.ARCHIVE_PAGES_PER_READ:
+                    yield from self._read_archived_pages(archived)
+                    archived = []
+                continue
+            yield from self._read_archived_pages(archived)
+            archived = []
+            yield page, page.data or []
+        yield from self._read_archived_pages(archived)
+
+    def _read_archived_pages(
+        self, pages: List["SearchExportPage"]
+    ) -> Iterator[Tuple["SearchExportPage", List[dict]]]:
+        manifest = self.page_archive_manifest or {}
+        decode = SearchExportPage._meta.get_field("data").from_db_value
+        while pages:
+            # One read covers the run of pages stored back to back in the archive.
+            run = [pages[0]]
+            for page in pages[1:]:
+                if (
+                    manifest[str(page.page_num)][0]
+                    != manifest[str(run[-1].page_num)][1]
+                ):
+                    break
+                run.append(page)
+            pages = pages[len(run) :]
+            start = manifest[str(run[0].page_num)][0]
+            end = manifest[str(run[-1].page_num)][1]
+            chunk = read_byte_range(
+                self.page_archive.storage, self.page_archive.name, start, end
+            )
+            for page in run:
+                page_start, page_end = manifest[str(page.page_num)]
+                yield page, decode(chunk[page_start - start : page_end - start])
+
+    def archive_pages(self, task_context=None) -> int:
+        """
+        Move the rows of a completed export's pages out of the database into a
+        single object: the pages' compressed blobs back to back, located through
+        `page_archive_manifest`. Returns the number of pages archived.
+
+        The object is uploaded before anything is locked; a short transaction then
+        points the export at it and clears the pages it holds. Pages written to in
+        between keep their rows, and an object that ends up unused is deleted.
+        """
+        export = SearchExport.objects.get(pk=self.pk)
+        if export.status != SearchExport.ExportStatusOptions.COMPLETE:
+            return 0
+        if export.page_archive:
+            return 0
+        pages = (
+            export.pages.filter(data__isnull=False)
+            .order_by("page_num")
+            .annotate(
+                blob=ExpressionWrapper(F("data"), output_field=models.BinaryField())
+            )
+            .values_list("pk", "page_num", "modified", "blob")
+        )
+        read, manifest = {}, {}
+        with TemporaryFile() as tmp:
+            for pk, page_num, modified, blob in pages.iterator(chunk_size=1):
+                start = tmp.tell()
+                tmp.write(blob)
+                read[pk] = (page_num, modified)
+                manifest[str(page_num)] = [start, tmp.tell()]
+            if not read:
+                return 0
+            tmp.seek(0)
+            export.page_archive.save("pages.bin", File(tmp), save=False)
+        export.get_row_index()
+
+        page_ids = []
+        try:
+            with transaction.atomic():
+                locked = self.locked()
+                if locked and not locked.page_archive:
+                    unchanged = (
+                        SearchExportPage.objects.filter(
+                            pk__in=list(read), data__isnull=False
+                        )
+                        .select_for_update()
+                        .values_list("pk", "modified")
+                    )
+                    page_ids = [
+                        pk for pk, modified in unchanged if read[pk][1] == modified
+                    ]
+                if page_ids:
+                    kept = {str(read[pk][0]) for pk in page_ids}
+                    SearchExport.objects.filter(pk=export.pk).update(
+                        page_archive=export.page_archive.name,
+                        page_archive_manifest={
+                            page_num: span
+                            for page_num, span in manifest.items()
+                            if page_num in kept
+                        },
+                    )
+                    SearchExportPage.objects.filter(pk__in=page_ids).update(
+                        data=None, archived_at=timezone.now()
+                    )
+        except Exception:
+            export.page_archive.storage.delete(export.page_archive.name)
+            raise
+        if not page_ids:
+            export.page_archive.storage.delete(export.page_archive.name)
+            return 0
+        self.log_event(
+            PAGES_ARCHIVED,
+            task=task_context,
+            data={"pages": len(page_ids), "archive": export.page_archive.name},
+        )
+        return len(page_ids)
 
     def get_profiles(self, raw=None) -> Iterator[ResultProfile]:
         if raw is None:
             raw = self.get_raw()
         for profile in raw:
             if profile:
-                yield ResultProfile(**profile)
+                yield ResultProfile.from_trusted(profile)
+
+    def build_row_index(self) -> dict:
+        """
+        ``offsets[i]`` is the position of the first row of ``pages[i]`` in the export,
+        ``offsets[-1]`` the total number of rows.
+        """
+        pages, offsets = [], [0]
+        for page_num, count in (
+            self.pages.finished().order_by("page_num").values_list("page_num", "count")
+        ):
+            pages.append(page_num)
+            offsets.append(offsets[-1] + count)
+        return {"pages": pages, "offsets": offsets}
+
+    def get_row_index(self) -> dict:
+        if self.row_index is not None:
+            return self.row_index
+        index = self.build_row_index()
+        if self.status >= SearchExport.ExportStatusOptions.PAGES_COMPLETE:
+            # Pages no longer change, keep the index for subsequent reads.
+            self.row_index = index
+            SearchExport.objects.filter(pk=self.pk).update(row_index=index)
+        return index
+
+    def get_raw_rows(self, offset=0, limit=None) -> Tuple[int, List[dict]]:
+        """
+        Rows [offset, offset + limit) of the export and the total number of rows.
+        Only the pages covering the range are loaded.
+        """
+        index = self.get_row_index()
+        pages, offsets = index["pages"], index["offsets"]
+        total = offsets[-1]
+        end = total if limit is None else min(offset + limit, total)
+        if offset >= end:
+            return total, []
+        first = bisect_right(offsets, offset) - 1
+        last = bisect_right(offsets, end - 1) - 1
+        data_by_page_num = {
+            page.page_num: data
+            for page, data in self.iter_page_data(
+                self.pages.filter(page_num__in=pages[first : last + 1]).order_by(
+                    "page_num"
+                )
+            )
+        }
+        rows = []
+        for i in range(first, last + 1):
+            start = offsets[i]
+            page_data = data_by_page_num.get(pages[i]) or []
+            rows.extend(page_data[max(offset - start, 0) : end - start])
+        return total, rows
+
+    @staticmethod
+    def encode_page_cursor(
+        page_nums: Iterable[int], resume: Tuple[int, int] = None
+    ) -> str:
+        """
+        Opaque cursor holding the set of pages a client has already received,
+        as a compressed bitmap, so pages finishing out of order are never skipped.
+        `resume` is the page and row to carry on from in a page only partly received.
+        """
+        page_nums = list(page_nums)
+        bitmap = bytearray((max(page_nums) // 8 + 1) if page_nums else 0)
+        for page_num in page_nums:
+            bitmap[page_num // 8] |= 1 << (page_num % 8)
+        header = struct.pack(">II", *resume) if resume else b""
+        payload = bytes([len(header)]) + header + bytes(bitmap)
+        return urlsafe_b64encode(zlib.compress(payload)).decode("ascii")
+
+    @staticmethod
+    def decode_page_cursor(cursor: str) -> Tuple[Set[int], Optional[Tuple[int, int]]]:
+        try:
+            payload = zlib.decompress(urlsafe_b64decode(cursor.encode("ascii")))
+            header_size = payload[0]
+            resume = struct.unpack(">II", payload[1:9]) if header_size else None
+        except (
+            binascii.Error,
+            zlib.error,
+            UnicodeEncodeError,
+            IndexError,
+            struct.error,
+        ):
+            raise ValueError("Invalid cursor")
+        if header_size not in (0, 8):
+            raise ValueError("Invalid cursor")
+        bitmap = payload[1 + header_size :]
+        page_nums = {
+            i * 8 + bit
+            for i, byte in enumerate(bitmap)
+            for bit in range(8)
+            if byte & (1 << bit)
+        }
+        return page_nums, resume
+
+    def get_partial_results(
+        self, cursor=None, limit=None
+    ) -> Tuple[Iterator[dict], str, bool]:
+        """
+        Rows of the pages finalized since ``cursor`` was handed out, up to ``limit``
+        of them, the cursor to resume from (after the last row returned), and
+        whether all pages are done and returned (no further rows will appear).
+        Rows may still be updated by later stages, e.g. post-export validation.
+        """
+        seen, resume = self.decode_page_cursor(cursor) if cursor else (set(), None)
+        done = self.status >= SearchExport.ExportStatusOptions.PAGES_COMPLETE
+        finalized = set(self.pages.finished().values_list("page_num", flat=True))
+        new_pages = self.pages.filter(page_num__in=finalized.difference(seen)).order_by(
+            "page_num"
+        )
+        page_data = (
+            (page, resume[1] if resume and page.page_num == resume[0] else 0, data)
+            for page, data in self.iter_page_data(new_pages.iterator(chunk_size=1))
+        )
+        if limit is None:
+            rows = (row for page, start, data in page_data for row in data[start:])
+            return rows, self.encode_page_cursor(seen | finalized), done
+
+        rows, served, position = [], set(seen), resume
+        for page, start, data in page_data:
+            taken = data[start : start + limit - len(rows)]
+            rows.extend(taken)
+            if start + len(taken) < len(data):
+                position = (page.page_num, start + len(taken))
+                break
+            served.add(page.page_num)
+            if position and position[0] == page.page_num:
+                position = None
+            if len(rows) >= limit:
+                break
+        complete = position is None and served >= finalized
+        return rows, self.encode_page_cursor(served, position), done and complete
 
     def get_profiles_by_page(
         self, raw_by_page=None
@@ -483,23 +891,28 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
             ] + list(self.extra_columns.values() if self.extra_columns else [])
         return row
 
-    def generate_csv_rows(self, rows: Iterable[ResultProfile] = None):
+    def generate_csv_rows(
+        self,
+        rows: Iterable[ResultProfile] = None,
+        header=True,
+        registry_rows: Iterable[ResultProfile] = None,
+    ):
         if rows is None:
             profiles = self.get_profiles()
         else:
             profiles = rows
         if self.uploadable:
+            if registry_rows is None:
+                # its ok to get registry for all profiles
+                registry_rows = self.get_profiles()
             mx_registry = MXDomain.registry_for_domains(
-                domains=(
-                    profile.domain
-                    for profile in self.get_profiles()  # its ok to get registry for all profiles
-                    if profile.domain
-                )
+                domains=(profile.domain for profile in registry_rows if profile.domain)
             )
 
             profiles = (profile.set_mx(mx_registry=mx_registry) for profile in profiles)
 
-        yield self.get_column_names()
+        if header:
+            yield self.get_column_names()
         count = 0
         for profile in profiles:
             if count >= self.target:
@@ -517,6 +930,20 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
     def generate_json_rows(self, rows=None) -> Iterator[str]:
         return (profile.to_version() for profile in self.get_profiles(raw=rows))
 
+    def generate_json_content(self, rows=None, envelope=None) -> Iterator[str]:
+        if envelope:
+            yield json.dumps(envelope, cls=DjangoJSONEncoder)[:-1] + ',"results":['
+        else:
+            yield '{"results":['
+        first = True
+        for row in self.generate_json_rows(rows=rows):
+            if first:
+                yield row
+                first = False
+            else:
+                yield "," + row
+        yield "]}"
+
     def compute_charges(self):
         charges = 0
         profiles = self.get_profiles()
@@ -543,7 +970,7 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
             num_ids_needed = self.num_ids_needed
 
         num_pages = int(ceil(float(num_ids_needed) / search.page_size))
-        last_completed_page = self.pages.filter(data__isnull=False).last()
+        last_completed_page = self.pages.finished().last()
 
         if not last_completed_page:
             start_page = int(ceil(float(self.start_from_count) / search.page_size))
@@ -612,7 +1039,7 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
         scroller = self.ensure_search_interface(force=force_scroller)
 
         num_pages = int(ceil(float(ids_remaining) / scroller.page_size))
-        last_completed_page = self.pages.filter(data__isnull=False).last()
+        last_completed_page = self.pages.finished().last()
 
         if not last_completed_page:
             start_page = int(ceil(float(self.start_from_count) / scroller.page_size))
@@ -658,6 +1085,7 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
             export.status = SearchExport.ExportStatusOptions.PAGES_WORKING
             export.save()
             pages = export._generate_pages()
+            self.refresh_page_stats(self.pk)
             self.log_event(GENERATING_PAGES_COMPLETE, task=task_context)
             return pages
 
@@ -675,7 +1103,7 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
     def do_post_pages_completion(self, task_context=None):
         export = self.locked()
         if not export.status <= SearchExport.ExportStatusOptions.PAGES_COMPLETE:
-            self.log_event(FINALIZING_LOCKED, task=task_context)
+            self.log_event(FINALIZING_LOCKED, task=task_context, sync=True)
             return False
         export.log_event(FINALIZING, task=task_context)
         if export.charge and not export.defer_validation:
@@ -689,6 +1117,8 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
             )
         export.status = SearchExport.ExportStatusOptions.PAGES_COMPLETE
         export.save()
+        export.row_index = export.build_row_index()
+        SearchExport.objects.filter(pk=export.pk).update(row_index=export.row_index)
         return True
 
     @transaction.atomic
@@ -697,7 +1127,7 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
         if not export.defer_validation:
             return True
         if not export.status <= SearchExport.ExportStatusOptions.VALIDATED:
-            self.log_event(VALIDATION_COMPLETE_LOCKED, task=task_context)
+            self.log_event(VALIDATION_COMPLETE_LOCKED, task=task_context, sync=True)
             return False
         results = export.get_validation_results(only_valid=True)
         export.apply_validation_to_profiles_in_pages(validation=results)
@@ -735,7 +1165,7 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
         self.save()
 
         r = requests.post(
-            url=f"{DATAVALIDATION_URL}/list/create_from_url/",
+            url=f"{settings.DATAVALIDATION_URL}/list/create_from_url/",
             headers={"Authorization": f"Bearer {settings.DATAVALIDATION_KEY}"},
             data=dict(
                 url=self.pre_validation_file.url,
@@ -756,7 +1186,7 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
         self.log_event(FETCH_VALIDATION, task=task_context)
 
         status = requests.get(
-            f"{DATAVALIDATION_URL}/list/{self.validation_list_id}/",
+            f"{settings.DATAVALIDATION_URL}/list/{self.validation_list_id}/",
             headers={"Authorization": f"Bearer {settings.DATAVALIDATION_KEY}"},
         ).json()
 
@@ -766,14 +1196,14 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
         if status.get("status_percent_complete", 0) < 100:
             return False
         r = requests.head(
-            f"{DATAVALIDATION_URL}/list/{self.validation_list_id}/download_result/",
+            f"{settings.DATAVALIDATION_URL}/list/{self.validation_list_id}/download_result/",
             headers={"Authorization": f"Bearer {settings.DATAVALIDATION_KEY}"},
         )
         if not r.ok:
             return False
         s = CachedSession(expire_after=timedelta(days=30).total_seconds())
         r = s.get(
-            f"{DATAVALIDATION_URL}/list/{self.validation_list_id}/download_result/",
+            f"{settings.DATAVALIDATION_URL}/list/{self.validation_list_id}/download_result/",
             headers={"Authorization": f"Bearer {settings.DATAVALIDATION_KEY}"},
             stream=True,
         )
@@ -787,7 +1217,7 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
             expire_after=timedelta(days=30).total_seconds(), backend="sqlite"
         )
         r = s.get(
-            f"{DATAVALIDATION_URL}/list/{self.validation_list_id}/download_result/",
+            f"{settings.DATAVALIDATION_URL}/list/{self.validation_list_id}/download_result/",
             headers={"Authorization": f"Bearer {settings.DATAVALIDATION_KEY}"},
             stream=True,
         )
@@ -816,15 +1246,15 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
 
     def apply_validation_to_profiles_in_pages(self, validation):
         registry = self.make_validation_registry(validation_generator=validation)
-        for page in self.pages.filter(data__isnull=False).iterator(chunk_size=1):
-            profiles = self.get_profiles(raw=page.data)
+        for page, data in self.get_raw_by_page():
+            profiles = self.get_profiles(raw=data)
+            excludes = set() if self.uploadable else self.STORED_PROFILE_EXCLUDES
             page.data = [
-                profile.update_validation(registry).dict(
-                    exclude=[] if self.uploadable else SearchExport.PROFILE_EXCLUDES
-                )
+                profile.update_validation(registry).dict(exclude=excludes)
                 for profile in profiles
             ]
             page.save()
+            count_rows("validation", len(page.data))
 
     def return_validation_results_to_cache(self):
         return router.update_validations(
@@ -852,8 +1282,20 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
         self.log_event(evt=SPAWN_MX)
         return mx_tasks
 
-    def push_to_webhooks(self, rows):
-        pass
+    def push_to_webhooks(self, rows, page_num=None):
+        from whoweb.search.tasks import deliver_export_webhook
+
+        webhooks = self.query.export.webhooks if self.query.export else None
+        if not (webhooks and rows):
+            return []
+        deliveries = ExportWebhookDelivery.create_for_rows(
+            export=self, urls=webhooks, rows=rows, page_num=page_num
+        )
+        group(
+            deliver_export_webhook.si(delivery.pk).set(priority=self.queue_priority)
+            for delivery in deliveries
+        ).apply_async()
+        return deliveries
 
     def upload_to_static_bucket(
         self, rows: Iterable[ResultProfile] = None, task_context=None
@@ -866,27 +1308,261 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
             writer.writerow(row)
             row_count += 1
         export_file = ContentFile(buffer.getvalue().encode("utf-8"))
+        self.csv.save(self.csv_filename, export_file)
+        self.upload_json_to_static_bucket()
+        return self._complete_upload(rows_uploaded=row_count)
+
+    @property
+    def csv_filename(self):
         if self.uploadable:
-            filename = f"{self.uuid.hex}__fetch.csv"
-        else:
-            filename = f"whoknows_search_results_{self.created.date()}.csv"
-        self.csv.save(filename, export_file)
-        self.rows_uploaded = row_count
+            return f"{self.uuid.hex}__fetch.csv"
+        return f"whoknows_search_results_{self.created.date()}.csv"
+
+    @property
+    def json_filename(self):
+        if self.uploadable:
+            return f"{self.uuid.hex}__fetch.json"
+        return f"whoknows_search_results_{self.created.date()}.json"
+
+    def _complete_upload(self, rows_uploaded):
+        self.rows_uploaded = rows_uploaded
         self.status = self.ExportStatusOptions.COMPLETE
         self.save()
+        count_rows("upload", rows_uploaded)
         # Update metadata to ensure download on link-click for users.
-        if isinstance(self.csv.storage, GoogleCloudStorage):
-            client = storage.Client()
-            bucket = client.get_bucket(settings.GS_BUCKET_NAME)
-            blob_name = self.csv.url.split(settings.GS_BUCKET_NAME + "/", maxsplit=1)[
-                -1
-            ]
-            blob = bucket.get_blob(blob_name)
-            blob.content_disposition = "attachment"
-            blob.content_type = "text/csv"
-            blob.patch()
+        self.set_download_metadata(self.csv, content_type="text/csv")
+        self.set_download_metadata(self.json_file, content_type="application/json")
         return self.csv.url
 
+    def start_csv_parts(self):
+        """
+        Signatures writing the csv and json downloads in parts, each covering
+        PAGES_PER_CSV_PART pages, with the export's part counter set to their number.
+        None when the export is small enough to write in one go.
+
+        Each part records itself with `record_csv_part`; `await_csv_parts` joins
+        them once none is pending.
+        """
+        from whoweb.search.tasks import write_csv_part
+
+        page_nums = self.get_row_index()["pages"]
+        if len(page_nums) <= self.PAGES_PER_CSV_PART:
+            return None
+        parts = [
+            write_csv_part.si(
+                export_id=self.pk,
+                part_num=part_num,
+                page_nums=page_nums[start : start + self.PAGES_PER_CSV_PART],
+            ).set(priority=self.queue_priority)
+            for part_num, start in enumerate(
+                range(0, len(page_nums), self.PAGES_PER_CSV_PART)
+            )
+        ]
+        self.csv_parts = {"pending": len(parts), "parts": {}}
+        SearchExport.objects.filter(pk=self.pk).update(csv_parts=self.csv_parts)
+        return parts
+
+    def record_csv_part(
+        self, part_num: int, name: str, row_count: int, json_name: str, json_count: int
+    ) -> int:
+        """Record a written part against the part counter; the number still pending."""
+        with transaction.atomic():
+            export = (
+                SearchExport.objects.filter(pk=self.pk)
+                .select_for_update()
+                .only("pk", "csv_parts")
+                .get()
+            )
+            csv_parts = export.csv_parts
+            if str(part_num) in csv_parts["parts"]:
+                # Written twice by a retried task; the first one counts.
+                recorded = csv_parts["parts"][str(part_num)]
+                if name != recorded[0]:
+                    self.csv.storage.delete(name)
+                if json_name != recorded[2]:
+                    self.json_file.storage.delete(json_name)
+            else:
+                csv_parts["parts"][str(part_num)] = [
+                    name,
+                    row_count,
+                    json_name,
+                    json_count,
+                ]
+                csv_parts["pending"] -= 1
+                SearchExport.objects.filter(pk=self.pk).update(csv_parts=csv_parts)
+        self.csv_parts = csv_parts
+        return csv_parts["pending"]
+
+    def written_csv_parts(self) -> Optional[List[Tuple[str, int, str, int]]]:
+        """Parts recorded by `record_csv_part`, in order, or None while any is pending."""
+        csv_parts = (
+            SearchExport.objects.filter(pk=self.pk)
+            .values_list("csv_parts", flat=True)
+            .get()
+        )
+        if not csv_parts or csv_parts["pending"] > 0:
+            return None
+        return [
+            tuple(part)
+            for _, part in sorted(
+                csv_parts["parts"].items(), key=lambda item: int(item[0])
+            )
+        ]
+
+    def csv_part_name(self, part, ext="csv"):
+        return f"exports/{self.uuid.hex}/download/parts/{part}.{ext}"
+
+    def write_csv_part(
+        self, part_num: int, page_nums: List[int]
+    ) -> Tuple[str, int, str, int]:
+        """
+        Write the rows of the given pages to a csv part file (no header) and a json
+        part file (comma separated rows, no envelope); their names and row counts.
+        Csv rows are capped at the export's target, as any single part could hold
+        them all; json rows are not, like the single-file json download.
+        """
+        raw = itertools.chain.from_iterable(
+            data
+            for page, data in self.iter_page_data(
+                self.pages.filter(page_num__in=page_nums)
+                .order_by("page_num")
+                .iterator(chunk_size=1)
+            )
+        )
+        profiles = list(self.get_profiles(raw=raw))
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        row_count = 0
+        for row in self.generate_csv_rows(
+            rows=profiles, header=False, registry_rows=profiles
+        ):
+            writer.writerow(row)
+            row_count += 1
+        name = self.csv.storage.save(
+            self.csv_part_name(f"{part_num:05d}"),
+            ContentFile(buffer.getvalue().encode("utf-8")),
+        )
+        json_name = self.json_file.storage.save(
+            self.csv_part_name(f"{part_num:05d}", ext="json"),
+            ContentFile(
+                ",".join(profile.to_version() for profile in profiles).encode("utf-8")
+            ),
+        )
+        return name, row_count, json_name, len(profiles)
+
+    def compose_csv_parts(
+        self, parts: List[Tuple[str, int, str, int]], task_context=None
+    ):
+        """
+        Join csv parts, in order, under a single header into the export's csv,
+        keeping no more than ``target`` rows in total, and json parts into the
+        export's json.
+        """
+        self.log_event(UPLOAD_TO_BUCKET, task=task_context, data={"parts": len(parts)})
+        file_storage = self.csv.storage
+        kept, row_count = [], 0
+        for name, count, json_name, json_count in parts:
+            remaining = self.target - row_count
+            if remaining <= 0:
+                break
+            if count > remaining:
+                name = self._truncate_csv_part(name, remaining)
+                count = remaining
+            kept.append(name)
+            row_count += count
+
+        buffer = StringIO()
+        csv.writer(buffer).writerow(self.get_column_names())
+        header = file_storage.save(
+            self.csv_part_name("header"), ContentFile(buffer.getvalue().encode("utf-8"))
+        )
+        self._compose_parts(self.csv, self.csv_filename, [header] + kept, "text/csv")
+
+        json_storage = self.json_file.storage
+        json_header, json_separator, json_footer = (
+            json_storage.save(self.csv_part_name(part, ext="json"), ContentFile(text))
+            for part, text in (
+                ("header", b'{"results":['),
+                ("separator", b","),
+                ("footer", b"]}"),
+            )
+        )
+        json_sources = [json_header]
+        for name, count, json_name, json_count in parts:
+            if json_count:
+                if len(json_sources) > 1:
+                    json_sources.append(json_separator)
+                json_sources.append(json_name)
+        json_sources.append(json_footer)
+        self._compose_parts(
+            self.json_file, self.json_filename, json_sources, "application/json"
+        )
+
+        for name, count, json_name, json_count in parts:
+            file_storage.delete(name)
+            json_storage.delete(json_name)
+        file_storage.delete(header)
+        for name in (json_header, json_separator, json_footer):
+            json_storage.delete(name)
+        self.csv_parts = None
+        SearchExport.objects.filter(pk=self.pk).update(csv_parts=None)
+        return self._complete_upload(rows_uploaded=row_count)
+
+    def _compose_parts(self, field_file, filename, sources: List[str], content_type):
+        """Concatenate stored files, in order, into `field_file` without saving."""
+        file_storage = field_file.storage
+        if isinstance(file_storage, GoogleCloudStorage):
+            name = field_file.field.generate_filename(self, filename)
+            compose_blobs(
+                file_storage,
+                sources=[gcs_blob_name(file_storage, source) for source in sources],
+                destination=gcs_blob_name(file_storage, name),
+                content_type=content_type,
+            )
+            field_file.name = name
+        else:
+            with TemporaryFile() as tmp:
+                for source in sources:
+                    with file_storage.open(source, "rb") as part:
+                        shutil.copyfileobj(part, tmp)
+                tmp.seek(0)
+                field_file.save(filename, File(tmp), save=False)
+
+    def _truncate_csv_part(self, name, num_rows):
+        with self.csv.storage.open(name, "rb") as part:
+            reader = csv.reader(TextIOWrapper(part, encoding="utf-8", newline=""))
+            buffer = StringIO()
+            csv.writer(buffer).writerows(itertools.islice(reader, num_rows))
+        self.csv.storage.delete(name)
+        return self.csv.storage.save(
+            name, ContentFile(buffer.getvalue().encode("utf-8"))
+        )
+
+    def upload_json_to_static_bucket(self):
+        """
+        Precompute the json download so that serving it is a redirect, like the csv.
+        Rows are streamed through a temporary file rather than built up in memory.
+        Always built from this export's own pages, which is what the on-the-fly
+        json download serves.
+        """
+        with TemporaryFile() as tmp:
+            for chunk in self.generate_json_content():
+                tmp.write(chunk.encode("utf-8"))
+            tmp.seek(0)
+            self.json_file.save(self.json_filename, File(tmp), save=False)
+
+    @staticmethod
+    def set_download_metadata(field_file, content_type):
+        if not field_file or not isinstance(field_file.storage, GoogleCloudStorage):
+            return
+        client = storage.Client()
+        bucket = client.get_bucket(settings.GS_BUCKET_NAME)
+        blob_name = field_file.url.split(settings.GS_BUCKET_NAME + "/", maxsplit=1)[-1]
+        blob = bucket.get_blob(blob_name)
+        blob.content_disposition = "attachment"
+        blob.content_type = content_type
+        blob.patch()
+
     @transaction.atomic
     def send_link(self):
         if self.sent:
@@ -978,6 +1654,9 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
         sigs |= upload_to_static_bucket.si(export_id=self.pk)
         if self.notify:
             sigs |= send_notification.si(export_id=self.pk).set(priority=3)
+        headers = trace_headers(self)
+        if headers:
+            sigs.set(headers=headers)
         return sigs
 
     def get_absolute_url(self, filetype="csv"):
@@ -985,6 +1664,8 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
             return
         if filetype == "csv":
             return self.csv.url if self.csv else None
+        if filetype == "json" and self.json_file:
+            return self.json_file.url
         return reverse(
             "search:download_export", kwargs={"uuid": self.uuid, "filetype": filetype}
         )
@@ -994,6 +1675,12 @@ class SearchExport(EventLoggingModel, TimeStampedModel, SoftDeletableModel):
             return reverse("exportresult-detail", args=[self.uuid])
 
 
+class SearchExportPageQuerySet(models.QuerySet):
+    def finished(self):
+        """Pages holding their rows, in the database or in the export's archive."""
+        return self.filter(Q(data__isnull=False) | Q(archived_at__isnull=False))
+
+
 class SearchExportPage(TimeStampedModel):
     export = models.ForeignKey(
         SearchExport, on_delete=models.CASCADE, related_name="pages"
@@ -1021,6 +1708,27 @@ class SearchExportPage(TimeStampedModel):
         default=PageStatusOptions.CREATED,
     )
     status_changed = MonitorField(_("status changed"), monitor="status")
+    scheduled_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+        help_text="When the page was queued with the fair-share scheduler.",
+    )
+    released_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="When the scheduler released the page to workers.",
+    )
+    archived_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="When the page's rows were moved to the export's page archive.",
+    )
+
+    objects = SearchExportPageQuerySet.as_manager()
 
     class Meta:
         unique_together = ["export", "page_num"]
@@ -1042,10 +1750,51 @@ class SearchExportPage(TimeStampedModel):
                 page=page, data=profile.dict()  # exclude=SearchExport.PROFILE_EXCLUDES
             )
             created = True
-        if page:
-            page.pending_count = F("pending_count") - int(created)
-            page.progress_counter = F("progress_counter") + int(created)
-            page.save()
+        # A row already there for the profile was saved by an earlier derivation;
+        # this one still has to be counted.
+        cls.count_down(page.pk, saved=created)
+        count_rows("derive", int(created))
+        return page
+
+    @classmethod
+    def count_down(cls, page_pk: int, saved=False) -> Optional["SearchExportPage"]:
+        """
+        Record one finished derivation against the page's pending counter.
+
+        Whichever derivation brings the counter to zero enqueues `finalize_page`.
+        Pages whose counter never gets there are picked up by `sweep_stale_pages`.
+        Meanwhile the export's page stats are refreshed at most once every
+        EXPORT_PAGE_STATS_INTERVAL seconds, outside the page's lock.
+
+        Pages that are no longer working, or have nothing pending, are left alone:
+        a derivation deferred past the sweep must not count down a completed page.
+        """
+        from whoweb.search.tasks import finalize_page
+
+        with transaction.atomic():
+            page = (
+                cls.objects.filter(
+                    pk=page_pk,
+                    status=cls.PageStatusOptions.WORKING,
+                    pending_count__gt=0,
+                )
+                .select_for_update()
+                .only("pk", "export_id", "status", "pending_count", "progress_counter")
+                .first()
+            )
+            if page is None:
+                return None
+            page.pending_count -= 1
+            page.progress_counter += int(saved)
+            page.save(update_fields=["pending_count", "progress_counter", "modified"])
+        if page.pending_count == 0:
+            finalize_page.delay(pk=page.pk)
+        elif cache.add(
+            f"export-page-stats-{page.export_id}",
+            1,
+            settings.EXPORT_PAGE_STATS_INTERVAL,
+        ):
+            SearchExport.refresh_page_stats(page.export_id)
         return page
 
     def locked(self):
@@ -1063,7 +1812,7 @@ class SearchExportPage(TimeStampedModel):
         scroll = self.export.scroll
         ids = scroll.get_ids_for_page(self.page_num)
         profiles = [
-            p.dict(exclude=SearchExport.PROFILE_EXCLUDES)
+            p.dict(exclude=SearchExport.STORED_PROFILE_EXCLUDES)
             for p in scroll.get_profiles_for_page(self.page_num)
         ]
         self.count = len(profiles)
@@ -1076,15 +1825,21 @@ class SearchExportPage(TimeStampedModel):
         self.export.progress_counter = F("progress_counter") + self.count + adjustment
         self.export.target = F("target") + adjustment
         self.export.save()
+        SearchExport.refresh_page_stats(self.export_id)
+        count_rows("search", self.count)
+        count_rows("page", self.count)
         return self.count
 
-    @transaction.atomic
     def populate_data_directly(self, task_context=None):
         self.export.log_event(
             evt=POPULATE_DATA, task=task_context, data={"page": self.page_num}
         )
-        page = self.locked()
-        return page._populate_data_directly()
+        with transaction.atomic():
+            page = self.locked()
+            count = page._populate_data_directly()
+        if count:
+            self.export.push_to_webhooks(page.data, page_num=self.page_num)
+        return count
 
     def get_derivation_tasks(self):
         from whoweb.search.tasks import process_derivation_fast, process_derivation_slow
@@ -1093,6 +1848,7 @@ class SearchExportPage(TimeStampedModel):
             return None
 
         profiles = self.export.scroll.get_profiles_for_page(self.page_num)
+        count_rows("search", len(profiles))
 
         if self.export.defer_validation:
             process_derivation = process_derivation_fast
@@ -1131,6 +1887,8 @@ class SearchExportPage(TimeStampedModel):
         self.save()
         self.export.progress_counter = F("progress_counter") + self.count
         self.export.save()
+        SearchExport.refresh_page_stats(self.export_id)
+        count_rows("page", self.count)
         return profiles
 
     def do_post_derive_process(self, task_context=None):
@@ -1140,7 +1898,7 @@ class SearchExportPage(TimeStampedModel):
         with transaction.atomic():
             page = self.locked()
             profiles = page._do_post_derive_process()
-        self.export.push_to_webhooks(profiles)
+        self.export.push_to_webhooks(profiles, page_num=self.page_num)
 
 
 class MXDomain(models.Model):
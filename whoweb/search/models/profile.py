@@ -1,7 +1,10 @@
+import itertools
 import json
 import re
-from enum import Enum
-from typing import Optional, List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum, IntEnum
+from typing import Optional, List, Dict, Any, Tuple
+from urllib.parse import urlsplit
 
 import requests
 from datetime import datetime, date
@@ -10,19 +13,26 @@ from bson import ObjectId
 from bson.errors import InvalidId
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.contrib.postgres.fields import JSONField
+from django.contrib.postgres.fields import ArrayField, JSONField
+from django.core.cache import cache
 from django.core.serializers.json import DjangoJSONEncoder
-from django.db import models
+from django.db import models, transaction
 from django.http import Http404
 from django.utils import dateparse
 from django.utils.six import string_types
+from django.utils.translation import ugettext_lazy as _
+from model_utils.fields import MonitorField
 from model_utils.models import TimeStampedModel
 from pydantic import BaseModel, Extra, parse_obj_as, validator, root_validator
 from rest_framework.reverse import reverse
 from uuid import uuid4
 
+from whoweb.core.coalescing import fingerprint
+from whoweb.core.exceptions import ServiceOverloaded
+from whoweb.core.metrics import count_cache, count_rows
 from whoweb.core.router import router
 from whoweb.core.utils import PERSONAL_DOMAINS
+from whoweb.payments.exceptions import PaymentRequired
 from whoweb.payments.models import BillingAccountMember
 
 RETRY = "retry"
@@ -37,6 +47,10 @@ PHONE = "phone"
 PROFILE = "profile"
 GRADE_VALUES = {"A+": 100, "A": 90, "B+": 75, "B": 60}
 
+# Bump whenever a change to the models below alters what validation produces,
+# so that data stored by an older version is validated again when read.
+PROFILE_SCHEMA_VERSION = 1
+
 User = get_user_model()
 
 
@@ -96,6 +110,16 @@ class ResultExperience(BaseModel):
     def dates(cls, v):
         return dates(v)
 
+    @classmethod
+    def from_trusted(cls, data: dict) -> "ResultExperience":
+        """
+        Build from the ``.dict()`` of a validated instance without validating again.
+        Dates are the only values which lose their type on a round trip through json.
+        """
+        return cls.construct(
+            **{**data, "start": dates(data.get("start")), "end": dates(data.get("end"))}
+        )
+
 
 class ResultEducation(BaseModel):
     school: str = ""
@@ -118,6 +142,12 @@ class ResultEducation(BaseModel):
     def dates(cls, v):
         return dates(v)
 
+    @classmethod
+    def from_trusted(cls, data: dict) -> "ResultEducation":
+        return cls.construct(
+            **{**data, "start": dates(data.get("start")), "end": dates(data.get("end"))}
+        )
+
 
 class Skill(BaseModel):
     tag: str = ""
@@ -169,6 +199,10 @@ class GradedEmail(BaseModel):
     def set_str_none_to_emptystring(cls, v):
         return v or ""
 
+    @classmethod
+    def from_trusted(cls, data: dict) -> "GradedEmail":
+        return cls.construct(**data)
+
     @property
     def is_passing(self):
         return bool(self.email and self.grade[0] in ["A", "B"])
@@ -205,6 +239,10 @@ class GradedPhone(BaseModel):
     def set_str_none_to_emptystring(cls, v):
         return v or ""
 
+    @classmethod
+    def from_trusted(cls, data: dict) -> "GradedPhone":
+        return cls.construct(**data)
+
     def __lt__(self, other):
         return self.status_value < other.status_value
 
@@ -331,9 +369,43 @@ class ResultProfile(BaseModel):
     derivation_requested_phone: bool = False
     returned_status: str = ""
 
+    schema_version: int = PROFILE_SCHEMA_VERSION
+
     class Config:
         extra = Extra.allow
 
+    @classmethod
+    def from_trusted(cls, data: dict) -> "ResultProfile":
+        """
+        Rebuild a profile from data we stored ourselves, i.e. the ``.dict()`` of a
+        profile that has already been validated, skipping pydantic validation.
+        Data that is not tagged with the current schema version is validated as usual.
+        """
+        if data.get("schema_version") != PROFILE_SCHEMA_VERSION:
+            return cls(**data)
+        values = dict(data)
+        for field, model in (
+            ("experience", ResultExperience),
+            ("education_history", ResultEducation),
+            ("graded_emails", GradedEmail),
+            ("graded_phones", GradedPhone),
+        ):
+            if values.get(field):
+                values[field] = [model.from_trusted(item) for item in values[field]]
+        for field, model in (("skills", Skill), ("social_links", SocialLink)):
+            if values.get(field):
+                values[field] = [model.construct(**item) for item in values[field]]
+        if values.get("diversity"):
+            values["diversity"] = Diversity(**values["diversity"])
+        if values.get("updated"):
+            values["updated"] = dates(values["updated"])
+        return cls.construct(**values)
+
+    @validator("schema_version", pre=True, always=True)
+    def set_schema_version(cls, v):
+        # Anything that made it through validation conforms to the current schema.
+        return PROFILE_SCHEMA_VERSION
+
     @root_validator(pre=True)
     def set_id_field(cls, values):
         values.setdefault(
@@ -466,9 +538,9 @@ class ResultProfile(BaseModel):
 
         self.graded_phones = sorted(derived.phone_details, reverse=True)
 
-        self.li_url = derived.linkedin_url
-        self.facebook = derived.facebook
-        self.twitter = derived.twitter
+        self.li_url = derived.linkedin_url or ""
+        self.facebook = derived.facebook or ""
+        self.twitter = derived.twitter or ""
         self.social_links = derived.social_links
 
         if not self.company and derived.extra:
@@ -820,6 +892,7 @@ class DerivationCache(TimeStampedModel):
                 "phones": graded_phones_serializable,
             },
         )
+        count_cache("derivation", not created)
         if created:
             charge = billing_seat.plan.compute_contact_credit_use(profile=profile)
         else:
@@ -837,14 +910,408 @@ class DerivationCache(TimeStampedModel):
             obj.save()
         return obj, charge
 
+    @classmethod
+    def get_or_charge_many(
+        cls, billing_seat: BillingAccountMember, profiles: List[ResultProfile]
+    ) -> List[tuple]:
+        """
+        `get_or_charge` for many profiles in a handful of queries. A profile
+        repeated in `profiles` is charged as if already cached by its first.
+        """
+        plan = billing_seat.plan
+        caches = {
+            obj.profile_id: obj
+            for obj in cls.objects.filter(
+                billing_seat=billing_seat,
+                profile_id__in={profile.id for profile in profiles},
+            )
+        }
+        created, updated, charges = {}, {}, []
+        for profile in profiles:
+            emails = [email.dict() for email in profile.graded_emails]
+            phones = [phone.dict() for phone in profile.graded_phones]
+            obj = caches.get(profile.id)
+            count_cache("derivation", obj is not None)
+            if obj is None:
+                obj = caches[profile.id] = created[profile.id] = cls(
+                    billing_seat=billing_seat,
+                    profile_id=profile.id,
+                    emails=emails,
+                    phones=phones,
+                )
+                charges.append((obj, plan.compute_contact_credit_use(profile=profile)))
+                continue
+            charge = plan.compute_additional_contact_info_credit_use(
+                cached_emails=[GradedEmail(**email) for email in obj.emails],
+                cached_phones=[GradedPhone(**phone) for phone in obj.phones],
+                profile=profile,
+            )
+            charges.append((obj, charge))
+            if len(emails) > len(obj.emails):
+                obj.emails = emails
+            if len(phones) > len(obj.phones):
+                obj.phones = phones
+            if obj.pk:
+                updated[profile.id] = obj
+
+        cls.objects.bulk_create(created.values(), ignore_conflicts=True)
+        if updated:
+            cls.objects.bulk_update(updated.values(), ["emails", "phones"])
+        if created:
+            saved = {
+                obj.profile_id: obj
+                for obj in cls.objects.filter(
+                    billing_seat=billing_seat, profile_id__in=created
+                )
+            }
+            charges = [
+                (saved.get(obj.profile_id, obj), charge) for obj, charge in charges
+            ]
+        return charges
+
+
+def normalize_linkedin_url(url):
+    """`linkedin.com/in/Name/?trk=x` -> `https://linkedin.com/in/name`"""
+    url = url.strip()
+    if "://" not in url:
+        url = f"https://{url}"
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return f"https://{host}{parts.path.lower().rstrip('/')}"
+
+
+def normalize_enrichment_input(
+    email=None,
+    linkedin_url=None,
+    user_id=None,
+    profile_id=None,
+    min_confidence=None,
+    get_web_profile=None,
+    **kwargs,
+) -> dict:
+    """
+    The lookup arguments of an enrichment input, spelled the same way for every
+    input naming the same person. `no_cache` and `update` are left out.
+    """
+    lookup = {
+        "email": email.strip().lower() if email else None,
+        "linkedin_url": normalize_linkedin_url(linkedin_url) if linkedin_url else None,
+        "user_id": user_id.strip() if user_id else None,
+        "profile_id": profile_id.strip() if profile_id else None,
+        "min_confidence": min_confidence,
+        "get_web_profile": True if get_web_profile is None else get_web_profile,
+    }
+    return {key: value for key, value in lookup.items() if value is not None}
+
 
 class BatchProfileActionResult(TimeStampedModel):
+    """
+    A batch of profile actions run in chunks by celery tasks. Each chunk stores
+    its results in its own row as it finishes; the webhooks get all of them once
+    none are pending.
+    """
+
+    class BatchStatusOptions(IntEnum):
+        PENDING = 0
+        WORKING = 2
+        COMPLETE = 4
+
     billing_seat = models.ForeignKey(BillingAccountMember, on_delete=models.CASCADE)
+    initiated_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True
+    )
     id = models.UUIDField(primary_key=True, default=uuid4)
-    group_task_id = models.CharField(max_length=255)
-    results = JSONField()
+    group_task_id = models.CharField(max_length=255, blank=True, default="")
     size = models.IntegerField(default=0)
+    pending_count = models.IntegerField(default=0)
+    credits_used = models.IntegerField(default=0)
+    webhooks = ArrayField(models.URLField(max_length=2000), default=list, blank=True)
+    status = models.IntegerField(
+        _("status"),
+        db_index=True,
+        choices=[(s.value, s.name) for s in BatchStatusOptions],
+        blank=True,
+        default=BatchStatusOptions.PENDING,
+    )
+    status_changed = MonitorField(_("status changed"), monitor="status")
 
     @property
     def status_url(self):
         return reverse("batch_result-detail", kwargs={"pk": self.id.hex})
+
+    @property
+    def results(self) -> List[dict]:
+        return [
+            result
+            for chunk in self.chunks.order_by("pk").values_list("results", flat=True)
+            for result in chunk
+        ]
+
+    @staticmethod
+    def entity_result(entity, status, profile=None, credits_used=0):
+        return {
+            "input": {
+                ("id" if key == "_id" else key): value for key, value in entity.items()
+            },
+            "status": status,
+            "credits_used": credits_used,
+            "profile": profile.dict(exclude={"schema_version"}) if profile else None,
+        }
+
+    def derive_contacts(
+        self, entities: List[dict], timeout=None
+    ) -> Tuple[List[dict], List[dict], Optional[float]]:
+        """
+        Derive the contact info of `entities`, charge for it at once and record
+        the results.
+
+        Returns the entities to retry because the derive service timed out or
+        couldn't be reached, the entities it turned away before trying, and when
+        it asked to be tried again.
+        """
+        if timeout is None:
+            timeout = settings.BATCH_DERIVE_TIMEOUT
+        results, derived, remaining, deferred, retry_after = [], [], [], [], None
+        for i, entity in enumerate(entities):
+            try:
+                profile = ResultProfile.derive(**entity, timeout=timeout)
+            except ServiceOverloaded as e:
+                deferred, retry_after = entities[i:], e.retry_after
+                break
+            except Http404:
+                results.append(self.entity_result(entity, "not_found"))
+            except requests.HTTPError:
+                results.append(self.entity_result(entity, FAILED))
+            except (requests.Timeout, requests.ConnectionError):
+                remaining.append(entity)
+            else:
+                if profile.derivation_status == RETRY:
+                    remaining.append(entity)
+                else:
+                    derived.append((entity, profile))
+
+        try:
+            with transaction.atomic():
+                charges = DerivationCache.get_or_charge_many(
+                    billing_seat=self.billing_seat,
+                    profiles=[profile for _, profile in derived],
+                )
+                credits_used = sum(charge for _, charge in charges)
+                if credits_used > 0 and not self.billing_seat.consume_credits(
+                    amount=credits_used,
+                    evidence=tuple({obj.pk: obj for obj, _ in charges}.values()),
+                    initiated_by=self.initiated_by,
+                ):
+                    raise PaymentRequired()
+        except PaymentRequired:
+            # Nothing was cached, so the contacts can be derived again once paid.
+            credits_used = 0
+            results += [
+                self.entity_result(entity, "insufficient_credits")
+                for entity, _ in derived
+            ]
+        else:
+            results += [
+                self.entity_result(entity, profile.derivation_status, profile, charge)
+                for (entity, profile), (_, charge) in zip(derived, charges)
+            ]
+        self.record_results(results, credits_used=credits_used)
+        return remaining, deferred, retry_after
+
+    @staticmethod
+    def enrichment_cache_key(lookup):
+        return f"enrichment-{fingerprint(PROFILE_SCHEMA_VERSION, lookup)}"
+
+    @staticmethod
+    def _enrich(lookup, no_cache, update):
+        try:
+            profile = ResultProfile.enrich(
+                **lookup, no_cache=no_cache or None, update=update
+            )
+        except Http404:
+            return None, "not_found"
+        except requests.RequestException:
+            return None, FAILED
+        return profile, profile.returned_status or COMPLETE
+
+    @classmethod
+    def enrichment_chunks(cls, entities: List[dict], chunk_size) -> List[List[dict]]:
+        """
+        Split `entities` into chunks of at most `chunk_size` distinct people,
+        keeping every input naming the same person in the same chunk.
+        """
+        people = {}
+        for entity in entities:
+            key = cls.enrichment_cache_key(normalize_enrichment_input(**entity))
+            people.setdefault(key, []).append(entity)
+        people = list(people.values())
+        return [
+            list(itertools.chain.from_iterable(people[start : start + chunk_size]))
+            for start in range(0, len(people), chunk_size)
+        ]
+
+    def enrich_profiles(self, entities: List[dict]):
+        """
+        Enrich one chunk of `entities`, looking each distinct person up once, and
+        record the results. The batch is charged for every chunk at once when the
+        last one is recorded.
+
+        Inputs naming the same person share one result and one charge. Results
+        enriched within ENRICHMENT_CACHE_TTL seconds are served from the cache
+        unless an input asks for `no_cache` or `update`; the rest are looked up
+        BATCH_ENRICH_CONCURRENCY at a time.
+        """
+        keys, groups = [], {}
+        for entity in entities:
+            lookup = normalize_enrichment_input(**entity)
+            key = self.enrichment_cache_key(lookup)
+            group = groups.setdefault(
+                key, {"lookup": lookup, "no_cache": False, "update": False}
+            )
+            group["no_cache"] |= bool(entity.get("no_cache"))
+            group["update"] |= bool(entity.get("update"))
+            keys.append(key)
+
+        outcomes = {}
+        cached = cache.get_many(
+            [key for key, g in groups.items() if not (g["no_cache"] or g["update"])]
+        )
+        for key in groups:
+            if key in cached:
+                profile = ResultProfile.from_trusted(cached[key])
+                outcomes[key] = (profile, profile.returned_status or COMPLETE)
+            count_cache("enrichment", hit=key in cached)
+
+        misses = [key for key in groups if key not in outcomes]
+        if misses:
+            with ThreadPoolExecutor(
+                min(settings.BATCH_ENRICH_CONCURRENCY, len(misses)),
+                thread_name_prefix="enrich",
+            ) as executor:
+                outcomes.update(
+                    zip(
+                        misses,
+                        executor.map(lambda key: self._enrich(**groups[key]), misses),
+                    )
+                )
+            cache.set_many(
+                {
+                    key: outcomes[key][0].dict()
+                    for key in misses
+                    if outcomes[key][0] is not None
+                },
+                settings.ENRICHMENT_CACHE_TTL,
+            )
+
+        charge = self.billing_seat.plan.credits_per_enrich
+        credits_used = charge * sum(
+            1 for profile, _ in outcomes.values() if profile is not None
+        )
+
+        results, charged = [], set()
+        for entity, key in zip(entities, keys):
+            profile, status = outcomes[key]
+            if profile is None:
+                results.append(self.entity_result(entity, status))
+            else:
+                results.append(
+                    self.entity_result(
+                        entity,
+                        status,
+                        profile,
+                        credits_used=0 if key in charged else charge,
+                    )
+                )
+                charged.add(key)
+        self.record_results(
+            results, credits_used=credits_used, charge_on_complete=True
+        )
+
+    def record_results(
+        self, results: List[dict], credits_used=0, charge_on_complete=False
+    ):
+        """
+        Store one chunk's results in their own row and count them against the
+        batch, so each chunk writes only its own results.
+
+        With `charge_on_complete`, the chunks' credits are charged in one ledger
+        transaction once the last of them is recorded. If the seat can't pay,
+        every result is recorded as insufficient_credits instead.
+        """
+        if not results:
+            return
+        with transaction.atomic():
+            batch = (
+                type(self)
+                .objects.filter(pk=self.pk)
+                .select_for_update()
+                .only("pk", "pending_count", "credits_used", "status", "status_changed")
+                .get()
+            )
+            BatchProfileActionChunk.objects.create(batch=batch, results=results)
+            was_pending = batch.pending_count > 0
+            batch.pending_count -= len(results)
+            batch.credits_used += credits_used
+            if batch.pending_count <= 0:
+                batch.status = self.BatchStatusOptions.COMPLETE
+                if was_pending and charge_on_complete:
+                    self._charge_for_results(batch)
+            else:
+                batch.status = self.BatchStatusOptions.WORKING
+            batch.save(
+                update_fields=[
+                    "pending_count",
+                    "credits_used",
+                    "status",
+                    "status_changed",
+                    "modified",
+                ]
+            )
+        count_rows("batch", len(results))
+        if was_pending and batch.pending_count <= 0:
+            transaction.on_commit(self.push_to_webhooks)
+
+    def _charge_for_results(self, batch):
+        if batch.credits_used <= 0 or self.billing_seat.consume_credits(
+            amount=batch.credits_used, evidence=(), initiated_by=self.initiated_by
+        ):
+            return
+        batch.credits_used = 0
+        for chunk in batch.chunks.select_for_update():
+            chunk.results = [
+                {
+                    **result,
+                    "status": "insufficient_credits",
+                    "credits_used": 0,
+                    "profile": None,
+                }
+                if result["profile"] is not None
+                else result
+                for result in chunk.results
+            ]
+            chunk.save(update_fields=["results", "modified"])
+
+    def push_to_webhooks(self):
+        from whoweb.search.tasks import deliver_export_webhook
+        from .webhooks import ExportWebhookDelivery
+
+        batch = type(self).objects.get(pk=self.pk)
+        results = batch.results
+        if not (batch.webhooks and results):
+            return
+        deliveries = ExportWebhookDelivery.create_for_batch_result(
+            batch_result=batch, urls=batch.webhooks, results=results
+        )
+        for delivery in deliveries:
+            deliver_export_webhook.delay(delivery.pk)
+
+
+class BatchProfileActionChunk(TimeStampedModel):
+    """The results of one chunk of a BatchProfileActionResult."""
+
+    batch = models.ForeignKey(
+        BatchProfileActionResult, on_delete=models.CASCADE, related_name="chunks"
+    )
+    results = JSONField(default=list, encoder=DjangoJSONEncoder)
@@ -0,0 +1,160 @@
+from collections import Counter
+from datetime import timedelta
+from typing import Dict, List, Optional, Iterable
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Max, Avg, F, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from whoweb.payments.models import BillingAccount
+from .export import SearchExport, SearchExportPage
+
+TENANT = "export__billing_seat__organization"
+
+
+class ExportPageScheduler:
+    """
+    Releases queued export pages to workers in weighted fair-share order.
+
+    Pages are queued per tenant (the billing account of the export's seat). Whenever
+    page slots free up below `EXPORT_SCHEDULER_MAX_PAGES_IN_FLIGHT`, each slot goes
+    to the tenant with the fewest pages in flight relative to its plan's
+    `export_scheduling_weight`, oldest queue first on ties.
+    """
+
+    def __init__(self, max_in_flight: Optional[int] = None):
+        if max_in_flight is None:
+            max_in_flight = settings.EXPORT_SCHEDULER_MAX_PAGES_IN_FLIGHT
+        self.max_in_flight = max_in_flight
+
+    @staticmethod
+    def queued():
+        return SearchExportPage.objects.filter(
+            scheduled_at__isnull=False, released_at__isnull=True
+        )
+
+    @staticmethod
+    def in_flight():
+        """
+        Released pages not yet complete, up to EXPORT_SCHEDULER_PAGE_TIMEOUT after
+        their release.
+        """
+        timeout = timedelta(seconds=settings.EXPORT_SCHEDULER_PAGE_TIMEOUT)
+        return SearchExportPage.objects.filter(
+            released_at__gte=timezone.now() - timeout,
+            export__is_removed=False,
+            export__status__lt=SearchExport.ExportStatusOptions.PAGES_COMPLETE,
+        ).exclude(status=SearchExportPage.PageStatusOptions.COMPLETE)
+
+    def schedule(self, page_ids: Iterable[int]) -> int:
+        return SearchExportPage.objects.filter(
+            pk__in=page_ids, scheduled_at__isnull=True
+        ).update(scheduled_at=timezone.now())
+
+    def queue_depths(self) -> Dict[Optional[int], dict]:
+        rows = (
+            self.queued()
+            .values(TENANT)
+            .annotate(
+                queued=Count("pk"),
+                oldest=Min("scheduled_at"),
+                weight=Max(
+                    Coalesce(F(f"{TENANT}__plan__export_scheduling_weight"), Value(1))
+                ),
+            )
+            .order_by()
+        )
+        return {row.pop(TENANT): row for row in rows}
+
+    def in_flight_counts(self) -> Dict[Optional[int], int]:
+        rows = self.in_flight().values(TENANT).annotate(n=Count("pk")).order_by()
+        return {row[TENANT]: row["n"] for row in rows}
+
+    @staticmethod
+    def allocate(
+        capacity: int, queues: Dict[Optional[int], dict], in_flight: Dict
+    ) -> Counter:
+        """Hand out free slots one at a time to the tenant furthest below its share."""
+        load = {tenant: in_flight.get(tenant, 0) for tenant in queues}
+        remaining = {tenant: queue["queued"] for tenant, queue in queues.items()}
+        shares = Counter()
+        for _ in range(max(capacity, 0)):
+            waiting = [tenant for tenant, left in remaining.items() if left > 0]
+            if not waiting:
+                break
+            tenant = min(
+                waiting,
+                key=lambda t: (
+                    load[t] / max(queues[t]["weight"], 1),
+                    queues[t]["oldest"],
+                ),
+            )
+            shares[tenant] += 1
+            load[tenant] += 1
+            remaining[tenant] -= 1
+        return shares
+
+    def release(self) -> List[SearchExportPage]:
+        in_flight = self.in_flight_counts()
+        capacity = self.max_in_flight - sum(in_flight.values())
+        if capacity <= 0:
+            return []
+        shares = self.allocate(capacity, self.queue_depths(), in_flight)
+        released = []
+        now = timezone.now()
+        with transaction.atomic():
+            for tenant, share in shares.items():
+                pages = list(
+                    self.queued()
+                    .filter(
+                        **{TENANT: tenant} if tenant else {f"{TENANT}__isnull": True}
+                    )
+                    .select_related("export")
+                    .select_for_update(skip_locked=True, of=("self",))
+                    .order_by("scheduled_at", "pk")[:share]
+                )
+                SearchExportPage.objects.filter(pk__in=[p.pk for p in pages]).update(
+                    released_at=now
+                )
+                for page in pages:
+                    page.released_at = now
+                released.extend(pages)
+        return released
+
+    def stats(self) -> List[dict]:
+        now = timezone.now()
+        queues = self.queue_depths()
+        in_flight = self.in_flight_counts()
+        recent = {
+            row[TENANT]: row["wait"]
+            for row in SearchExportPage.objects.filter(
+                released_at__gte=now - timedelta(hours=1)
+            )
+            .values(TENANT)
+            .annotate(wait=Avg(F("released_at") - F("scheduled_at")))
+            .order_by()
+        }
+        names = dict(
+            BillingAccount.objects.filter(
+                pk__in=[t for t in {*queues, *in_flight, *recent} if t]
+            ).values_list("pk", "name")
+        )
+        stats = []
+        for tenant in sorted({*queues, *in_flight, *recent}, key=lambda t: t or 0):
+            queue = queues.get(tenant, {})
+            oldest = queue.get("oldest")
+            recent_wait = recent.get(tenant)
+            stats.append(
+                {
+                    "organization": tenant,
+                    "name": names.get(tenant, ""),
+                    "weight": queue.get("weight", 1),
+                    "queued": queue.get("queued", 0),
+                    "in_flight": in_flight.get(tenant, 0),
+                    "oldest_wait": (now - oldest).total_seconds() if oldest else 0,
+                    "recent_wait": recent_wait.total_seconds() if recent_wait else 0,
+                }
+            )
+        return stats
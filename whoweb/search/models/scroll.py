@@ -15,6 +15,8 @@ from model_utils.models import TimeStampedModel
 from pydantic import parse_obj_as
 
 from whoweb.contrib.postgres.fields import EmbeddedModelField
+from whoweb.core.coalescing import LOCAL, SHARED
+from whoweb.core.metrics import count_cache
 from whoweb.core.router import router
 from .profile import ResultProfile
 from .embedded import FilteredSearchQuery
@@ -84,7 +86,7 @@ class ScrollSearch(TimeStampedModel):
             query["ids_only"] = True
             query["filters"]["skip"] = 0
             query["filters"]["limit"] = 1
-            results = router.unified_search(json=query, timeout=30)
+            results = router.unified_search(json=query, timeout=30, coalesce=SHARED)
             self.total = results.get("total_results", 0)
             self.save()
         return self.total
@@ -98,7 +100,9 @@ class ScrollSearch(TimeStampedModel):
             query["filters"]["limit"] = limit
         if skip:
             query["filters"]["skip"] = skip
-        results = router.unified_search(json=query, timeout=120).get("results", [])
+        results = router.unified_search(json=query, timeout=120, coalesce=LOCAL).get(
+            "results", []
+        )
         if ids_only:
             return [result["profile_id"] for result in results]
         else:
@@ -157,8 +161,10 @@ class ScrollSearch(TimeStampedModel):
         return self.pages.filter(page_number=page, key_used=self.scroll_id()).exists()
 
     def get_ids_for_page(self, page=0) -> typing.List[str]:
-        if self.page_from_cache(page) is not None:
-            return self.page_from_cache(page)
+        cached = self.page_from_cache(page)
+        count_cache("scroll_page", cached is not None)
+        if cached is not None:
+            return cached
 
         for p in range(page):
             if (
@@ -192,7 +198,7 @@ class ScrollSearch(TimeStampedModel):
                 },
                 "defer": ["degree_levels", "company_counts"],
             }
-            result = router.unified_search(json=id_query, timeout=90)
+            result = router.unified_search(json=id_query, timeout=90, coalesce=LOCAL)
             results.extend(result.get("results", []))
         return parse_obj_as(typing.List[ResultProfile], results)
 
@@ -0,0 +1,193 @@
+import gzip
+import hashlib
+import json
+from enum import IntEnum
+from typing import List
+
+import requests
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+from model_utils.fields import MonitorField
+from model_utils.models import TimeStampedModel
+
+from .profile import ResultProfile
+
+
+class ExportWebhookDelivery(TimeStampedModel):
+    """
+    One batch of export rows, or of batch profile action results, pushed to one
+    webhook, doubling as its delivery receipt. The compressed body is dropped once
+    delivered.
+    """
+
+    class DeliveryStatusOptions(IntEnum):
+        PENDING = 0
+        DELIVERED = 4
+        FAILED = 8
+
+    export = models.ForeignKey(
+        "search.SearchExport",
+        on_delete=models.CASCADE,
+        related_name="webhook_deliveries",
+        null=True,
+        blank=True,
+    )
+    batch_result = models.ForeignKey(
+        "search.BatchProfileActionResult",
+        on_delete=models.CASCADE,
+        related_name="webhook_deliveries",
+        null=True,
+        blank=True,
+    )
+    url = models.URLField(max_length=2000)
+    page_num = models.PositiveIntegerField(null=True, blank=True)
+    batch = models.PositiveIntegerField(default=0)
+    size = models.IntegerField(default=0, help_text="Number of rows in the batch.")
+    body = models.BinaryField(null=True, editable=False)
+    status = models.IntegerField(
+        _("status"),
+        db_index=True,
+        choices=[(s.value, s.name) for s in DeliveryStatusOptions],
+        blank=True,
+        default=DeliveryStatusOptions.PENDING,
+    )
+    status_changed = MonitorField(_("status changed"), monitor="status")
+    attempts = models.IntegerField(default=0)
+    response_status = models.IntegerField(null=True, blank=True)
+    response_body = models.TextField(blank=True, default="")
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = [
+            ["export", "url", "page_num", "batch"],
+            ["batch_result", "url", "batch"],
+        ]
+        ordering = ["export", "page_num", "batch", "url"]
+
+    ATTEMPT_FIELDS = ["attempts", "response_status", "response_body", "modified"]
+    STATUS_FIELDS = ["status", "status_changed"]
+
+    def __str__(self):
+        return f"{self.__class__.__name__} ({self.pk}) {self.url}"
+
+    @classmethod
+    def create_for_rows(
+        cls, export, urls: List[str], rows: List[dict], page_num=None
+    ) -> List["ExportWebhookDelivery"]:
+        """
+        Serialize and compress each batch of rows once, shared by all webhooks.
+        """
+        versioned = [ResultProfile.from_trusted(row).to_version() for row in rows]
+        batch_size = settings.WEBHOOK_BATCH_SIZE
+        deliveries = []
+        for batch, start in enumerate(range(0, len(versioned), batch_size)):
+            batch_rows = versioned[start : start + batch_size]
+            envelope = json.dumps(
+                {
+                    "export": export.uuid.hex,
+                    "title": export.query.export.title,
+                    "metadata": export.query.export.metadata,
+                    "page": page_num,
+                    "batch": batch,
+                },
+                cls=DjangoJSONEncoder,
+            )
+            body = envelope[:-1] + ',"results":[' + ",".join(batch_rows) + "]}"
+            compressed = gzip.compress(body.encode("utf-8"))
+            deliveries += cls._create_new(
+                [
+                    dict(export=export, url=url, page_num=page_num, batch=batch)
+                    for url in urls
+                ],
+                size=len(batch_rows),
+                body=compressed,
+            )
+        return deliveries
+
+    @classmethod
+    def create_for_batch_result(
+        cls, batch_result, urls: List[str], results: List[dict]
+    ) -> List["ExportWebhookDelivery"]:
+        batch_size = settings.WEBHOOK_BATCH_SIZE
+        deliveries = []
+        for batch, start in enumerate(range(0, len(results), batch_size)):
+            batch_results = results[start : start + batch_size]
+            body = json.dumps(
+                {
+                    "batch_result": batch_result.id.hex,
+                    "size": batch_result.size,
+                    "batch": batch,
+                    "results": batch_results,
+                },
+                cls=DjangoJSONEncoder,
+            )
+            compressed = gzip.compress(body.encode("utf-8"))
+            deliveries += cls._create_new(
+                [dict(batch_result=batch_result, url=url, batch=batch) for url in urls],
+                size=len(batch_results),
+                body=compressed,
+            )
+        return deliveries
+
+    @classmethod
+    def _create_new(
+        cls, lookups: List[dict], **defaults
+    ) -> List["ExportWebhookDelivery"]:
+        """
+        The deliveries created for `lookups`. Those already there, from an earlier
+        call whose deliveries may still be in flight, are left to it.
+        """
+        created = []
+        for lookup in lookups:
+            delivery, is_new = cls.objects.get_or_create(**lookup, defaults=defaults)
+            if is_new:
+                created.append(delivery)
+        return created
+
+    @property
+    def endpoint_key(self):
+        return "webhook-{}".format(hashlib.sha1(self.url.encode()).hexdigest())
+
+    def deliver(self) -> bool:
+        self.attempts = models.F("attempts") + 1
+        headers = {
+            "Content-Type": "application/json",
+            "Content-Encoding": "gzip",
+            "X-WhoKnows-Delivery": str(self.pk),
+        }
+        if self.export_id:
+            headers["X-WhoKnows-Export"] = self.export.uuid.hex
+        if self.batch_result_id:
+            headers["X-WhoKnows-Batch"] = self.batch_result_id.hex
+        try:
+            response = requests.post(
+                self.url,
+                data=bytes(self.body),
+                headers=headers,
+                timeout=settings.WEBHOOK_TIMEOUT,
+            )
+        except requests.RequestException as e:
+            self.response_status = None
+            self.response_body = repr(e)[:1000]
+            self.save(update_fields=self.ATTEMPT_FIELDS)
+            self.refresh_from_db(fields=["attempts"])
+            return False
+        self.response_status = response.status_code
+        self.response_body = response.text[:1000]
+        update_fields = self.ATTEMPT_FIELDS
+        if response.ok:
+            self.status = self.DeliveryStatusOptions.DELIVERED
+            self.delivered_at = timezone.now()
+            self.body = None
+            update_fields = self.ATTEMPT_FIELDS + self.STATUS_FIELDS
+            update_fields += ["delivered_at", "body"]
+        self.save(update_fields=update_fields)
+        self.refresh_from_db(fields=["attempts"])
+        return response.ok
+
+    def mark_failed(self):
+        self.status = self.DeliveryStatusOptions.FAILED
+        self.save(update_fields=self.STATUS_FIELDS + ["modified"])
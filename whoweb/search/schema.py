@@ -5,6 +5,7 @@ from graphene import relay
 from graphene.types.generic import GenericScalar
 from graphene_django import DjangoObjectType
 from graphene_django.filter import DjangoFilterConnectionField, GlobalIDFilter
+from graphql import GraphQLError
 from rest_framework.permissions import IsAuthenticated
 
 from whoweb.accounting.types import TransactionObjectType
@@ -141,6 +142,13 @@ class SearchExportNode(GuardedObjectType):
     file_url = graphene.String(description="Link to download as csv file.")
     json_url = graphene.String(description="Link to download as json file.")
     result_url = graphene.String(description="Link to paginated result resource.")
+    partial_results = graphene.Field(
+        "whoweb.search.schema.PartialExportResultsType",
+        cursor=graphene.String(),
+        first=graphene.Int(),
+        description="Rows of pages finalized so far, and after cursor if given. "
+        "At most `first` rows are returned, no more than 1000.",
+    )
     related_campaign = graphene.Field("whoweb.campaigns.schema.CampaignRunner")
 
     def resolve_charged(self: models.SearchExport, info):
@@ -158,6 +166,26 @@ class SearchExportNode(GuardedObjectType):
     def resolve_result_url(self: models.SearchExport, info):
         return self.get_result_rest_url()
 
+    def resolve_partial_results(
+        self: models.SearchExport, info, cursor=None, first=None
+    ):
+        limit = models.SearchExport.PARTIAL_RESULTS_LIMIT
+        if first is not None:
+            if first < 1:
+                raise GraphQLError("first must be a positive integer")
+            limit = min(first, limit)
+        try:
+            rows, next_cursor, done = self.get_partial_results(
+                cursor=cursor, limit=limit
+            )
+        except ValueError:
+            raise GraphQLError("Invalid cursor")
+        return PartialExportResultsType(
+            cursor=next_cursor,
+            done=done,
+            profiles=[models.ResultProfile.from_trusted(row) for row in rows],
+        )
+
     def resolve_related_campaign(self: models.SearchExport, info):
         if not self.uploadable:
             return None
@@ -293,6 +321,12 @@ class ResultProfileObjectType(graphene.ObjectType):
             return self.get("_id")
 
 
+class PartialExportResultsType(graphene.ObjectType):
+    cursor = graphene.String(description="Pass back to fetch only newer rows.")
+    done = graphene.Boolean(description="All pages are finalized.")
+    profiles = graphene.List(ResultProfileObjectType)
+
+
 class IDInFilter(django_filters.BaseCSVFilter, django_filters.CharFilter):
     pass
 
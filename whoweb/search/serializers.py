@@ -1,3 +1,5 @@
+from celery import group
+from django.conf import settings
 from django.db import transaction
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
@@ -35,6 +37,7 @@ from whoweb.search.models.profile import (
     PHONE,
     BatchProfileActionResult,
 )
+from whoweb.search.tasks import derive_batch_chunk, enrich_batch
 
 
 class ExportOptionsSerializer(serializers.ModelSerializer):
@@ -185,7 +188,10 @@ class SearchExportSerializer(TaggableMixin, IdOrHyperlinkedModelSerializer):
             """
             res = tasks.apply_async()
             export.log_event(
-                evt=ENQUEUED_FROM_CREATE, signatures=str(tasks), async_result=str(res)
+                evt=ENQUEUED_FROM_CREATE,
+                sync=True,
+                signatures=str(tasks),
+                async_result=str(res),
             )
 
         transaction.on_commit(on_commit)
@@ -242,11 +248,26 @@ class ResultProfileSerializer(serializers.Serializer):
 
 
 class BatchResultSerializer(serializers.ModelSerializer):
+    status_name = serializers.SerializerMethodField()
+
     class Meta:
         model = BatchProfileActionResult
-        fields = ("id", "size", "status_url")
+        fields = (
+            "id",
+            "size",
+            "status",
+            "status_name",
+            "status_changed",
+            "pending_count",
+            "credits_used",
+            "status_url",
+            "results",
+        )
         read_only_fields = fields
 
+    def get_status_name(self, obj):
+        return BatchProfileActionResult.BatchStatusOptions(int(obj.status)).name
+
 
 class DeriveContactSerializer(serializers.Serializer):
     initiated_by = serializers.HiddenField(default=serializers.CurrentUserDefault())
@@ -296,22 +317,22 @@ class DeriveContactSerializer(serializers.Serializer):
         initiated_by = validated_data.pop("initiated_by")
         billing_seat = validated_data.pop("billing_seat")
         profile = ResultProfile.derive(**validated_data)
-        cache_obj, charge = DerivationCache.get_or_charge(
-            billing_seat=billing_seat, profile=profile
-        )
-        if charge > 0:
-            billing_seat.consume_credits(
-                amount=charge, evidence=(cache_obj,), initiated_by=initiated_by
+        with transaction.atomic():
+            cache_obj, charge = DerivationCache.get_or_charge(
+                billing_seat=billing_seat, profile=profile
             )
-
-        validated_data["profile"] = profile.dict()
-        validated_data["credits_used"] = charge
-        validated_data["credits_remaining"] = billing_seat.credits
+            if charge > 0:
+                billing_seat.consume_credits(
+                    amount=charge, evidence=(cache_obj,), initiated_by=initiated_by
+                )
+            validated_data["profile"] = profile.dict()
+            validated_data["credits_used"] = charge
+            validated_data["credits_remaining"] = billing_seat.credits
         return validated_data
 
 
 class DeriveContactBatchInputEntitySerializer(serializers.Serializer):
-    id = serializers.CharField(write_only=True)
+    id = serializers.CharField(source="_id", required=False, write_only=True)
     first_name = serializers.CharField(required=False, write_only=True)
     last_name = serializers.CharField(required=False, write_only=True)
     company = serializers.CharField(required=False, write_only=True)
@@ -341,13 +362,50 @@ class BatchDeriveContactSerializer(serializers.Serializer):
         lookup_field="public_id",
         queryset=BillingAccountMember.objects.all(),
     )
-    input = DeriveContactBatchInputEntitySerializer(many=True)
-    webhooks = serializers.ListField(child=serializers.URLField())
-    batch = BatchResultSerializer()
+    input = DeriveContactBatchInputEntitySerializer(many=True, write_only=True)
+    webhooks = serializers.ListField(
+        child=serializers.URLField(), required=False, default=list
+    )
+    batch = BatchResultSerializer(read_only=True)
 
     class Meta:
         depth = 1
 
+    def validate_input(self, value):
+        if not value:
+            raise ValidationError("Provide at least one entity.")
+        if len(value) > settings.BATCH_MAX_SIZE:
+            raise ValidationError(
+                f"Batches are limited to {settings.BATCH_MAX_SIZE} entities."
+            )
+        return value
+
+    def create(self, validated_data):
+        billing_seat = validated_data["billing_seat"]
+        if billing_seat.credits <= 0:
+            raise PaymentRequired()
+        entities = [
+            {**entity, "filters": sorted(entity["filters"])}
+            for entity in validated_data["input"]
+        ]
+        batch = BatchProfileActionResult.objects.create(
+            billing_seat=billing_seat,
+            initiated_by=validated_data["initiated_by"],
+            size=len(entities),
+            pending_count=len(entities),
+            webhooks=validated_data["webhooks"],
+        )
+        chunk_size = settings.BATCH_CHUNK_SIZE
+        job = group(
+            derive_batch_chunk.si(batch.pk.hex, entities[start : start + chunk_size])
+            for start in range(0, len(entities), chunk_size)
+        )
+        batch.group_task_id = job.freeze().id
+        batch.save(update_fields=["group_task_id"])
+        transaction.on_commit(job.apply_async)
+        validated_data["batch"] = batch
+        return validated_data
+
 
 class ProfileSerializer(serializers.Serializer):
     initiated_by = serializers.HiddenField(default=serializers.CurrentUserDefault())
@@ -368,14 +426,14 @@ class ProfileSerializer(serializers.Serializer):
         billing_seat = validated_data.pop("billing_seat")
         profile = ResultProfile.enrich(update=True, **validated_data)
         charge = billing_seat.plan.credits_per_enrich
-        if charge > 0:
-            billing_seat.consume_credits(
-                amount=charge, evidence=(), initiated_by=initiated_by
-            )
-
-        validated_data["profile"] = profile.dict()
-        validated_data["credits_used"] = charge
-        validated_data["credits_remaining"] = billing_seat.credits
+        with transaction.atomic():
+            if charge > 0:
+                billing_seat.consume_credits(
+                    amount=charge, evidence=(), initiated_by=initiated_by
+                )
+            validated_data["profile"] = profile.dict()
+            validated_data["credits_used"] = charge
+            validated_data["credits_remaining"] = billing_seat.credits
         return validated_data
 
 
@@ -411,15 +469,15 @@ class ProfileEnrichmentSerializer(serializers.Serializer):
         profile = ResultProfile.enrich(**validated_data)
 
         charge = billing_seat.plan.credits_per_enrich
-        if charge > 0:
-            billing_seat.consume_credits(
-                amount=charge, evidence=(), initiated_by=initiated_by
-            )
-
-        validated_data["profile"] = profile.dict()
-        validated_data["status"] = profile.returned_status
-        validated_data["credits_used"] = charge
-        validated_data["credits_remaining"] = billing_seat.credits
+        with transaction.atomic():
+            if charge > 0:
+                billing_seat.consume_credits(
+                    amount=charge, evidence=(), initiated_by=initiated_by
+                )
+            validated_data["profile"] = profile.dict()
+            validated_data["status"] = profile.returned_status
+            validated_data["credits_used"] = charge
+            validated_data["credits_remaining"] = billing_seat.credits
         return validated_data
 
 
@@ -430,9 +488,17 @@ class ProfileEnrichmentBatchInputEntitySerializer(serializers.Serializer):
     profile_id = serializers.CharField(allow_null=True, required=False)
     get_web_profile = serializers.BooleanField(allow_null=True, required=False)
     no_cache = serializers.BooleanField(allow_null=True, required=False)
+    update = serializers.BooleanField(default=False, allow_null=True, required=False)
     min_confidence = serializers.FloatField(allow_null=True, required=False)
 
     def validate(self, attrs):
+        if not any(
+            attrs.get(field)
+            for field in ("email", "user_id", "linkedin_url", "profile_id")
+        ):
+            raise ValidationError(
+                "Must provide one of email, user_id, linkedin_url, or profile_id."
+            )
         linkedin_url = attrs.get("linkedin_url")
         if linkedin_url and linkedin_url.endswith("/"):
             attrs["linkedin_url"] = linkedin_url[:-1]
@@ -446,13 +512,48 @@ class BatchProfileEnrichmentSerializer(serializers.Serializer):
         lookup_field="public_id",
         queryset=BillingAccountMember.objects.all(),
     )
-    input = ProfileEnrichmentBatchInputEntitySerializer(many=True)
-    webhooks = serializers.ListField(child=serializers.URLField())
-    batch = BatchResultSerializer()
+    input = ProfileEnrichmentBatchInputEntitySerializer(many=True, write_only=True)
+    webhooks = serializers.ListField(
+        child=serializers.URLField(), required=False, default=list
+    )
+    batch = BatchResultSerializer(read_only=True)
 
     class Meta:
         depth = 1
 
+    def validate_input(self, value):
+        if not value:
+            raise ValidationError("Provide at least one entity.")
+        if len(value) > settings.BATCH_MAX_SIZE:
+            raise ValidationError(
+                f"Batches are limited to {settings.BATCH_MAX_SIZE} entities."
+            )
+        return value
+
+    def create(self, validated_data):
+        billing_seat = validated_data["billing_seat"]
+        if billing_seat.credits <= 0:
+            raise PaymentRequired()
+        entities = [dict(entity) for entity in validated_data["input"]]
+        batch = BatchProfileActionResult.objects.create(
+            billing_seat=billing_seat,
+            initiated_by=validated_data["initiated_by"],
+            size=len(entities),
+            pending_count=len(entities),
+            webhooks=validated_data["webhooks"],
+        )
+        job = group(
+            enrich_batch.si(batch.pk.hex, chunk)
+            for chunk in BatchProfileActionResult.enrichment_chunks(
+                entities, settings.BATCH_CHUNK_SIZE
+            )
+        )
+        batch.group_task_id = job.freeze().id
+        batch.save(update_fields=["group_task_id"])
+        transaction.on_commit(job.apply_async)
+        validated_data["batch"] = batch
+        return validated_data
+
 
 class FilterValueListSerializer(
     ObjectPermissionsAssignmentMixin, TaggableMixin, IdOrHyperlinkedModelSerializer
@@ -1,17 +1,37 @@
+import itertools
 import logging
+import random
+from datetime import timedelta
 from math import ceil
 
-from celery import group, shared_task
+from celery import Task, group, shared_task
 from celery.exceptions import MaxRetriesExceededError
-from django.db.models import F
+from celery.utils.time import get_exponential_backoff_interval
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
 from google.api_core.exceptions import GoogleAPICallError
 from kombu.exceptions import OperationalError
 from redis.exceptions import ConnectionError as RedisConnectionError
 from requests import HTTPError, Timeout, ConnectionError
 
-from whoweb.search.events import PAGES_SPAWNED
-from whoweb.search.models import SearchExport, ResultProfile
+from whoweb.core.exceptions import ServiceOverloaded
+from whoweb.core.utils import CacheSemaphore
+from whoweb.search.events import (
+    PAGES_SPAWNED,
+    PAGES_QUEUED,
+    PAGES_RELEASED,
+    STALE_PAGE,
+)
+from whoweb.search.models import (
+    SearchExport,
+    ResultProfile,
+    ExportWebhookDelivery,
+    ExportPageScheduler,
+)
 from whoweb.search.models.export import MXDomain, SearchExportPage
+from whoweb.search.models.profile import BatchProfileActionResult
 from whoweb.search.models.profile import VALIDATED, COMPLETE, FAILED, RETRY, WORK
 
 logger = logging.getLogger(__name__)
@@ -28,6 +48,8 @@ MAX_DERIVE_RETRY = 3
 
 MAX_NUM_PAGES_TO_PROCESS_IN_SINGLE_TASK = 5
 
+SCHEDULER_RELEASE_KEY = "search.tasks.release_scheduled_pages"
+
 
 @shared_task(
     bind=True,
@@ -47,13 +69,15 @@ def generate_pages(self, export_id):
     bind=True,
     max_retries=3000,
     track_started=True,
-    ignore_result=False,
+    ignore_result=True,
     autoretry_for=NETWORK_ERRORS,
 )
 def do_process_page(self, page_pk):
     page = SearchExportPage.objects.get(pk=page_pk)
     if page.export.is_done_processing_pages:
         return "Export already done"
+    if page.status == SearchExportPage.PageStatusOptions.WORKING:
+        return "Page derivations already dispatched."
     if not page.export.should_derive_email:
         return page.populate_data_directly(task_context=self.request)
 
@@ -61,11 +85,12 @@ def do_process_page(self, page_pk):
         page.status = SearchExportPage.PageStatusOptions.WORKING
         page.pending_count = len(tasks)
         page.save()
-        chrd = group(tasks) | finalize_page.si(pk=page.pk).on_error(
-            finalize_page.si(pk=page.pk)
-        )
-        return self.replace(chrd)
+        SearchExport.refresh_page_stats(page.export_id)
+        # Each derivation counts the page down; the last one enqueues finalize_page.
+        group(tasks).apply_async()
+        return f"Dispatched {len(tasks)} derivations."
     else:
+        page.do_post_derive_process(task_context=self.request)
         return "No page tasks required. Page done."
 
 
@@ -77,21 +102,82 @@ def spawn_do_page_process_tasks(self, prefetch_multiplier, export_id):
     num_pages = ceil(export.pages.count() * prefetch_multiplier)
     if empty_pages := export.get_next_empty_page(num_pages):
         empty_page_ids = [page.pk for page in empty_pages]
-        tasks = group(
-            [
-                do_process_page.signature(
-                    args=(page_id,),
-                    immutable=True,
-                    countdown=i * SearchExport.PAGE_DELAY,
-                )
-                for i, page_id in enumerate(empty_page_ids)
-            ]
+        if settings.EXPORT_FAIR_SHARE_SCHEDULING:
+            ExportPageScheduler().schedule(empty_page_ids)
+            export.log_event(
+                PAGES_QUEUED, task=self.request, data={"pages": empty_page_ids}
+            )
+            schedule_release()
+        else:
+            tasks = group(
+                [
+                    do_process_page.signature(
+                        args=(page_id,),
+                        immutable=True,
+                        countdown=i * SearchExport.PAGE_DELAY,
+                    )
+                    for i, page_id in enumerate(empty_page_ids)
+                ]
+            )
+            export.log_event(
+                PAGES_SPAWNED, task=self.request, data={"pages": empty_page_ids}
+            )
+            tasks.apply_async()
+        return self.replace(
+            await_pages.si(export_id=export_id, page_ids=empty_page_ids)
         )
-        export.log_event(PAGES_SPAWNED, data={"signatures": repr(tasks)})
-        return self.replace(tasks)
     return "Done with no pages found."
 
 
+def schedule_release(countdown=0):
+    # One pending release per tick; a lost task only stalls until the key expires.
+    if cache.add(
+        SCHEDULER_RELEASE_KEY, True, countdown + settings.EXPORT_SCHEDULER_TICK
+    ):
+        release_scheduled_pages.apply_async(countdown=countdown)
+
+
+@shared_task(bind=True, ignore_result=True, autoretry_for=NETWORK_ERRORS)
+def release_scheduled_pages(self):
+    cache.delete(SCHEDULER_RELEASE_KEY)
+    scheduler = ExportPageScheduler()
+    released = scheduler.release()
+    for export, pages in itertools.groupby(released, key=lambda page: page.export):
+        pages = list(pages)
+        export.log_event(
+            PAGES_RELEASED,
+            task=self.request,
+            data={
+                "pages": [page.pk for page in pages],
+                "waited": [
+                    (page.released_at - page.scheduled_at).total_seconds()
+                    for page in pages
+                ],
+            },
+        )
+        for page in pages:
+            do_process_page.si(page.pk).set(priority=export.queue_priority).delay()
+    if scheduler.queued().exists():
+        schedule_release(countdown=settings.EXPORT_SCHEDULER_TICK)
+    return len(released)
+
+
+@shared_task(bind=True, max_retries=None, ignore_result=False)
+def await_pages(self, export_id, page_ids):
+    export = SearchExport.available_objects.get(pk=export_id)
+    if export.is_done_processing_pages:
+        return "Done"
+    if (
+        export.pages.filter(pk__in=page_ids, data__isnull=True)
+        .exclude(status=SearchExportPage.PageStatusOptions.COMPLETE)
+        .exists()
+    ):
+        if settings.EXPORT_FAIR_SHARE_SCHEDULING:
+            schedule_release()
+        raise self.retry(countdown=settings.EXPORT_SCHEDULER_TICK)
+    return "Pages complete."
+
+
 @shared_task(bind=True, ignore_result=False, autoretry_for=NETWORK_ERRORS)
 def do_post_pages_completion(self, export_id):
     export = SearchExport.available_objects.get(pk=export_id)
@@ -159,9 +245,35 @@ def spawn_mx_group(self, export_id):
 @shared_task(bind=True, autoretry_for=NETWORK_ERRORS)
 def upload_to_static_bucket(self, export_id):
     export = SearchExport.available_objects.get(pk=export_id)
+    if parts := export.start_csv_parts():
+        # Each part counts the export down; joining them waits on the counter
+        # rather than on a chord, so no result backend has to hold the parts.
+        group(parts).apply_async()
+        return self.replace(await_csv_parts.si(export_id=export_id))
     return export.upload_to_static_bucket(task_context=self.request)
 
 
+@shared_task(ignore_result=True, autoretry_for=NETWORK_ERRORS, cpu_bound=True)
+def write_csv_part(export_id, part_num, page_nums):
+    export = SearchExport.available_objects.get(pk=export_id)
+    written = export.write_csv_part(part_num=part_num, page_nums=page_nums)
+    return export.record_csv_part(part_num, *written)
+
+
+@shared_task(bind=True, max_retries=None, ignore_result=False)
+def await_csv_parts(self, export_id):
+    export = SearchExport.available_objects.get(pk=export_id)
+    if (parts := export.written_csv_parts()) is None:
+        raise self.retry(countdown=settings.EXPORT_UPLOAD_PARTS_TICK)
+    return self.replace(compose_csv_parts.si(parts, export_id=export_id))
+
+
+@shared_task(bind=True, autoretry_for=NETWORK_ERRORS, cpu_bound=True)
+def compose_csv_parts(self, parts, export_id):
+    export = SearchExport.available_objects.get(pk=export_id)
+    return export.compose_csv_parts(parts=parts, task_context=self.request)
+
+
 def process_derivation(
     task, page_pk, profile_data, defer, omit_failures, add_invite_key, filters
 ):
@@ -184,97 +296,260 @@ def process_derivation(
             # if we want work emails and aren't explicitly preventing toofr data,
             # call validation in real time
             deferred = [d for d in defer if d != "validation"]
-        status = profile.derive_contact(deferred, filters, producer=page_pk)
+        try:
+            status = profile.derive_contact(deferred, filters, producer=page_pk)
+        except ServiceOverloaded as e:
+            countdown = (e.retry_after or 0) + random.uniform(1, 15)
+            if task.request.is_eager:
+                raise task.retry(countdown=countdown)
+            # The service turned us away before trying; come back without
+            # spending one of this derivation's retries.
+            task.apply_async(
+                args=task.request.args,
+                kwargs=task.request.kwargs,
+                countdown=countdown,
+                retries=task.request.retries,
+            )
+            return None
 
     if status == RETRY:
         raise task.retry()
     elif status == FAILED and omit_failures:
-        SearchExportPage.objects.filter(pk=page_pk).update(
-            pending_count=F("pending_count") - 1
-        )
+        SearchExportPage.count_down(page_pk)
+        task.request.counted_down = True
         return False
     else:
         if add_invite_key:
             profile.get_invite_key()
         page = SearchExportPage.save_profile(page_pk, profile)
+        task.request.counted_down = True
         return getattr(page, "pk", 404)
 
 
+class DerivationTask(Task):
+    """
+    Counts its page down when a derivation fails for good, whatever the error and
+    whether or not retries ran out, unless it already had before failing.
+    """
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        if getattr(self.request, "counted_down", False):
+            return
+        page_pk = args[0] if args else kwargs["page_pk"]
+        SearchExportPage.count_down(page_pk)
+
+
 @shared_task(
     bind=True,
+    base=DerivationTask,
     max_retries=MAX_DERIVE_RETRY,
     default_retry_delay=90,
     retry_backoff=90,
-    ignore_result=False,
+    ignore_result=True,
     rate_limit="15/m",
     autoretry_for=NETWORK_ERRORS,
 )
 def process_derivation_slow(
     self, page_pk, profile_data, defer, omit_failures, add_invite_key, filters=None
 ):
-    try:
-        return process_derivation(
-            self,
-            page_pk,
-            profile_data,
-            defer,
-            omit_failures,
-            add_invite_key,
-            filters=filters,
-        )
-    except MaxRetriesExceededError:
-        try:
-            SearchExportPage.objects.filter(pk=page_pk).update(
-                pending_count=F("pending_count") - 1
-            )
-        except:
-            pass
+    return process_derivation(
+        self,
+        page_pk,
+        profile_data,
+        defer,
+        omit_failures,
+        add_invite_key,
+        filters=filters,
+    )
 
 
 @shared_task(
     bind=True,
+    base=DerivationTask,
     max_retries=MAX_DERIVE_RETRY,
     default_retry_delay=90,
     retry_backoff=90,
-    ignore_result=False,
+    ignore_result=True,
     rate_limit="60/m",
     autoretry_for=NETWORK_ERRORS,
 )
 def process_derivation_fast(
     self, page_pk, profile_data, defer, omit_failures, add_invite_key, filters=None
 ):
-    try:
-        return process_derivation(
-            self,
-            page_pk,
-            profile_data,
-            defer,
-            omit_failures,
-            add_invite_key,
-            filters=filters,
+    return process_derivation(
+        self,
+        page_pk,
+        profile_data,
+        defer,
+        omit_failures,
+        add_invite_key,
+        filters=filters,
+    )
+
+
+class BatchChunkTask(Task):
+    """
+    Records the entities of a chunk as failed when it fails for good, whatever the
+    error and whether or not retries ran out, so its batch still completes. Those
+    it already recorded or handed on before failing are left alone.
+    """
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        batch_id = args[0] if args else kwargs["batch_id"]
+        entities = args[1] if len(args) > 1 else kwargs["entities"]
+        entities = getattr(self.request, "unrecorded", entities)
+        if not entities:
+            return
+        batch = BatchProfileActionResult.objects.get(pk=batch_id)
+        batch.record_results(
+            [batch.entity_result(entity, FAILED) for entity in entities]
         )
+
+
+@shared_task(
+    bind=True,
+    base=BatchChunkTask,
+    max_retries=MAX_DERIVE_RETRY,
+    default_retry_delay=90,
+    ignore_result=True,
+    autoretry_for=NETWORK_ERRORS,
+)
+def derive_batch_chunk(self, batch_id, entities):
+    batch = BatchProfileActionResult.objects.select_related(
+        "billing_seat", "initiated_by"
+    ).get(pk=batch_id)
+    remaining, deferred, retry_after = batch.derive_contacts(entities)
+    self.request.unrecorded = remaining + deferred
+    if deferred and self.request.is_eager:
+        remaining += deferred
+    elif deferred:
+        # The service turned these away before trying; come back without
+        # spending one of the chunk's retries.
+        self.apply_async(
+            args=(batch_id, deferred),
+            countdown=(retry_after or 0) + random.uniform(1, 15),
+            retries=self.request.retries,
+        )
+        self.request.unrecorded = remaining
+    if not remaining:
+        return
+    try:
+        raise self.retry(args=(batch_id, remaining), countdown=random.uniform(30, 90))
     except MaxRetriesExceededError:
-        try:
-            SearchExportPage.objects.filter(pk=page_pk).update(
-                pending_count=F("pending_count") - 1
-            )
-        except:
-            pass
+        batch.record_results(
+            [batch.entity_result(entity, FAILED) for entity in remaining]
+        )
+        self.request.unrecorded = []
+
+
+@shared_task(ignore_result=True, autoretry_for=NETWORK_ERRORS)
+def enrich_batch(batch_id, entities):
+    batch = BatchProfileActionResult.objects.select_related(
+        "billing_seat", "initiated_by"
+    ).get(pk=batch_id)
+    batch.enrich_profiles(entities)
 
 
 @shared_task(
-    bind=True, max_retries=250, ignore_result=False, autoretry_for=NETWORK_ERRORS
+    bind=True,
+    max_retries=250,
+    ignore_result=True,
+    autoretry_for=NETWORK_ERRORS,
+    cpu_bound=True,
 )
 def finalize_page(self, pk):
     export_page = SearchExportPage.objects.get(pk=pk)  # allow DoesNotExist exception
     export_page.do_post_derive_process(task_context=self.request)
+    if export_page.released_at:
+        schedule_release()
+
+
+@shared_task(ignore_result=True, autoretry_for=NETWORK_ERRORS)
+def sweep_stale_pages():
+    stale = SearchExportPage.objects.filter(
+        status=SearchExportPage.PageStatusOptions.WORKING,
+        modified__lt=timezone.now()
+        - timedelta(seconds=settings.EXPORT_STALE_PAGE_TIMEOUT),
+        export__is_removed=False,
+    ).select_related("export")
+    for page in stale:
+        page.export.log_event(
+            STALE_PAGE,
+            data={"page": page.page_num, "pending_count": page.pending_count},
+        )
+        finalize_page.delay(pk=page.pk)
+    return len(stale)
+
+
+@shared_task(bind=True, ignore_result=True, autoretry_for=NETWORK_ERRORS)
+def archive_export_pages(self, export_id):
+    export = SearchExport.available_objects.get(pk=export_id)
+    return export.archive_pages(task_context=self.request)
+
+
+@shared_task(ignore_result=True, autoretry_for=NETWORK_ERRORS)
+def archive_finished_exports():
+    export_ids = (
+        SearchExport.available_objects.filter(
+            status=SearchExport.ExportStatusOptions.COMPLETE,
+            status_changed__lt=timezone.now()
+            - timedelta(seconds=settings.EXPORT_PAGE_ARCHIVE_AFTER),
+            pages__data__isnull=False,
+        )
+        .exclude(csv="")
+        .exclude(csv__isnull=True)
+        .filter(Q(page_archive="") | Q(page_archive__isnull=True))
+        .values_list("pk", flat=True)
+        .distinct()
+    )
+    for export_id in export_ids:
+        archive_export_pages.delay(export_id=export_id)
+    return len(export_ids)
 
 
 @shared_task(
-    bind=True, max_retries=250, ignore_result=False, autoretry_for=NETWORK_ERRORS
+    bind=True,
+    max_retries=250,
+    ignore_result=False,
+    autoretry_for=NETWORK_ERRORS,
+    cpu_bound=True,
 )
 def compress_working_pages(self, export_id, page_ids):
     export = SearchExport.available_objects.get(
         pk=export_id
     )  # allow DoesNotExist exception
     export.compress_working_pages(page_ids=page_ids, task_context=self.request)
+
+
+@shared_task(bind=True, max_retries=None, ignore_result=False)
+def deliver_export_webhook(self, delivery_pk):
+    delivery = ExportWebhookDelivery.objects.select_related("export").get(
+        pk=delivery_pk
+    )
+    if delivery.status != ExportWebhookDelivery.DeliveryStatusOptions.PENDING:
+        return delivery.status
+    slot = CacheSemaphore(
+        delivery.endpoint_key,
+        limit=settings.WEBHOOK_MAX_CONCURRENCY_PER_ENDPOINT,
+        timeout=settings.WEBHOOK_TIMEOUT * 2,
+    )
+    if not slot.acquire():
+        # Endpoint is busy with other batches, come back shortly.
+        raise self.retry(countdown=random.uniform(1, 5))
+    try:
+        delivered = delivery.deliver()
+    finally:
+        slot.release()
+    if delivered:
+        return delivery.status
+    if delivery.attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+        delivery.mark_failed()
+        return delivery.status
+    raise self.retry(
+        countdown=get_exponential_backoff_interval(
+            factor=settings.WEBHOOK_RETRY_BACKOFF,
+            retries=delivery.attempts - 1,
+            maximum=settings.WEBHOOK_RETRY_BACKOFF_MAX,
+            full_jitter=True,
+        )
+    )
@@ -6,7 +6,8 @@ import pytest
 from bson.json_util import object_hook
 
 from whoweb.search.models import ResultProfile
-from .json_data import PENDING, DONE
+from whoweb.search.loadtest.json_data import PENDING, DONE
+from .webhook_server import WebhookStandIn
 
 done = json.loads(DONE, object_hook=object_hook, strict=False)
 
@@ -21,6 +22,13 @@ def search_results():
     return json.loads(PENDING, object_hook=object_hook, strict=False)
 
 
+@pytest.fixture
+def webhook_server():
+    server = WebhookStandIn().start()
+    yield server
+    server.stop()
+
+
 @pytest.fixture
 def search_result_profiles(search_results):
     return [ResultProfile(**prof) for prof in search_results]
@@ -0,0 +1,379 @@
+import gzip
+import json
+from unittest.mock import patch
+
+import pytest
+from celery.exceptions import MaxRetriesExceededError
+from django.core.cache import cache
+from django.db import OperationalError
+from requests import Timeout
+
+from whoweb.core.exceptions import ServiceOverloaded
+from whoweb.payments.tests.factories import BillingAccountMemberFactory
+from whoweb.search.models import DerivationCache, ResultProfile
+from whoweb.search.models.profile import (
+    BatchProfileActionResult,
+    normalize_enrichment_input,
+)
+from whoweb.search.tasks import derive_batch_chunk
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def run_on_commit():
+    with patch("django.db.transaction.on_commit", lambda func: func()):
+        yield
+
+
+def entity(profile):
+    return {
+        "_id": profile["profile_id"],
+        "first_name": profile["first_name"],
+        "last_name": profile["last_name"],
+        "company": profile["company"],
+        "filters": ["personal", "work"],
+    }
+
+
+@patch("whoweb.search.models.webhooks.requests.post")
+@patch("whoweb.core.router.Router.unified_search")
+@patch("whoweb.core.router.Router.derive_email")
+def test_batch_derive_endpoint(
+    derive_mock,
+    search_mock,
+    post_mock,
+    su_client,
+    raw_derived,
+    settings,
+    run_on_commit,
+):
+    settings.CELERY_TASK_ALWAYS_EAGER = True
+    settings.BATCH_CHUNK_SIZE = 2
+    derive_mock.return_value = raw_derived[0]
+    search_mock.return_value = {"results": []}
+    post_mock.return_value.ok = True
+    post_mock.return_value.status_code = 200
+    post_mock.return_value.text = ""
+    seat = BillingAccountMemberFactory(seat_credits=10000)
+    known = {
+        "id": raw_derived[0]["profile_id"],
+        "first_name": raw_derived[0]["first_name"],
+        "last_name": raw_derived[0]["last_name"],
+        "company": raw_derived[0]["company"],
+    }
+    resp = su_client.post(
+        "/ww/api/profiles/derive/batch/",
+        {
+            "billing_seat": seat.public_id,
+            "input": [known, known, {"id": "wp:unknown"}],
+            "webhooks": ["https://example.com/hook"],
+        },
+        format="json",
+    )
+    assert resp.status_code == 201, resp.content
+    batch = resp.json()["batch"]
+    assert batch["size"] == 3
+
+    resp = su_client.get(batch["status_url"])
+    assert resp.status_code == 200
+    result = resp.json()
+    assert result["status_name"] == "COMPLETE"
+    assert result["pending_count"] == 0
+    assert result["credits_used"] == 100
+    assert sorted(r["status"] for r in result["results"]) == [
+        "not_found",
+        "validated",
+        "validated",
+    ]
+    assert sorted(r["credits_used"] for r in result["results"]) == [0, 0, 100]
+    assert DerivationCache.objects.filter(billing_seat=seat).count() == 1
+    seat.refresh_from_db()
+    assert seat.credits == 9900
+
+    post_mock.assert_called_once()
+    body = json.loads(gzip.decompress(post_mock.call_args[1]["data"]))
+    assert body["batch_result"] == batch["id"].replace("-", "")
+    assert len(body["results"]) == 3
+    headers = post_mock.call_args[1]["headers"]
+    assert headers["X-WhoKnows-Batch"] == body["batch_result"]
+    assert "X-WhoKnows-Export" not in headers
+
+
+def test_batch_result_limited_to_its_seat(api_client):
+    seat = BillingAccountMemberFactory()
+    batch = BatchProfileActionResult.objects.create(billing_seat=seat, size=1)
+
+    assert api_client.get(batch.status_url).status_code == 401
+    api_client.force_authenticate(user=BillingAccountMemberFactory().user)
+    assert api_client.get(batch.status_url).status_code == 404
+    api_client.force_authenticate(user=seat.user)
+    assert api_client.get(batch.status_url).status_code == 200
+
+
+def test_batch_derive_validates_size(su_client, settings):
+    settings.BATCH_MAX_SIZE = 1
+    seat = BillingAccountMemberFactory(seat_credits=10000)
+    resp = su_client.post(
+        "/ww/api/profiles/derive/batch/",
+        {"billing_seat": seat.public_id, "input": [{"id": "wp:1"}, {"id": "wp:2"}],},
+        format="json",
+    )
+    assert resp.status_code == 400
+    assert "input" in resp.json()
+
+
+def test_get_or_charge_many_matches_single_charges(raw_derived):
+    seat = BillingAccountMemberFactory(seat_credits=10000)
+    profile = ResultProfile(**raw_derived[0])
+    charges = DerivationCache.get_or_charge_many(
+        billing_seat=seat, profiles=[profile, profile]
+    )
+    assert [charge for _, charge in charges] == [100, 0]
+    assert charges[0][0].pk and charges[0][0].pk == charges[1][0].pk
+
+    _, charge = DerivationCache.get_or_charge(billing_seat=seat, profile=profile)
+    assert charge == 0
+    charges = DerivationCache.get_or_charge_many(billing_seat=seat, profiles=[profile])
+    assert [charge for _, charge in charges] == [0]
+
+
+@patch("whoweb.core.router.Router.derive_email")
+def test_chunk_left_for_later_when_service_overloaded(derive_mock, raw_derived):
+    derive_mock.side_effect = ServiceOverloaded(retry_after=5)
+    batch = BatchProfileActionResult.objects.create(
+        billing_seat=BillingAccountMemberFactory(seat_credits=10000),
+        size=2,
+        pending_count=2,
+    )
+    entities = [entity(raw_derived[0]), entity(raw_derived[1])]
+    assert batch.derive_contacts(entities) == ([], entities, 5)
+    assert derive_mock.call_count == 1
+    batch.refresh_from_db()
+    assert batch.pending_count == 2
+    assert batch.results == []
+
+
+@patch("whoweb.search.tasks.derive_batch_chunk.apply_async")
+@patch("whoweb.core.router.Router.derive_email")
+def test_overloaded_chunk_deferred_without_spending_retries(
+    derive_mock, apply_mock, raw_derived
+):
+    derive_mock.side_effect = ServiceOverloaded(retry_after=5)
+    batch = BatchProfileActionResult.objects.create(
+        billing_seat=BillingAccountMemberFactory(seat_credits=10000),
+        size=1,
+        pending_count=1,
+    )
+    entities = [entity(raw_derived[0])]
+    with patch.object(derive_batch_chunk, "retry") as retry_mock:
+        derive_batch_chunk(batch.pk, entities)
+    retry_mock.assert_not_called()
+    apply_mock.assert_called_once()
+    assert apply_mock.call_args[1]["args"] == (batch.pk, entities)
+    assert apply_mock.call_args[1]["retries"] == 0
+    assert apply_mock.call_args[1]["countdown"] > 5
+    batch.refresh_from_db()
+    assert batch.pending_count == 1
+
+
+@patch("whoweb.core.router.Router.derive_email")
+def test_chunk_failed_when_retries_run_out(derive_mock, raw_derived):
+    derive_mock.side_effect = Timeout()
+    batch = BatchProfileActionResult.objects.create(
+        billing_seat=BillingAccountMemberFactory(seat_credits=10000),
+        size=2,
+        pending_count=2,
+    )
+    entities = [entity(raw_derived[0]), entity(raw_derived[1])]
+    with patch.object(
+        derive_batch_chunk, "retry", side_effect=MaxRetriesExceededError()
+    ) as retry_mock:
+        derive_batch_chunk(batch.pk, entities)
+    assert retry_mock.call_args[1]["args"] == (batch.pk, entities)
+    batch.refresh_from_db()
+    assert batch.pending_count == 0
+    assert batch.status == BatchProfileActionResult.BatchStatusOptions.COMPLETE
+    assert [r["status"] for r in batch.results] == ["failed", "failed"]
+
+
+def test_chunk_failing_for_good_counts_its_entities_down(raw_derived):
+    batch = BatchProfileActionResult.objects.create(
+        billing_seat=BillingAccountMemberFactory(seat_credits=10000),
+        size=1,
+        pending_count=1,
+    )
+    entities = [entity(raw_derived[0])]
+    derive_batch_chunk.on_failure(
+        OperationalError(), "task-id", (batch.pk, entities), {}, None
+    )
+    batch.refresh_from_db()
+    assert batch.pending_count == 0
+    assert batch.status == BatchProfileActionResult.BatchStatusOptions.COMPLETE
+    assert batch.results[0]["status"] == "failed"
+
+
+@patch("whoweb.core.router.Router.derive_email")
+def test_chunk_without_credits_caches_nothing(derive_mock, raw_derived):
+    derive_mock.return_value = raw_derived[0]
+    seat = BillingAccountMemberFactory(seat_credits=50)
+    batch = BatchProfileActionResult.objects.create(
+        billing_seat=seat, size=1, pending_count=1
+    )
+    assert batch.derive_contacts([entity(raw_derived[0])]) == ([], [], None)
+    batch.refresh_from_db()
+    assert batch.status == BatchProfileActionResult.BatchStatusOptions.COMPLETE
+    assert batch.results[0]["status"] == "insufficient_credits"
+    assert batch.results[0]["profile"] is None
+    assert not DerivationCache.objects.exists()
+    seat.refresh_from_db()
+    assert seat.credits == 50
+
+
+@pytest.fixture
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def test_normalize_enrichment_input():
+    assert normalize_enrichment_input(
+        email=" Pat@Beast.VC ",
+        linkedin_url="www.LinkedIn.com/in/Patrick/?trk=feed",
+        no_cache=True,
+    ) == {
+        "email": "pat@beast.vc",
+        "linkedin_url": "https://linkedin.com/in/patrick",
+        "get_web_profile": True,
+    }
+
+
+def test_enrichment_chunks_keep_a_person_together():
+    pat = [{"email": "pat@beast.vc"}, {"email": "PAT@beast.vc", "update": True}]
+    sam, kim = {"email": "sam@beast.vc"}, {"email": "kim@beast.vc"}
+    chunks = BatchProfileActionResult.enrichment_chunks([pat[0], sam, pat[1], kim], 2)
+    assert chunks == [[pat[0], pat[1], sam], [kim]]
+
+
+@patch("whoweb.search.models.webhooks.requests.post")
+@patch("whoweb.core.router.Router.profile_lookup")
+def test_batch_enrich_endpoint(
+    lookup_mock,
+    post_mock,
+    su_client,
+    search_results,
+    settings,
+    clear_cache,
+    run_on_commit,
+):
+    settings.CELERY_TASK_ALWAYS_EAGER = True
+    settings.BATCH_CHUNK_SIZE = 1
+    lookup_mock.return_value = {"results": search_results[:1]}
+    post_mock.return_value.ok = True
+    post_mock.return_value.status_code = 200
+    post_mock.return_value.text = ""
+    seat = BillingAccountMemberFactory(seat_credits=10000)
+    resp = su_client.post(
+        "/ww/api/profiles/enrich/batch/",
+        {
+            "billing_seat": seat.public_id,
+            "input": [
+                {"linkedin_url": "https://www.linkedin.com/in/patrick/"},
+                {"linkedin_url": "https://LinkedIn.com/in/Patrick"},
+                {"email": "pat@beast.vc"},
+            ],
+            "webhooks": ["https://example.com/hook"],
+        },
+        format="json",
+    )
+    assert resp.status_code == 201, resp.content
+    batch = resp.json()["batch"]
+
+    result = su_client.get(batch["status_url"]).json()
+    assert result["status_name"] == "COMPLETE"
+    assert result["credits_used"] == 50
+    assert sorted(r["credits_used"] for r in result["results"]) == [0, 25, 25]
+    assert all(r["profile"]["industry"] for r in result["results"])
+    assert not any("schema_version" in r["profile"] for r in result["results"])
+    assert lookup_mock.call_count == 2
+    seat.refresh_from_db()
+    assert seat.credits == 9950
+    assert seat.transactions.count() == 1
+    post_mock.assert_called_once()
+
+
+@patch("whoweb.core.router.Router.profile_lookup")
+def test_enrich_profiles_serves_recent_results(
+    lookup_mock, search_results, clear_cache, run_on_commit
+):
+    lookup_mock.return_value = {"results": search_results[:1]}
+    seat = BillingAccountMemberFactory(seat_credits=10000)
+
+    def enrich(*entities):
+        batch = BatchProfileActionResult.objects.create(
+            billing_seat=seat,
+            initiated_by=seat.user,
+            size=len(entities),
+            pending_count=len(entities),
+        )
+        batch.enrich_profiles(list(entities))
+        batch.refresh_from_db()
+        return batch
+
+    enrich({"email": "pat@beast.vc"})
+    batch = enrich({"email": "PAT@beast.vc"})
+    assert lookup_mock.call_count == 1
+    assert batch.results[0]["profile"]["profile_id"] == search_results[0]["profile_id"]
+    assert batch.credits_used == 25
+
+    enrich({"email": "pat@beast.vc"}, {"email": "pat@beast.vc", "update": True})
+    assert lookup_mock.call_count == 2
+    assert lookup_mock.call_args[1]["json"]["update"] is True
+
+
+@patch("whoweb.core.router.Router.profile_lookup")
+def test_enrich_profiles_insufficient_credits(
+    lookup_mock, search_results, clear_cache, run_on_commit
+):
+    lookup_mock.side_effect = [{"results": search_results[:1]}, {"results": []}]
+    seat = BillingAccountMemberFactory(seat_credits=10)
+    batch = BatchProfileActionResult.objects.create(
+        billing_seat=seat, initiated_by=seat.user, size=2, pending_count=2
+    )
+    batch.enrich_profiles([{"profile_id": "wp:1"}, {"profile_id": "wp:2"}])
+    batch.refresh_from_db()
+    assert sorted(r["status"] for r in batch.results) == [
+        "insufficient_credits",
+        "not_found",
+    ]
+    assert batch.credits_used == 0
+    seat.refresh_from_db()
+    assert seat.credits == 10
+
+
+@patch("whoweb.core.router.Router.profile_lookup")
+def test_enrich_batch_charged_once_when_complete(
+    lookup_mock, search_results, clear_cache, run_on_commit
+):
+    lookup_mock.side_effect = [
+        {"results": search_results[:1]},
+        {"results": search_results[1:2]},
+    ]
+    seat = BillingAccountMemberFactory(seat_credits=10000)
+    batch = BatchProfileActionResult.objects.create(
+        billing_seat=seat, initiated_by=seat.user, size=2, pending_count=2
+    )
+
+    batch.enrich_profiles([{"profile_id": "wp:1"}])
+    seat.refresh_from_db()
+    assert seat.credits == 10000
+    assert seat.transactions.count() == 0
+
+    batch.enrich_profiles([{"profile_id": "wp:2"}])
+    batch.refresh_from_db()
+    assert batch.status == BatchProfileActionResult.BatchStatusOptions.COMPLETE
+    assert batch.credits_used == 50
+    seat.refresh_from_db()
+    assert seat.credits == 9950
+    assert seat.transactions.count() == 1
@@ -0,0 +1,45 @@
+import json
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from whoweb.search.loadtest.benchmarks import compare
+
+
+def test_compare_flags_regressions():
+    baseline = {
+        "a": {"ops_per_sec": 100.0, "peak_bytes": 1000},
+        "b": {"ops_per_sec": 100.0, "peak_bytes": 1000},
+    }
+    results = {
+        "a": {"ops_per_sec": 95.0, "peak_bytes": 1050},
+        "b": {"ops_per_sec": 80.0, "peak_bytes": 1000},
+        "c": {"ops_per_sec": 1.0, "peak_bytes": 1},
+    }
+    changes = compare(results, baseline, threshold=0.1)
+    assert not changes["a"]["regressed"]
+    assert changes["b"]["regressed"]
+    assert changes["b"]["ops_per_sec"] == pytest.approx(-0.2)
+    assert "c" not in changes
+
+
+def test_benchmark_command_saves_and_compares(tmpdir):
+    path = tmpdir.join("baseline.json").strpath
+    call_command(
+        "benchmark_search_models", "obscured_int_decode", min_time=0.01, save=path
+    )
+    with open(path) as f:
+        baseline = json.load(f)
+    assert set(baseline) == {"obscured_int_decode"}
+    assert baseline["obscured_int_decode"]["ops_per_sec"] > 0
+
+    baseline["obscured_int_decode"]["ops_per_sec"] *= 1000
+    with open(path, "w") as f:
+        json.dump(baseline, f)
+    with pytest.raises(CommandError, match="obscured_int_decode"):
+        call_command(
+            "benchmark_search_models",
+            "obscured_int_decode",
+            min_time=0.01,
+            compare=path,
+        )
@@ -1,14 +1,23 @@
+import csv
+import json
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
+from io import StringIO
 from unittest.mock import patch, Mock, PropertyMock
 from uuid import uuid4
 
 import pytest
+from django.db import DatabaseError
+from django.urls import reverse
+from django.utils import timezone
 from pytest_cases import fixture_ref, parametrize_plus
 
 from whoweb.payments.tests.factories import BillingAccountMemberFactory
-from whoweb.search.models import SearchExport
-from whoweb.search.tests.factories import SearchExportFactory
+from whoweb.search.models import SearchExport, ResultProfile
+from whoweb.search.models.export import SearchExportPage, read_byte_range
+from whoweb.search.tasks import archive_finished_exports
+from whoweb.search.tests.fixtures import done
+from whoweb.search.tests.factories import SearchExportFactory, SearchExportPageFactory
 
 pytestmark = pytest.mark.django_db
 
@@ -310,6 +319,10 @@ def test_upload_to_static_bucket(_):
         export.csv.url
         == f"https://storage.googleapis.com/test/media/exports/{export.uuid.hex}/download/whoknows_search_results_2020-04-13.csv"
     )
+    assert (
+        export.json_file.url
+        == f"https://storage.googleapis.com/test/media/exports/{export.uuid.hex}/download/whoknows_search_results_2020-04-13.json"
+    )
     assert export.rows_uploaded == 1005
 
 
@@ -325,9 +338,25 @@ def test_upload_to_static_bucket_for_coldemail_system(_):
         export.csv.url
         == f"https://storage.googleapis.com/test/media/exports/{export.uuid.hex}/download/{export.uuid.hex}__fetch.csv"
     )
+    assert (
+        export.json_file.url
+        == f"https://storage.googleapis.com/test/media/exports/{export.uuid.hex}/download/{export.uuid.hex}__fetch.json"
+    )
     assert export.rows_uploaded == 1005
 
 
+def test_upload_json_to_static_bucket():
+    export: SearchExport = SearchExportFactory(json_file=None)
+    SearchExportPageFactory.create_batch(2, export=export)
+    export.upload_json_to_static_bucket()
+    with export.json_file.open("rb") as f:
+        content = f.read().decode("utf-8")
+    assert content == "".join(export.generate_json_content())
+    results = json.loads(content)["results"]
+    assert len(results) == 2 * len(done)
+    assert results[0]["profile_id"] == ResultProfile(**done[0]).id
+
+
 def test_get_validation_status(requests_mock):
     LIST_ID = "1"
     export: SearchExport = SearchExportFactory(validation_list_id=LIST_ID)
@@ -446,3 +475,262 @@ def test_get_absolute_url():
         export.get_absolute_url()
         == f"https://storage.googleapis.com/test/media/exports/{str(export.uuid.hex)}/download/whoknows_search_results_2020-04-13.csv"
     )
+
+
+def test_get_absolute_url_json():
+    export: SearchExport = SearchExportFactory(
+        status=SearchExport.ExportStatusOptions.COMPLETE
+    )
+    assert export.get_absolute_url("json") == reverse(
+        "search:download_export", kwargs={"uuid": export.uuid, "filetype": "json"}
+    )
+    export.json_file.name = (
+        f"exports/{export.uuid.hex}/download/whoknows_search_results_2020-04-13.json"
+    )
+    assert (
+        export.get_absolute_url("json")
+        == f"https://storage.googleapis.com/test/media/exports/{str(export.uuid.hex)}/download/whoknows_search_results_2020-04-13.json"
+    )
+
+
+def test_get_raw_rows_spanning_pages():
+    export: SearchExport = SearchExportFactory()
+    for page_num in range(3):
+        SearchExportPageFactory(
+            export=export, page_num=page_num, data=done, count=len(done)
+        )
+    total, rows = export.get_raw_rows(offset=3, limit=6)
+    assert total == 3 * len(done)
+    assert rows == (done * 3)[3:9]
+    assert export.get_raw_rows(offset=10)[1] == (done * 3)[10:]
+    assert export.get_raw_rows(offset=12, limit=5)[1] == []
+    assert export.row_index is None
+
+
+def test_row_index_kept_once_pages_complete():
+    export: SearchExport = SearchExportFactory(
+        status=SearchExport.ExportStatusOptions.COMPLETE
+    )
+    SearchExportPageFactory(export=export, page_num=0, data=done, count=len(done))
+    SearchExportPageFactory(export=export, page_num=2, data=done, count=len(done))
+    SearchExportPageFactory(export=export, page_num=1, data=None)
+    export.get_row_index()
+    export.refresh_from_db()
+    assert export.row_index == {"pages": [0, 2], "offsets": [0, 4, 8]}
+
+
+def test_compose_csv_parts_matches_single_file(query_no_contact):
+    export: SearchExport = SearchExportFactory(
+        query=query_no_contact, target=10, csv=None
+    )
+    for page_num in range(3):
+        SearchExportPageFactory(
+            export=export, page_num=page_num, data=done, count=len(done)
+        )
+    buffer = StringIO()
+    csv.writer(buffer).writerows(export.generate_csv_rows())
+    json_content = "".join(export.generate_json_content())
+    parts = [export.write_csv_part(part_num=i, page_nums=[i]) for i in range(3)]
+    assert [part[1] for part in parts] == [4, 4, 4]
+    assert [part[3] for part in parts] == [4, 4, 4]
+
+    export.compose_csv_parts(parts=parts)
+    export.refresh_from_db()
+    with export.csv.open("rb") as f:
+        assert f.read().decode("utf-8") == buffer.getvalue()
+    with export.json_file.open("rb") as f:
+        assert f.read().decode("utf-8") == json_content
+    assert export.rows_uploaded == 10
+    assert export.status == SearchExport.ExportStatusOptions.COMPLETE
+    assert not any(
+        export.csv.storage.exists(name) for part in parts for name in part[::2]
+    )
+
+
+def test_page_cursor_round_trip():
+    cursor = SearchExport.encode_page_cursor([0, 3, 17])
+    assert SearchExport.decode_page_cursor(cursor) == ({0, 3, 17}, None)
+    cursor = SearchExport.encode_page_cursor([], resume=(4, 2))
+    assert SearchExport.decode_page_cursor(cursor) == (set(), (4, 2))
+    with pytest.raises(ValueError):
+        SearchExport.decode_page_cursor("not a cursor")
+
+
+def test_get_partial_results_resumes_from_cursor():
+    export: SearchExport = SearchExportFactory(
+        status=SearchExport.ExportStatusOptions.PAGES_WORKING
+    )
+    SearchExportPageFactory(export=export, page_num=0, data=None)
+    SearchExportPageFactory(export=export, page_num=1, data=done[:2])
+
+    rows, cursor, is_done = export.get_partial_results()
+    assert list(rows) == done[:2]
+    assert not is_done
+
+    SearchExportPage.objects.filter(export=export, page_num=0).update(data=done[2:])
+    rows, cursor, is_done = export.get_partial_results(cursor=cursor)
+    assert list(rows) == done[2:]
+
+    rows, _, _ = export.get_partial_results(cursor=cursor)
+    assert list(rows) == []
+
+
+def test_get_partial_results_limit_resumes_after_last_row():
+    export: SearchExport = SearchExportFactory(
+        status=SearchExport.ExportStatusOptions.PAGES_WORKING
+    )
+    SearchExportPageFactory(export=export, page_num=0, data=None)
+    SearchExportPageFactory(export=export, page_num=1, data=done[:3])
+    SearchExportPageFactory(export=export, page_num=2, data=None)
+
+    rows, cursor, _ = export.get_partial_results(limit=2)
+    assert rows == done[:2]
+
+    SearchExportPage.objects.filter(export=export, page_num=0).update(data=done[3:])
+    rows, cursor, _ = export.get_partial_results(cursor=cursor, limit=1)
+    assert rows == done[3:4]
+    rows, cursor, is_done = export.get_partial_results(cursor=cursor, limit=5)
+    assert rows == done[2:3]
+    assert not is_done
+
+    SearchExportPage.objects.filter(export=export, page_num=2).update(data=done[:1])
+    export.status = SearchExport.ExportStatusOptions.PAGES_COMPLETE
+    rows, cursor, is_done = export.get_partial_results(cursor=cursor, limit=1)
+    assert rows == done[:1]
+    assert is_done
+
+
+def test_admin_changelist_sorts_on_page_stats(su, client):
+    client.force_login(su, backend="django.contrib.auth.backends.ModelBackend")
+    busy, idle = SearchExportFactory(), SearchExportFactory()
+    SearchExportPageFactory(export=busy, pending_count=7)
+    SearchExport.refresh_page_stats(busy.pk)
+    url = reverse("admin:search_searchexport_changelist")
+
+    resp = client.get(url, {"o": "-5"})  # rows_enqueued, descending
+    assert resp.status_code == 200
+    assert [e.pk for e in resp.context["cl"].result_list] == [busy.pk, idle.pk]
+
+    resp = client.get(url, {"o": "6"})  # latest page update, nulls last
+    assert [e.pk for e in resp.context["cl"].result_list] == [busy.pk, idle.pk]
+
+
+def archivable_export(num_pages=3, **kwargs):
+    export: SearchExport = SearchExportFactory(
+        status=SearchExport.ExportStatusOptions.COMPLETE, **kwargs
+    )
+    for page_num in range(num_pages):
+        rows = [dict(row, first_name=f"{page_num}-{i}") for i, row in enumerate(done)]
+        SearchExportPageFactory(
+            export=export, page_num=page_num, data=rows, count=len(rows)
+        )
+    return export
+
+
+def test_archive_pages_keeps_reads_unchanged(media_storage):
+    export = archivable_export(num_pages=5)
+    raw = list(export.get_raw())
+    rows_window = export.get_raw_rows(offset=5, limit=9)
+
+    assert export.archive_pages() == 5
+    export.refresh_from_db()
+    assert not export.pages.filter(data__isnull=False).exists()
+    assert export.pages.finished().count() == 5
+    assert sorted(export.page_archive_manifest, key=int) == ["0", "1", "2", "3", "4"]
+
+    with patch.object(SearchExport, "ARCHIVE_PAGES_PER_READ", 2), patch(
+        "whoweb.search.models.export.read_byte_range", wraps=read_byte_range,
+    ) as read_mock:
+        assert list(export.get_raw()) == raw
+    assert read_mock.call_count == 3
+    assert export.get_raw_rows(offset=5, limit=9) == rows_window
+    rows, cursor, is_done = export.get_partial_results()
+    assert list(rows) == raw
+    assert export.archive_pages() == 0
+
+
+def test_archived_page_rows_written_back_take_precedence(media_storage):
+    export = archivable_export()
+    export.archive_pages()
+    export.refresh_from_db()
+    page = export.pages.get(page_num=1)
+    page.data = done[:1]
+    page.save()
+
+    assert [data for page, data in export.get_raw_by_page()][1] == done[:1]
+    assert len(list(export.get_raw())) == 2 * len(done) + 1
+
+
+def test_archive_skips_pages_written_during_upload(media_storage):
+    export = archivable_export()
+    index = export.build_row_index()
+
+    def write_back():
+        page = export.pages.get(page_num=1)
+        page.data = done[:1]
+        page.save()
+        return index
+
+    with patch.object(SearchExport, "get_row_index", side_effect=write_back):
+        assert export.archive_pages() == 2
+    export.refresh_from_db()
+    assert sorted(export.page_archive_manifest, key=int) == ["0", "2"]
+    assert export.pages.get(page_num=1).data == done[:1]
+    assert len(list(export.get_raw())) == 2 * len(done) + 1
+
+
+def test_archive_discards_unused_upload(media_storage, settings):
+    export = archivable_export()
+    with patch.object(SearchExport, "locked", side_effect=DatabaseError):
+        with pytest.raises(DatabaseError):
+            export.archive_pages()
+    archive_dir = os.path.join(settings.MEDIA_ROOT, "exports", export.uuid.hex, "archive")
+    assert not os.path.exists(archive_dir) or not os.listdir(archive_dir)
+    export.refresh_from_db()
+    assert not export.page_archive
+    assert export.pages.filter(data__isnull=False).count() == 3
+
+
+def test_archive_only_completed_exports(media_storage):
+    export = archivable_export()
+    SearchExport.objects.filter(pk=export.pk).update(
+        status=SearchExport.ExportStatusOptions.PAGES_COMPLETE
+    )
+    assert export.archive_pages() == 0
+    assert export.pages.filter(data__isnull=False).count() == 3
+
+
+@patch("whoweb.search.tasks.archive_export_pages.delay")
+def test_archive_finished_exports_picks_old_exports(archive_mock, media_storage):
+    old = archivable_export(csv="exports/old.csv")
+    archivable_export(csv="exports/recent.csv")
+    archivable_export(csv=None)
+    SearchExport.objects.filter(pk=old.pk).update(
+        status_changed=timezone.now() - timedelta(days=30)
+    )
+    assert archive_finished_exports() == 1
+    archive_mock.assert_called_once_with(export_id=old.pk)
+
+
+def test_csv_parts_joined_once_none_pending(query_no_contact):
+    export: SearchExport = SearchExportFactory(
+        query=query_no_contact, target=100, csv=None
+    )
+    for page_num in range(3):
+        SearchExportPageFactory(
+            export=export, page_num=page_num, data=done, count=len(done)
+        )
+    with patch.object(SearchExport, "PAGES_PER_CSV_PART", new=1):
+        assert len(export.start_csv_parts()) == 3
+    written = [export.write_csv_part(part_num=i, page_nums=[i]) for i in range(3)]
+    assert export.record_csv_part(2, *written[2]) == 2
+    assert export.record_csv_part(0, *written[0]) == 1
+    assert export.written_csv_parts() is None
+
+    retried = export.write_csv_part(part_num=0, page_nums=[0])
+    assert export.record_csv_part(0, *retried) == 1
+    assert not export.csv.storage.exists(retried[0])
+    assert not export.json_file.storage.exists(retried[2])
+
+    assert export.record_csv_part(1, *written[1]) == 0
+    assert export.written_csv_parts() == written
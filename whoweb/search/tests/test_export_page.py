@@ -3,11 +3,12 @@ from unittest.mock import patch
 
 import pytest
 from celery import chord
+from django.core.cache import cache
 from celery.canvas import Signature
 
 from whoweb.search.models import SearchExport, ResultProfile
 from whoweb.search.models.export import SearchExportPage
-from whoweb.search.models.profile import VALIDATED
+from whoweb.search.models.profile import PROFILE_SCHEMA_VERSION, VALIDATED
 from whoweb.search.tests.factories import (
     SearchExportFactory,
     SearchExportPageFactory,
@@ -105,9 +106,19 @@ def test_page_process_no_derive(
     page: SearchExportPage = SearchExportPageFactory(export=export, data=None)
 
     assert page.data is None
-    assert page.populate_data_directly() > 0  # data direct
+    with patch.object(SearchExport, "push_to_webhooks") as push_mock:
+        assert page.populate_data_directly() > 0  # data direct
     page.refresh_from_db()
     assert page.data is not None
+    push_mock.assert_called_once()
+    assert len(push_mock.call_args[0][0]) == page.count
+    assert push_mock.call_args[1]["page_num"] == page.page_num
+    assert {row["schema_version"] for row in page.data} == {PROFILE_SCHEMA_VERSION}
+    with patch.object(ResultProfile, "__init__", side_effect=AssertionError):
+        trusted = [ResultProfile.from_trusted(row) for row in page.data]
+    assert [p.profile_id for p in trusted] == [
+        p.profile_id for p in search_result_profiles
+    ]
     export.refresh_from_db(fields=("progress_counter",))
     assert export.progress_counter == len(search_result_profiles)
 
@@ -287,3 +298,83 @@ def test_save_profiles(result_profile_derived, result_profile_derived_another):
     SearchExportPage.save_profile(page.pk, result_profile_derived)
     SearchExportPage.save_profile(page.pk, result_profile_derived_another)
     assert page.working_rows.count() == 2
+
+
+@patch("whoweb.search.tasks.finalize_page.delay")
+def test_save_profiles_counts_down_to_finalize(
+    finalize_mock, result_profile_derived, result_profile_derived_another
+):
+    page: SearchExportPage = SearchExportPageFactory(
+        data=None, status=SearchExportPage.PageStatusOptions.WORKING, pending_count=3
+    )
+    SearchExport.refresh_page_stats(page.export_id)
+    cache.delete(f"export-page-stats-{page.export_id}")
+    SearchExportPage.save_profile(page.pk, result_profile_derived)
+    SearchExportPage.save_profile(page.pk, result_profile_derived)
+    assert finalize_mock.call_count == 0
+
+    SearchExportPage.save_profile(page.pk, result_profile_derived_another)
+    page.refresh_from_db()
+    assert page.pending_count == 0
+    assert page.progress_counter == 2
+    assert finalize_mock.call_count == 1
+    export = SearchExport.objects.get(pk=page.export_id)
+    # Refreshed by the first count down, then not again within the interval.
+    assert export.rows_enqueued == 2
+    assert export.working_count == 1
+
+    SearchExport.refresh_page_stats(page.export_id)
+    export.refresh_from_db()
+    assert export.working_count == 2
+    assert export.rows_enqueued == 0
+    assert export.latest_page_modified == page.modified
+
+
+@patch("whoweb.search.tasks.finalize_page.delay")
+def test_count_down_ignores_finished_pages(finalize_mock):
+    complete = SearchExportPageFactory(
+        data=None, status=SearchExportPage.PageStatusOptions.COMPLETE, pending_count=1
+    )
+    drained = SearchExportPageFactory(
+        data=None, status=SearchExportPage.PageStatusOptions.WORKING, pending_count=0
+    )
+    assert SearchExportPage.count_down(complete.pk, saved=True) is None
+    assert SearchExportPage.count_down(drained.pk, saved=True) is None
+    complete.refresh_from_db()
+    drained.refresh_from_db()
+    assert complete.pending_count == 1
+    assert drained.pending_count == 0
+    assert drained.progress_counter == 0
+    assert finalize_mock.call_count == 0
+
+
+def test_page_stats_follow_pages():
+    export = SearchExportFactory()
+    SearchExportPageFactory(export=export, progress_counter=5, pending_count=2)
+    last = SearchExportPageFactory(export=export, progress_counter=3)
+    SearchExport.refresh_page_stats(export.pk)
+
+    export.status = SearchExport.ExportStatusOptions.PAGES_WORKING
+    export.save()  # a stale instance leaves the stats alone
+    export.refresh_from_db()
+    assert export.working_count == 8
+    assert export.rows_enqueued == 2
+    assert export.latest_page_modified == last.modified
+    assert export.status == SearchExport.ExportStatusOptions.PAGES_WORKING
+
+
+def test_full_save_keeps_updated_fields():
+    export = SearchExportFactory()
+    stale = SearchExport.objects.get(pk=export.pk)
+    SearchExport.objects.filter(pk=export.pk).update(
+        row_index={"pages": [0], "offsets": [0, 4]},
+        csv_parts={"pending": 1, "parts": {}},
+        page_archive="exports/archive/pages.bin",
+        page_archive_manifest={"0": [0, 10]},
+    )
+    stale.save()
+    export.refresh_from_db()
+    assert export.row_index == {"pages": [0], "offsets": [0, 4]}
+    assert export.csv_parts == {"pending": 1, "parts": {}}
+    assert export.page_archive.name == "exports/archive/pages.bin"
+    assert export.page_archive_manifest == {"0": [0, 10]}
@@ -1,18 +1,36 @@
-from unittest.mock import patch, PropertyMock
+import json
+from datetime import timedelta
+from unittest.mock import Mock, patch, PropertyMock
 
 import pytest
 from celery import group, shared_task
+from requests import ConnectionError
+from django.utils import timezone
 
+from whoweb.core.exceptions import ServiceOverloaded
 from whoweb.search.models import SearchExport
+from whoweb.search.models.export import SearchExportPage
+from whoweb.search.models.profile import FAILED
 from whoweb.search.tasks import (
     generate_pages,
     fetch_mx_domains,
+    upload_to_static_bucket,
+    sweep_stale_pages,
+    process_derivation,
+    process_derivation_fast,
 )
 from whoweb.search.tests.factories import SearchExportFactory, SearchExportPageFactory
+from whoweb.search.tests.fixtures import done
 
 pytestmark = pytest.mark.django_db
 
 
+@pytest.fixture(autouse=True, params=[False, True], ids=["direct", "fair_share"])
+def fair_share_scheduling(request, settings):
+    # Production schedules pages fair-share; the test settings default to direct.
+    settings.EXPORT_FAIR_SHARE_SCHEDULING = request.param
+
+
 @patch("whoweb.search.models.SearchExport.generate_pages")
 def test_generate_pages_task(
     pages_mock, query_contact_invites_defer_validation, settings
@@ -30,9 +48,10 @@ def test_generate_pages_task(
 
 
 @shared_task(bind=True, max_retries=1, default_retry_delay=0.01)
-def dummy_derive_task(self, i):
+def dummy_derive_task(self, page_pk, i):
     # if i % 4 == 0:
     #     self.retry()
+    SearchExportPage.count_down(page_pk, saved=True)
     return i
 
 
@@ -59,8 +78,13 @@ def err_task():
 @patch("whoweb.search.models.SearchExport.do_post_validation_completion")
 @patch("whoweb.search.models.SearchExport.get_validation_status")
 @patch("whoweb.search.models.SearchExport.upload_validation")
-@patch("whoweb.search.models.export.SearchExportPage.do_post_derive_process")
-@patch("whoweb.search.models.export.SearchExportPage.get_derivation_tasks")
+@patch(
+    "whoweb.search.models.export.SearchExportPage.do_post_derive_process",
+    autospec=True,
+)
+@patch(
+    "whoweb.search.models.export.SearchExportPage.get_derivation_tasks", autospec=True
+)
 @patch("whoweb.search.models.SearchExport.generate_pages")
 def test_integration_all_processing_tasks(
     gen_pages_mock,
@@ -75,7 +99,9 @@ def test_integration_all_processing_tasks(
     mx_object_mock,
     static_bucket_mock,
     query_contact_invites_defer_validation,
+    settings,
 ):
+    settings.CELERY_TASK_ALWAYS_EAGER = True
     export: SearchExport = SearchExportFactory(
         query=query_contact_invites_defer_validation, charge=True, notify=True
     )
@@ -85,8 +111,13 @@ def test_integration_all_processing_tasks(
         5, export=export, data=None
     )
 
-    get_derivation_tasks_mock.return_value = list(
-        dummy_derive_task.si(i) for i in range(0, 2)
+    get_derivation_tasks_mock.side_effect = lambda page: [
+        dummy_derive_task.si(page.pk, i) for i in range(0, 2)
+    ]
+    post_derive_mock.side_effect = lambda page, **kwargs: SearchExportPage.objects.filter(
+        pk=page.pk
+    ).update(
+        status=SearchExportPage.PageStatusOptions.COMPLETE
     )
     get_mx_task_group_mock.return_value = group(
         fetch_mx_domains.si(range(0, 2)) for i in range(0, 5)
@@ -103,3 +134,84 @@ def test_integration_all_processing_tasks(
     assert do_post_valid_mock.call_count == 1
     assert notify_mock.call_count == 1
     assert static_bucket_mock.call_count == 1
+
+
+@patch("whoweb.search.models.SearchExport.PAGES_PER_CSV_PART", new=2)
+def test_upload_to_static_bucket_in_parts(settings, query_no_contact):
+    settings.CELERY_TASK_ALWAYS_EAGER = True
+    export: SearchExport = SearchExportFactory(
+        query=query_no_contact, target=100, csv=None
+    )
+    for page_num in range(5):
+        SearchExportPageFactory(
+            export=export, page_num=page_num, data=done, count=len(done)
+        )
+    upload_to_static_bucket.si(export.pk).apply()
+    export.refresh_from_db()
+    assert export.rows_uploaded == 5 * len(done)
+    with export.csv.open("rb") as f:
+        lines = f.read().decode("utf-8").splitlines()
+    assert len(lines) == 1 + 5 * len(done)
+    assert lines[0].startswith("Profile ID,First Name")
+    with export.json_file.open("rb") as f:
+        assert len(json.load(f)["results"]) == 5 * len(done)
+
+
+def test_sweep_stale_pages(settings):
+    settings.CELERY_TASK_ALWAYS_EAGER = True
+    working = SearchExportPage.PageStatusOptions.WORKING
+    stale, fresh = SearchExportPageFactory.create_batch(
+        2, data=None, status=working, pending_count=2
+    )
+    SearchExportPage.objects.filter(pk=stale.pk).update(
+        modified=timezone.now() - timedelta(seconds=settings.EXPORT_STALE_PAGE_TIMEOUT)
+    )
+
+    assert sweep_stale_pages.si().apply().get() == 1
+    stale.refresh_from_db()
+    fresh.refresh_from_db()
+    assert stale.status == SearchExportPage.PageStatusOptions.COMPLETE
+    assert stale.data == []
+    assert fresh.status == working
+
+
+@patch("whoweb.search.models.ResultProfile.derive_contact")
+def test_derivation_deferred_when_service_overloaded(derive_mock, search_results):
+    derive_mock.side_effect = ServiceOverloaded(retry_after=30)
+    task = Mock()
+    task.request.is_eager = False
+    task.request.retries = 1
+    assert (
+        process_derivation(
+            task, "page", search_results[0], [], False, False, filters=["work"]
+        )
+        is None
+    )
+    task.retry.assert_not_called()
+    _, options = task.apply_async.call_args
+    assert options["retries"] == 1
+    assert options["countdown"] >= 30
+
+
+@patch("whoweb.search.models.ResultProfile.derive_contact")
+def test_page_finalized_when_derivation_exhausts_retries(
+    derive_mock, search_results, settings
+):
+    settings.CELERY_TASK_ALWAYS_EAGER = True
+    derive_mock.side_effect = ConnectionError
+    page = SearchExportPageFactory(
+        data=None, status=SearchExportPage.PageStatusOptions.WORKING, pending_count=2
+    )
+    args = (page.pk, search_results[0], [], False, False, ["work"])
+
+    process_derivation_fast.si(*args).apply()
+    page.refresh_from_db()
+    assert derive_mock.call_count == 4
+    assert page.pending_count == 1
+
+    derive_mock.side_effect = None
+    derive_mock.return_value = FAILED
+    process_derivation_fast.si(*args[:3], True, False, ["work"]).apply()
+    page.refresh_from_db()
+    assert page.pending_count == 0
+    assert page.status == SearchExportPage.PageStatusOptions.COMPLETE
@@ -0,0 +1,111 @@
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from whoweb.search.models import SearchExport
+from whoweb.search.loadtest.load import (
+    percentiles,
+    run_green_worker,
+    run_hedging,
+    run_load,
+    run_occupancy,
+    run_pod_concurrency,
+)
+from whoweb.search.loadtest.upstream_server import UpstreamStandIn
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+def test_percentiles():
+    assert percentiles([]) == {}
+    result = percentiles([float(n) for n in range(1, 101)])
+    assert result["count"] == 100
+    assert result["p50"] == 51.0
+    assert result["p99"] == 100.0
+    assert result["max"] == 100.0
+
+
+def test_run_load_completes_exports_against_stand_in():
+    stand_in = UpstreamStandIn(population=50, seed=1)
+    report = run_load(exports=2, concurrency=2, target=5, stand_in=stand_in)
+
+    assert report["completed"] == 2
+    assert report["errors"] == []
+    assert report["latency"]["count"] == 2
+    assert report["queries"] > 0
+    assert "whoweb.search.tasks.do_process_page" in report["stages"]
+    assert report["stages"]["whoweb.search.tasks.process_derivation_slow"]["count"]
+    assert report["upstream_requests"]["unified_search"] >= 2
+    assert report["upstream_requests"]["derive_email"] >= 10
+    assert not SearchExport.objects.exists()
+
+
+def test_load_command_reports_json():
+    out = StringIO()
+    call_command(
+        "export_load_test",
+        exports=1,
+        target=3,
+        derive=False,
+        population=10,
+        json=True,
+        stdout=out,
+    )
+    report = json.loads(out.getvalue())
+    assert report["mode"] == "eager"
+    assert report["completed"] == 1
+    assert "derive_email" not in report["upstream_requests"]
+
+
+def test_run_hedging_reports_both_runs(settings):
+    settings.HEDGE_BUDGET = 1
+    settings.HEDGE_PERCENTILE = 50
+    stand_in = UpstreamStandIn(population=20, slow_rate=0.2, slow_latency=0.3, seed=1)
+    report = run_hedging(calls=20, concurrency=2, stand_in=stand_in)
+
+    assert report["plain"]["count"] == report["hedged"]["count"] == 20
+    assert report["plain"]["hedged_requests"] == 0
+    assert report["hedged"]["hedged_requests"] > 0
+    assert report["p99_speedup"] > 0
+
+
+def test_run_occupancy_holds_connections_for_less_than_the_request():
+    stand_in = UpstreamStandIn(population=10, latency=0.1, hit_rate=1, seed=1)
+    report = run_occupancy(requests=4, concurrency=2, stand_in=stand_in)
+
+    assert report["request_transaction"]["statuses"] == {201: 4}
+    assert report["endpoint"]["statuses"] == {201: 4}
+    assert (
+        report["endpoint"]["connection_seconds_per_request"]
+        < report["request_transaction"]["connection_seconds_per_request"]
+    )
+    assert stand_in.requests["derive_email"] == 8
+
+
+def test_run_pod_concurrency_serves_calls_at_once_on_gevent():
+    pytest.importorskip("gunicorn")
+    stand_in = UpstreamStandIn(population=10, latency=0.2, hit_rate=1, seed=1)
+    report = run_pod_concurrency(
+        calls=6, concurrency=6, workers=1, endpoint="enrich", stand_in=stand_in
+    )
+
+    assert report["sync"]["statuses"] == report["gevent"]["statuses"] == {201: 6}
+    assert report["sync"]["peak_upstream_calls"] == 1
+    assert report["gevent"]["peak_upstream_calls"] > 1
+
+
+def test_run_green_worker_bounds_database_connections():
+    stand_in = UpstreamStandIn(latency=0.2, hit_rate=1, seed=1)
+    report = run_green_worker(
+        tasks=12, concurrency=6, pool_size=2, stand_in=stand_in, timeout=60
+    )
+
+    assert report["plain"]["incomplete"] == report["pooled"]["incomplete"] == 0
+    assert report["pooled"]["peak_connections"] <= 2
+    assert report["pooled"]["peak_upstream_calls"] > 2
+    if report["pooled"]["connections_opened"] is not None:
+        assert report["pooled"]["connections_opened"] <= 2
+        assert report["plain"]["connections_opened"] > 2
+    assert stand_in.requests["derive_email"] == 24
@@ -1,10 +1,13 @@
+import json
 from typing import TYPE_CHECKING
 from unittest.mock import patch
 
 import pytest
+from django.core.serializers.json import DjangoJSONEncoder
 
 from whoweb.payments.tests.factories import BillingAccountMemberFactory
-from whoweb.search.models import ResultProfile, DerivedContact
+from whoweb.search.models import ResultProfile, DerivedContact, SearchExport
+from whoweb.search.models.profile import PROFILE_SCHEMA_VERSION
 
 
 def test_load_underived_profile(search_results):
@@ -42,3 +45,42 @@ def test_load_unload_derived_profile(raw_derived):
 
     assert result_profile.last_name == loaded.last_name
     assert once == loaded.dict()
+
+
+def stored(profile: ResultProfile) -> dict:
+    return json.loads(json.dumps(profile.dict(), cls=DjangoJSONEncoder))
+
+
+def test_from_trusted_matches_validated(search_results, raw_derived):
+    for raw in search_results + raw_derived:
+        data = stored(ResultProfile(**raw))
+        assert data["schema_version"] == PROFILE_SCHEMA_VERSION
+        assert ResultProfile.from_trusted(data).dict() == ResultProfile(**data).dict()
+
+
+def test_from_trusted_skips_validation(raw_derived):
+    data = stored(ResultProfile(**raw_derived[0]))
+    data["industry"] = None
+    assert ResultProfile.from_trusted(data).industry is None
+    assert ResultProfile(**data).industry == ""
+
+
+def test_from_trusted_validates_untagged_data(search_results):
+    data = dict(search_results[0], industry=None)
+    assert "schema_version" not in data
+    profile = ResultProfile.from_trusted(data)
+    assert profile.industry == ""
+    assert profile.schema_version == PROFILE_SCHEMA_VERSION
+
+
+def test_from_trusted_validates_outdated_data(raw_derived):
+    data = stored(ResultProfile(**raw_derived[0]))
+    data.update(schema_version=PROFILE_SCHEMA_VERSION - 1, industry=None)
+    profile = ResultProfile.from_trusted(data)
+    assert profile.industry == ""
+    assert profile.schema_version == PROFILE_SCHEMA_VERSION
+
+
+def test_schema_version_excluded_from_output(raw_derived):
+    profile = ResultProfile(**raw_derived[0])
+    assert "schema_version" not in profile.dict(exclude=SearchExport.PROFILE_EXCLUDES)
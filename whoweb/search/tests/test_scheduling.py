@@ -0,0 +1,125 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from django.utils import timezone
+
+from whoweb.payments.tests.factories import BillingAccountMemberFactory
+from whoweb.search.models import ExportPageScheduler
+from whoweb.search.models.export import SearchExportPage
+from whoweb.search.tasks import spawn_do_page_process_tasks
+from whoweb.search.tests.factories import SearchExportFactory, SearchExportPageFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def export_for_weight(query, weight, num_pages=6, minutes_ago=0):
+    seat = BillingAccountMemberFactory(
+        organization__plan__export_scheduling_weight=weight
+    )
+    export = SearchExportFactory(billing_seat=seat, query=query, target=100)
+    pages = SearchExportPageFactory.create_batch(num_pages, export=export, data=None)
+    ExportPageScheduler().schedule([page.pk for page in pages])
+    SearchExportPage.objects.filter(export=export).update(
+        scheduled_at=timezone.now() - timedelta(minutes=minutes_ago)
+    )
+    return export
+
+
+def test_allocate_by_weight():
+    now = timezone.now()
+    queues = {
+        1: {"queued": 10, "weight": 3, "oldest": now},
+        2: {"queued": 10, "weight": 1, "oldest": now - timedelta(minutes=1)},
+    }
+    assert ExportPageScheduler.allocate(8, queues, {}) == {1: 6, 2: 2}
+
+
+def test_allocate_counts_pages_in_flight():
+    now = timezone.now()
+    queues = {
+        1: {"queued": 10, "weight": 1, "oldest": now - timedelta(minutes=1)},
+        2: {"queued": 2, "weight": 1, "oldest": now},
+    }
+    assert ExportPageScheduler.allocate(4, queues, {1: 3}) == {2: 2, 1: 2}
+
+
+def test_release_shares_slots_across_accounts(query_no_contact):
+    heavy = export_for_weight(query_no_contact, weight=1, minutes_ago=10)
+    light = export_for_weight(query_no_contact, weight=2, num_pages=3)
+    scheduler = ExportPageScheduler(max_in_flight=3)
+
+    released = scheduler.release()
+
+    assert sorted(page.export_id for page in released) == sorted(
+        [heavy.pk, light.pk, light.pk]
+    )
+    assert all(page.released_at for page in released)
+    assert scheduler.release() == []
+
+    SearchExportPage.objects.filter(pk=released[0].pk).update(
+        status=SearchExportPage.PageStatusOptions.COMPLETE
+    )
+    assert len(scheduler.release()) == 1
+    assert scheduler.queued().count() == 9 - 4
+
+
+def test_pages_released_long_ago_stop_counting_in_flight(query_no_contact, settings):
+    settings.EXPORT_SCHEDULER_PAGE_TIMEOUT = 600
+    export_for_weight(query_no_contact, weight=1, num_pages=4)
+    scheduler = ExportPageScheduler(max_in_flight=2)
+    lost = scheduler.release()
+    assert scheduler.release() == []
+
+    SearchExportPage.objects.filter(pk__in=[page.pk for page in lost]).update(
+        released_at=timezone.now() - timedelta(seconds=601)
+    )
+    assert scheduler.in_flight().count() == 0
+    assert len(scheduler.release()) == 2
+
+
+def test_stats(query_no_contact):
+    export = export_for_weight(query_no_contact, weight=2, minutes_ago=5)
+    ExportPageScheduler(max_in_flight=2).release()
+
+    (stats,) = ExportPageScheduler().stats()
+
+    assert stats["organization"] == export.billing_seat.organization_id
+    assert stats["weight"] == 2
+    assert stats["queued"] == 4
+    assert stats["in_flight"] == 2
+    assert stats["oldest_wait"] >= 5 * 60
+    assert stats["recent_wait"] >= 5 * 60
+
+
+def test_stats_view(su_client, query_no_contact):
+    export = export_for_weight(query_no_contact, weight=1)
+    resp = su_client.get("/ww/api/export-scheduler/")
+    assert resp.status_code == 200
+    assert resp.json()[0]["organization"] == export.billing_seat.organization_id
+    assert resp.json()[0]["queued"] == 6
+
+
+def complete_page(page, task_context=None):
+    page.status = SearchExportPage.PageStatusOptions.COMPLETE
+    page.save()
+
+
+@patch.object(
+    SearchExportPage, "populate_data_directly", autospec=True, side_effect=complete_page
+)
+def test_spawn_through_scheduler(populate_mock, settings, query_no_contact):
+    settings.CELERY_TASK_ALWAYS_EAGER = True
+    settings.EXPORT_FAIR_SHARE_SCHEDULING = True
+    export = SearchExportFactory(query=query_no_contact, target=100)
+    SearchExportPageFactory.create_batch(3, export=export, data=None)
+
+    assert (
+        spawn_do_page_process_tasks.si(prefetch_multiplier=1, export_id=export.pk)
+        .apply()
+        .get()
+        == "Pages complete."
+    )
+    assert populate_mock.call_count == 3
+    assert not ExportPageScheduler.queued().exists()
+    assert all(page.released_at for page in export.pages.all())
@@ -1,13 +1,21 @@
+import json
+
 import pytest
 
 from collections import OrderedDict
 from unittest.mock import patch
 from string import Template
+from django.urls import resolve
 from graphql_relay import to_global_id
 
-from whoweb.search.models import DerivationCache
+from whoweb.search.models import DerivationCache, SearchExport
 from whoweb.payments.tests.factories import BillingAccountMemberFactory
-from whoweb.search.tests.factories import DerivationCacheRecordFactory
+from whoweb.search.tests.factories import (
+    DerivationCacheRecordFactory,
+    SearchExportFactory,
+    SearchExportPageFactory,
+)
+from whoweb.search.tests.fixtures import done
 
 pytestmark = pytest.mark.django_db
 
@@ -119,6 +127,34 @@ def test_derive_profile_only_id(
     assert resp.json()["credits_used"] == 100
 
 
+@pytest.mark.parametrize(
+    "path",
+    [
+        "/ww/api/profiles/derive/",
+        "/ww/api/profiles/enrich/",
+        "/ww/api/profiles/expand/",
+    ],
+)
+def test_profile_endpoints_run_outside_request_transaction(path):
+    assert "default" in resolve(path).func._non_atomic_requests
+
+
+@pytest.mark.parametrize(
+    "path", ["/ww/api/profiles/enrich/", "/ww/api/profiles/expand/"]
+)
+@patch("whoweb.search.serializers.ResultProfile.enrich")
+def test_profile_endpoints_charge_with_their_response(enrich_mock, path, su_client):
+    seat = BillingAccountMemberFactory(seat_credits=10000)
+    enrich_mock.return_value.dict.side_effect = ValueError
+    with pytest.raises(ValueError):
+        su_client.post(
+            path, {"profile_id": "wp:1", "billing_seat": seat.public_id}, format="json"
+        )
+    seat.refresh_from_db()
+    assert seat.credits == 10000
+    assert seat.transactions.count() == 0
+
+
 @patch("whoweb.core.router.Router.unified_search")
 @patch("whoweb.core.router.Router.profile_lookup")
 def test_enrich_profile(
@@ -180,3 +216,114 @@ def test_expand_contact_profile(
     assert resp.status_code == 201
     assert "industry" in resp.json()["profile"]
     assert resp.json()["credits_used"] == 25
+
+
+def test_export_results_row_pagination(su_client):
+    export = SearchExportFactory()
+    for page_num in range(3):
+        SearchExportPageFactory(
+            export=export, page_num=page_num, data=done, count=len(done)
+        )
+    resp = su_client.get(f"/ww/api/export-results/{export.uuid}/?offset=1&limit=5")
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["count"] == 12
+    assert [row["_id"] for row in body["results"]] == [
+        row["profile_id"] for row in (done * 3)[1:6]
+    ]
+    assert body["previous"] is not None
+
+    seen = []
+    url = f"/ww/api/export-results/{export.uuid}/?limit=5"
+    while url:
+        body = su_client.get(url).json()
+        seen += body["results"]
+        url = body["next"]
+    assert len(seen) == 12
+
+
+def test_export_results_invalid_cursor(su_client):
+    export = SearchExportFactory()
+    resp = su_client.get(f"/ww/api/export-results/{export.uuid}/?cursor=nope")
+    assert resp.status_code == 404
+
+
+def test_export_partial_results(su_client):
+    export = SearchExportFactory(status=SearchExport.ExportStatusOptions.PAGES_WORKING)
+    SearchExportPageFactory(export=export, page_num=0, data=done)
+    SearchExportPageFactory(export=export, page_num=1, data=None)
+    url = f"/ww/api/export-results/{export.uuid}/partial/"
+
+    resp = su_client.get(url)
+    assert resp.status_code == 200
+    body = json.loads(b"".join(resp.streaming_content))
+    assert body["done"] is False
+    assert [row["profile_id"] for row in body["results"]] == [
+        row["profile_id"] for row in done
+    ]
+
+    resp = su_client.get(url, {"cursor": body["cursor"]})
+    assert json.loads(b"".join(resp.streaming_content))["results"] == []
+    assert su_client.get(url, {"cursor": "nope"}).status_code == 404
+
+
+def test_export_partial_results_limit(su_client):
+    export = SearchExportFactory(status=SearchExport.ExportStatusOptions.PAGES_COMPLETE)
+    SearchExportPageFactory(export=export, page_num=0, data=done)
+    url = f"/ww/api/export-results/{export.uuid}/partial/"
+
+    resp = su_client.get(url, {"limit": 3})
+    body = json.loads(b"".join(resp.streaming_content))
+    assert body["done"] is False
+    assert len(body["results"]) == 3
+
+    resp = su_client.get(url, {"limit": 3, "cursor": body["cursor"]})
+    body = json.loads(b"".join(resp.streaming_content))
+    assert body["done"] is True
+    assert [row["profile_id"] for row in body["results"]] == [
+        row["profile_id"] for row in done[3:]
+    ]
+
+
+def test_export_partial_results_default_limit(su_client, monkeypatch):
+    monkeypatch.setattr(SearchExport, "PARTIAL_RESULTS_LIMIT", 2)
+    export = SearchExportFactory(status=SearchExport.ExportStatusOptions.PAGES_COMPLETE)
+    SearchExportPageFactory(export=export, page_num=0, data=done)
+    url = f"/ww/api/export-results/{export.uuid}/partial/"
+
+    body = json.loads(b"".join(su_client.get(url).streaming_content))
+    assert body["done"] is False
+    assert len(body["results"]) == 2
+
+    resp = su_client.get(url, {"limit": 100})
+    assert len(json.loads(b"".join(resp.streaming_content))["results"]) == 2
+
+
+def test_export_partial_results_graphql(gqlclient, context, su):
+    export = SearchExportFactory(status=SearchExport.ExportStatusOptions.COMPLETE)
+    SearchExportPageFactory(export=export, page_num=0, data=done)
+    gql = Template(
+        """
+    query {
+      searchExports(uuid:"$uuid"){
+        edges{
+          node{
+            partialResults{
+              cursor
+              done
+              profiles{
+                id
+              }
+            }
+          }
+        }
+      }
+    }
+    """
+    ).substitute(uuid=export.uuid)
+    context.user = su
+    executed = gqlclient.execute(gql, context=context)
+    partial = executed["data"]["searchExports"]["edges"][0]["node"]["partialResults"]
+    assert partial["done"] is True
+    assert partial["cursor"] == SearchExport.encode_page_cursor([0])
+    assert [p["id"] for p in partial["profiles"]] == [row["profile_id"] for row in done]
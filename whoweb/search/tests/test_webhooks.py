@@ -0,0 +1,134 @@
+import pytest
+
+from whoweb.search.models import SearchExport, ExportWebhookDelivery
+from whoweb.search.tasks import deliver_export_webhook
+from whoweb.search.tests.factories import SearchExportFactory
+from whoweb.search.tests.fixtures import done
+
+pytestmark = pytest.mark.django_db
+
+
+def webhook_export(query, *urls):
+    query["export"] = {"webhooks": list(urls), "title": "hooked"}
+    return SearchExportFactory(query=query)
+
+
+def test_push_to_webhooks_batches_rows(webhook_server, query_contact_invites, settings):
+    settings.CELERY_TASK_ALWAYS_EAGER = True
+    settings.WEBHOOK_BATCH_SIZE = 3
+    export: SearchExport = webhook_export(query_contact_invites, webhook_server.url)
+
+    deliveries = export.push_to_webhooks(done, page_num=7)
+
+    assert [d.size for d in deliveries] == [3, 1]
+    assert len(webhook_server.received) == 2
+    first = webhook_server.received[0]
+    assert first["headers"]["Content-Encoding"] == "gzip"
+    assert first["json"]["export"] == export.uuid.hex
+    assert first["json"]["page"] == 7
+    assert first["json"]["title"] == "hooked"
+    assert [row["profile_id"] for row in first["json"]["results"]] == [
+        row["profile_id"] for row in done[:3]
+    ]
+    for delivery in ExportWebhookDelivery.objects.all():
+        assert delivery.status == ExportWebhookDelivery.DeliveryStatusOptions.DELIVERED
+        assert delivery.response_status == 200
+        assert delivery.delivered_at is not None
+        assert delivery.body is None
+
+
+def test_push_to_webhooks_without_webhooks(query_contact_invites):
+    export: SearchExport = SearchExportFactory(query=query_contact_invites)
+    assert export.push_to_webhooks(done, page_num=0) == []
+    assert not ExportWebhookDelivery.objects.exists()
+
+
+def test_webhook_delivery_retries(webhook_server, query_contact_invites, settings):
+    settings.CELERY_TASK_ALWAYS_EAGER = True
+    webhook_server.fail_next(times=2)
+    export: SearchExport = webhook_export(query_contact_invites, webhook_server.url)
+
+    (delivery,) = export.push_to_webhooks(done, page_num=0)
+
+    delivery.refresh_from_db()
+    assert delivery.attempts == 3
+    assert delivery.status == ExportWebhookDelivery.DeliveryStatusOptions.DELIVERED
+    assert len(webhook_server.received) == 1
+
+
+def test_webhook_delivery_gives_up(webhook_server, query_contact_invites, settings):
+    settings.CELERY_TASK_ALWAYS_EAGER = True
+    settings.WEBHOOK_MAX_ATTEMPTS = 2
+    webhook_server.fail_next(times=5, status=500)
+    export: SearchExport = webhook_export(query_contact_invites, webhook_server.url)
+
+    (delivery,) = export.push_to_webhooks(done, page_num=0)
+
+    delivery.refresh_from_db()
+    assert delivery.attempts == 2
+    assert delivery.status == ExportWebhookDelivery.DeliveryStatusOptions.FAILED
+    assert delivery.response_status == 500
+    assert delivery.body is not None
+
+
+def test_webhook_delivery_waits_for_endpoint_slot(
+    webhook_server, query_contact_invites, settings, mocker
+):
+    settings.WEBHOOK_MAX_CONCURRENCY_PER_ENDPOINT = 1
+    export: SearchExport = webhook_export(query_contact_invites, webhook_server.url)
+    (delivery,) = ExportWebhookDelivery.create_for_rows(
+        export=export, urls=[webhook_server.url], rows=done, page_num=0
+    )
+    retry = mocker.patch.object(deliver_export_webhook, "retry", side_effect=Exception)
+    held = mocker.patch("whoweb.search.tasks.CacheSemaphore.acquire")
+    held.return_value = False
+
+    with pytest.raises(Exception):
+        deliver_export_webhook(delivery.pk)
+
+    assert retry.call_count == 1
+    assert webhook_server.received == []
+
+
+def test_webhook_deliveries_created_once(query_contact_invites, settings):
+    settings.WEBHOOK_BATCH_SIZE = 3
+    export: SearchExport = webhook_export(query_contact_invites, "https://a.example")
+    urls = ["https://a.example", "https://b.example"]
+    first = ExportWebhookDelivery.create_for_rows(
+        export=export, urls=urls[:1], rows=done, page_num=0
+    )
+    assert len(first) == 2
+
+    again = ExportWebhookDelivery.create_for_rows(
+        export=export, urls=urls, rows=done, page_num=0
+    )
+    assert {(d.url, d.batch) for d in again} == {(urls[1], 0), (urls[1], 1)}
+    assert ExportWebhookDelivery.objects.count() == 4
+
+
+def test_failed_attempt_after_a_delivery_saves_no_status(
+    webhook_server, query_contact_invites, settings
+):
+    settings.WEBHOOK_BATCH_SIZE = 3
+    export: SearchExport = webhook_export(query_contact_invites, webhook_server.url)
+    delivered, failing = ExportWebhookDelivery.create_for_rows(
+        export=export, urls=[webhook_server.url], rows=done, page_num=0
+    )
+    assert delivered.deliver()
+
+    ExportWebhookDelivery.objects.filter(pk=failing.pk).update(
+        status=ExportWebhookDelivery.DeliveryStatusOptions.FAILED
+    )
+    webhook_server.fail_next(status=500)
+    assert not failing.deliver()
+
+    failing.refresh_from_db()
+    assert failing.status == ExportWebhookDelivery.DeliveryStatusOptions.FAILED
+    assert failing.response_status == 500
+    assert failing.body is not None
+    assert ExportWebhookDelivery.ATTEMPT_FIELDS == [
+        "attempts",
+        "response_status",
+        "response_body",
+        "modified",
+    ]
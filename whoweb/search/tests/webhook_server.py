@@ -0,0 +1,58 @@
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class WebhookStandIn(object):
+    """
+    Local http server standing in for an integrator's webhook endpoint.
+    Records every delivery and can be told to fail the next few requests.
+    """
+
+    def __init__(self):
+        self.received = []
+        self.failures = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/hook"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def fail_next(self, times=1, status=503):
+        with self.lock:
+            self.failures += [status] * times
+
+    def _handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                with stand_in.lock:
+                    status = stand_in.failures.pop(0) if stand_in.failures else 200
+                    if status < 300:
+                        stand_in.received.append(
+                            {"headers": dict(self.headers), "json": json.loads(body)}
+                        )
+                self.send_response(status)
+                self.end_headers()
+                self.wfile.write(b"ok" if status < 300 else b"unavailable")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
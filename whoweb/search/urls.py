@@ -8,6 +8,9 @@ router.register(r"exports", views.SearchExportViewSet, basename="searchexport")
 router.register(
     r"export-results", views.SearchExportResultViewSet, basename="exportresult"
 )
+router.register(
+    r"export-scheduler", views.ExportSchedulerViewSet, basename="exportscheduler"
+)
 router.register(
     r"profiles/derive", views.DeriveProfileContactViewSet, basename="derive_profile"
 )
@@ -27,6 +30,9 @@ router.register(
     views.BatchEnrichProfileViewSet,
     basename="enrich_profile_batch",
 )
+router.register(
+    r"profiles/batch", views.BatchResultViewSet, basename="batch_result",
+)
 router.register(
     r"search/filter_value_list",
     views.FilterValueListViewSet,
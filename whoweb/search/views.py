@@ -1,14 +1,25 @@
 import itertools
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from urllib import parse
 
 import csv
+from django.db import transaction
 from django.http import StreamingHttpResponse, Http404, HttpResponseBadRequest
 from django.shortcuts import redirect
 from django.views.decorators.http import require_GET
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import mixins, viewsets
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    BasePagination,
+    PageNumberPagination,
+    _positive_int,
+)
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 from rest_framework.viewsets import GenericViewSet
 from rest_framework_extensions.mixins import NestedViewSetMixin
 
@@ -17,7 +28,8 @@ from whoweb.contrib.rest_framework.permissions import IsSuperUser, ObjectPermiss
 from whoweb.payments.permissions import MemberOfBillingAccountPermissionsFilter
 from whoweb.search.models import ResultProfile
 from .events import DOWNLOAD_VALIDATION, DOWNLOAD
-from .models import SearchExport, FilterValueList
+from .models import SearchExport, FilterValueList, ExportPageScheduler
+from .models.profile import BatchProfileActionResult
 from .serializers import (
     SearchExportSerializer,
     SearchExportDataSerializer,
@@ -65,26 +77,11 @@ def download(request, uuid, filetype="csv", *args, **kwargs):
         ] = f"attachment; filename=whoknows_search_results_{export.created.date()}.csv"
         return response
     elif filetype == "json":
-
-        def content():
-            rows = export.generate_json_rows()
-            yield '{"results":['
-            first = True
-            while True:
-                try:
-                    row = rows.__next__()
-                except StopIteration:
-                    yield "]}"
-                    break
-                else:
-                    if first:
-                        yield row
-                        first = False
-                    else:
-                        yield "," + row
-
+        if export.json_file and export.json_file.url:
+            return redirect(export.json_file.url)
         response = StreamingHttpResponse(
-            content(), content_type="application/json; charset=UTF-8"
+            export.generate_json_content(),
+            content_type="application/json; charset=UTF-8",
         )
         response[
             "Content-Disposition"
@@ -139,6 +136,94 @@ class ExportResultsSetPagination(PageNumberPagination):
     max_page_size = 100
 
 
+class ExportRowPagination(BasePagination):
+    """
+    Row level pagination over an export, by offset and limit or by an opaque cursor.
+    Uses the export's row index so only the pages covering the requested rows are read.
+    """
+
+    default_limit = 100
+    max_limit = 1000
+    limit_query_param = "limit"
+    offset_query_param = "offset"
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def is_requested(self, request):
+        return any(
+            param in request.query_params
+            for param in (
+                self.limit_query_param,
+                self.offset_query_param,
+                self.cursor_query_param,
+            )
+        )
+
+    def paginate_export(self, export, request):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.offset = self.get_offset(request)
+        self.count, rows = export.get_raw_rows(offset=self.offset, limit=self.limit)
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("count", self.count),
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_limit(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.limit_query_param],
+                strict=True,
+                cutoff=self.max_limit,
+            )
+        except (KeyError, ValueError):
+            return self.default_limit
+
+    def get_offset(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is not None:
+            return self.decode_cursor(encoded)
+        try:
+            return _positive_int(request.query_params[self.offset_query_param])
+        except (KeyError, ValueError):
+            return 0
+
+    def decode_cursor(self, encoded):
+        try:
+            querystring = b64decode(encoded.encode("ascii")).decode("ascii")
+            return _positive_int(parse.parse_qs(querystring)["o"][0])
+        except (TypeError, ValueError, KeyError, IndexError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, offset):
+        querystring = parse.urlencode({"o": offset}, doseq=True)
+        encoded = b64encode(querystring.encode("ascii")).decode("ascii")
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.offset_query_param
+        )
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if self.offset + self.limit >= self.count:
+            return None
+        return self.encode_cursor(self.offset + self.limit)
+
+    def get_previous_link(self):
+        if self.offset <= 0:
+            return None
+        return self.encode_cursor(max(self.offset - self.limit, 0))
+
+
 class SearchExportResultViewSet(mixins.RetrieveModelMixin, GenericViewSet):
     pagination_class = ExportResultsSetPagination
     serializer_class = SearchExportDataSerializer
@@ -150,14 +235,24 @@ class SearchExportResultViewSet(mixins.RetrieveModelMixin, GenericViewSet):
     )
 
     def retrieve(self, request, *args, **kwargs):
-        queryset = self.get_object().pages.filter(data__isnull=False)
+        export = self.get_object()
+        row_paginator = ExportRowPagination()
+        if row_paginator.is_requested(request):
+            rows = row_paginator.paginate_export(export, request)
+            serializer = self.get_serializer(
+                (ResultProfile.from_trusted(profile).dict() for profile in rows),
+                many=True,
+            )
+            return row_paginator.get_paginated_response(serializer.data)
+
+        queryset = export.pages.finished()
         qs_page = self.paginate_queryset(queryset)
         if qs_page is not None:
             serializer = self.get_serializer(
                 itertools.chain(
                     *[
-                        (ResultProfile(**profile).dict() for profile in page.data)
-                        for page in qs_page
+                        (ResultProfile.from_trusted(profile).dict() for profile in data)
+                        for page, data in export.iter_page_data(qs_page)
                     ]
                 ),
                 many=True,
@@ -167,16 +262,59 @@ class SearchExportResultViewSet(mixins.RetrieveModelMixin, GenericViewSet):
         serializer = self.get_serializer(
             itertools.chain(
                 *(
-                    (ResultProfile(**profile).dict() for profile in page.data)
-                    for page in queryset
+                    (ResultProfile.from_trusted(profile).dict() for profile in data)
+                    for page, data in export.iter_page_data(queryset)
                 )
             ),
             many=True,
         )
         return Response(serializer.data)
 
+    @action(detail=True, methods=["get"])
+    def partial(self, request, *args, **kwargs):
+        """
+        Stream rows of pages finalized so far, while the export is still running,
+        up to `limit` rows, at most PARTIAL_RESULTS_LIMIT. Pass the returned cursor
+        back to receive the rows after those.
+        """
+        export = self.get_object()
+        try:
+            limit = _positive_int(
+                request.query_params["limit"],
+                strict=True,
+                cutoff=SearchExport.PARTIAL_RESULTS_LIMIT,
+            )
+        except (KeyError, ValueError):
+            limit = SearchExport.PARTIAL_RESULTS_LIMIT
+        try:
+            rows, cursor, done = export.get_partial_results(
+                cursor=request.query_params.get("cursor"), limit=limit
+            )
+        except ValueError:
+            raise NotFound("Invalid cursor")
+        return StreamingHttpResponse(
+            export.generate_json_content(
+                rows=rows, envelope={"cursor": cursor, "done": done}
+            ),
+            content_type="application/json; charset=UTF-8",
+        )
+
+
+class NonAtomicRequestsMixin(object):
+    """
+    Runs the view outside the ATOMIC_REQUESTS transaction, for views that wait on
+    slow upstream calls and would hold a database connection meanwhile. They open
+    short transactions around their own writes instead.
+    """
+
+    @classmethod
+    def as_view(cls, *args, **kwargs):
+        return transaction.non_atomic_requests(super().as_view(*args, **kwargs))
 
-class DeriveProfileContactViewSet(mixins.CreateModelMixin, GenericViewSet):
+
+class DeriveProfileContactViewSet(
+    NonAtomicRequestsMixin, mixins.CreateModelMixin, GenericViewSet
+):
     serializer_class = DeriveContactSerializer
     permission_classes = [IsSuperUser]
 
@@ -186,12 +324,16 @@ class BatchDeriveProfileContactViewSet(mixins.CreateModelMixin, GenericViewSet):
     permission_classes = [IsSuperUser]
 
 
-class ExpandProfileViewSet(mixins.CreateModelMixin, GenericViewSet):
+class ExpandProfileViewSet(
+    NonAtomicRequestsMixin, mixins.CreateModelMixin, GenericViewSet
+):
     serializer_class = ProfileSerializer
     permission_classes = [IsSuperUser]
 
 
-class EnrichProfileViewSet(mixins.CreateModelMixin, GenericViewSet):
+class EnrichProfileViewSet(
+    NonAtomicRequestsMixin, mixins.CreateModelMixin, GenericViewSet
+):
     serializer_class = ProfileEnrichmentSerializer
     permission_classes = [IsSuperUser]
 
@@ -201,9 +343,25 @@ class BatchEnrichProfileViewSet(mixins.CreateModelMixin, GenericViewSet):
     permission_classes = [IsSuperUser]
 
 
+class ExportSchedulerViewSet(viewsets.ViewSet):
+    """Per billing account queue depth and wait times of the export page scheduler."""
+
+    permission_classes = [IsSuperUser]
+
+    def list(self, request):
+        return Response(ExportPageScheduler().stats())
+
+
 class BatchResultViewSet(mixins.RetrieveModelMixin, GenericViewSet):
+    queryset = BatchProfileActionResult.objects.all()
     serializer_class = BatchResultSerializer
-    permission_classes = []
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.user.is_superuser:
+            return queryset
+        return queryset.filter(billing_seat__user=self.request.user)
 
 
 class FilterValueListViewSet(viewsets.ModelViewSet):